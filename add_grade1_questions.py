@@ -8,11 +8,9 @@ def generate_grade1_math_questions():
     """生成小学一年级20以内加减法题目"""
     questions = []
     
-    # 生成25个加法题
-    for i in range(25):
-        # 确保两个数相加不超过20
-        a = random.randint(1, 19)
-        b = random.randint(1, 20 - a)
+    # 生成25个加法题（两个数相加不超过20，算式互不重复）
+    addition_pairs = [(a, b) for a in range(1, 20) for b in range(1, 21 - a)]
+    for a, b in random.sample(addition_pairs, 25):
         answer = a + b
         
         question = {
@@ -25,11 +23,9 @@ def generate_grade1_math_questions():
         }
         questions.append(question)
     
-    # 生成25个减法题
-    for i in range(25):
-        # 确保被减数在1-20之间，减数不大于被减数
-        a = random.randint(1, 20)
-        b = random.randint(1, a)
+    # 生成25个减法题（被减数在1-20之间，减数不大于被减数，算式互不重复）
+    subtraction_pairs = [(a, b) for a in range(1, 21) for b in range(1, a + 1)]
+    for a, b in random.sample(subtraction_pairs, 25):
         answer = a - b
         
         question = {
@@ -112,24 +108,26 @@ def main():
     print(f"- 减法题：25道") 
     print(f"- 应用题：5道")
     
-    # 批量添加到数据库
+    # 批量添加到数据库（单事务批量写入）
+    result = db.add_questions_bulk(all_questions)
+    failed = {error['index']: error for error in result['errors']}
     success_count = 0
+    skipped_count = 0
     for i, question in enumerate(all_questions, 1):
-        try:
-            question_id = db.add_question(
-                question['subject'],
-                question['difficulty'],
-                question['question'],
-                question['standard_answer'],
-                question['knowledge_points'],
-                question['created_by']
-            )
+        error = failed.get(i - 1)
+        if error is None:
             success_count += 1
             print(f"[{i:2d}/50] 已添加: {question['question']}")
-        except Exception as e:
-            print(f"[{i:2d}/50] 添加失败: {question['question']} - 错误: {e}")
+        elif 'duplicate_of' in error:
+            # 多次运行脚本时题库里已有相同的题目
+            skipped_count += 1
+            print(f"[{i:2d}/50] 已跳过: {question['question']} - {error['error']}")
+        else:
+            print(f"[{i:2d}/50] 添加失败: {question['question']} - 错误: {error['error']}")
     
     print(f"\n✅ 成功添加 {success_count} 道小学一年级数学题目到题库！")
+    if skipped_count:
+        print(f"跳过 {skipped_count} 道题库中已有的重复题目")
     print("现在可以让小学一年级的学生参加数学测试了。")
     
     # 显示一些示例题目
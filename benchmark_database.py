@@ -0,0 +1,106 @@
+"""
+数据库性能基准测试
+对比"每次操作新建连接"的旧实现与连接池实现的吞吐量（ops/sec）
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from database import DatabaseManager
+
+# 旧实现的锁等待时间：回滚日志模式下多线程写入会互相饿死，5 秒的等待偶尔不够，
+# 放宽等待时间保证每次都能完成全部操作，吞吐量才有可比性
+LEGACY_BUSY_TIMEOUT = 60.0
+
+class LegacyDatabaseManager(DatabaseManager):
+    """模拟旧实现：每次操作都新建连接、默认回滚日志模式，用完即关闭"""
+
+    def init_database(self):
+        super().init_database()
+        # 迁移使用的是连接池中的连接，关闭后才能切换回回滚日志模式
+        self.close()
+
+    @contextmanager
+    def connection(self):
+        conn = sqlite3.connect(self.db_path, timeout=LEGACY_BUSY_TIMEOUT)
+        conn.execute('PRAGMA journal_mode=DELETE')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            conn.close()
+
+def seed_questions(db: DatabaseManager, count: int = 50):
+    """准备测试题目"""
+    for i in range(count):
+        db.add_question('数学', '简单', f'{i} + 1 = ?', str(i + 1),
+                        ['20以内加法', '基础运算'], 'benchmark')
+
+def run_exam_workload(db: DatabaseManager, exams: int) -> int:
+    """模拟完整考试流程，返回执行的数据库操作次数"""
+    ops = 0
+    for i in range(exams):
+        student_id = db.create_student(f'学生{i}', '一年级')
+        exam_id = db.create_exam(student_id, '数学')
+        questions = db.get_questions_by_subject('数学', limit=5)
+        ops += 3
+        for q in questions:
+            db.save_answer(exam_id, q['id'], q['standard_answer'], 10, '回答正确', [])
+            ops += 1
+        db.complete_exam(exam_id, 50)
+        db.get_exam_results(exam_id)
+        ops += 2
+    return ops
+
+def benchmark(manager_class, label: str, threads: int = 1, exams_per_thread: int = 100) -> float:
+    """运行一次基准测试，返回 ops/sec"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = manager_class(os.path.join(tmp_dir, 'bench.db'))
+        seed_questions(db)
+
+        results = [0] * threads
+        errors = []
+
+        def worker(index: int):
+            try:
+                results[index] = run_exam_workload(db, exams_per_thread)
+            except Exception as e:
+                errors.append(e)
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - start
+        db.close()
+
+    if errors:
+        # 部分线程失败时吞吐量只统计了一部分操作，结果没有可比性
+        raise RuntimeError(f"{label} 基准测试有 {len(errors)} 个线程出错: {errors[0]}") from errors[0]
+
+    ops_per_sec = sum(results) / elapsed
+    print(f"  {label:<12} 线程数={threads:<3} 操作数={sum(results):<6} "
+          f"耗时={elapsed:.2f}s  吞吐量={ops_per_sec:,.0f} ops/sec")
+    return ops_per_sec
+
+def main():
+    """主函数"""
+    print("📊 数据库连接池基准测试")
+    print("=" * 60)
+
+    for threads in (1, 4):
+        legacy = benchmark(LegacyDatabaseManager, "旧实现", threads)
+        pooled = benchmark(DatabaseManager, "连接池", threads)
+        print(f"  ➜ 提升 {pooled / legacy:.1f} 倍")
+        print("-" * 60)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+分级阅卷模块
+先用便宜的基础模型评分并让模型自报置信度，只有置信度低或题目是开放性问答时
+才交给更强的升级模型评分，降低每道题的平均成本和延迟
+"""
+import re
+import threading
+from typing import Dict, Optional
+
+# 题目中出现这些词时通常是主观题，答案表述多样，直接交给升级模型
+OPEN_ENDED_KEYWORDS = ('解释', '说明', '分析', '为什么', '简述', '论述', '谈谈', '赏析',
+                       '评价', '描述', '概括', '体会', '感受', '理由', '含义', '意义')
+
+# 标准答案超过这个长度时视为开放性问答
+MAX_CLOSED_ANSWER_LENGTH = 20
+
+def is_open_ended(question: str, standard_answer: str) -> bool:
+    """判断是否为开放性问答题"""
+    if len(re.sub(r'\s+', '', standard_answer or '')) > MAX_CLOSED_ANSWER_LENGTH:
+        return True
+    return any(keyword in (question or '') for keyword in OPEN_ENDED_KEYWORDS)
+
+def grading_confidence(result: Dict) -> Optional[float]:
+    """读取模型自报的置信度（0-1），兼容百分制和字符串，缺失或无法解析时返回None"""
+    confidence = result.get('confidence') if isinstance(result, dict) else None
+    if isinstance(confidence, str):
+        try:
+            confidence = float(confidence.strip().rstrip('%'))
+        except ValueError:
+            return None
+    if isinstance(confidence, bool) or not isinstance(confidence, (int, float)):
+        return None
+    if 1 < confidence <= 100:
+        confidence /= 100
+    return confidence if 0 <= confidence <= 1 else None
+
+class GradingCascade:
+    """分级阅卷策略及升级率统计"""
+
+    def __init__(self, escalation_llm, confidence_threshold: float = 0.8):
+        """
+        Args:
+            escalation_llm: 升级模型的LLM实例
+            confidence_threshold: 基础模型置信度低于该值时升级
+        """
+        self.escalation_llm = escalation_llm
+        self.confidence_threshold = confidence_threshold
+        self.calls = 0
+        self.escalations = {'open_ended': 0, 'low_confidence': 0, 'base_failed': 0}
+        self._lock = threading.Lock()
+
+    def skip_base(self, question: str, standard_answer: str) -> bool:
+        """开放性问答直接使用升级模型"""
+        return is_open_ended(question, standard_answer)
+
+    def is_confident(self, result: Dict) -> bool:
+        confidence = grading_confidence(result)
+        return confidence is not None and confidence >= self.confidence_threshold
+
+    def record(self, escalation_reason: str = None):
+        """记录一道交给LLM评分的题目，escalation_reason 为升级原因，未升级时为None"""
+        with self._lock:
+            self.calls += 1
+            if escalation_reason:
+                self.escalations[escalation_reason] += 1
+
+    def stats(self) -> Dict:
+        """升级率及各升级原因的次数"""
+        with self._lock:
+            escalated = sum(self.escalations.values())
+            return {
+                'calls': self.calls,
+                'escalated': escalated,
+                'escalation_rate': escalated / self.calls if self.calls else 0.0,
+                'reasons': dict(self.escalations)
+            }
@@ -4,17 +4,123 @@
 """
 import sqlite3
 import json
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Iterator, Iterable
+from question_bank import QuestionCache, QUESTION_COLUMNS, question_from_row
+from migrations import apply_migrations
+import question_search
+import question_dedup
+from knowledge_points import (link_question_points, link_answer_weak_points,
+                              record_weak_point_stats, rebuild_weak_point_stats)
 
 class DatabaseManager:
-    def __init__(self, db_path: str = "teaching_system.db"):
+    def __init__(self, db_path: str = "teaching_system.db", busy_timeout: float = 5.0,
+                 cache_size_kb: int = 20000, question_cache_size: int = 10000):
+        """初始化数据库管理器
+        
+        Args:
+            db_path: SQLite数据库文件路径
+            busy_timeout: 数据库被其他连接锁定时的最长等待时间（秒）
+            cache_size_kb: 每个连接的页缓存大小（KB）
+            question_cache_size: 进程内题目缓存最多保存的题目数量
+        """
         self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.cache_size_kb = cache_size_kb
+        
+        # 连接池：每个线程持有一个长连接，避免每次操作都重新建立连接
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._pool_lock = threading.Lock()
+        
+        # 题目缓存：内含抽题索引，避免每次考试都对题库做 ORDER BY RANDOM() 并重复解析题目
+        self.question_cache = QuestionCache(question_cache_size)
+        
         self.init_database()
     
+    def _create_connection(self) -> sqlite3.Connection:
+        """创建并调优一个新的数据库连接"""
+        # 连接只在创建它的线程中使用，关闭 check_same_thread 是为了让 close() 能统一回收
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout,
+                               check_same_thread=False)
+        # WAL 模式允许读写并发，多名学生同时考试时不会互相阻塞
+        conn.execute('PRAGMA journal_mode=WAL')
+        # WAL 模式下 NORMAL 已能保证一致性，且每次提交无需 fsync
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout * 1000)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+    
+    def get_connection(self) -> sqlite3.Connection:
+        """获取当前线程的复用连接（不存在时创建）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._create_connection()
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._pool_lock:
+                self._connections.append(conn)
+        return conn
+    
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """以事务方式使用当前线程的连接
+        
+        正常退出时提交，出现异常时回滚。支持嵌套使用，只有最外层负责提交，
+        因此多个操作可以组合进同一个事务。
+        """
+        conn = self.get_connection()
+        self._local.depth += 1
+        try:
+            yield conn
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.rollback()
+            raise
+        else:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.commit()
+    
+    def close(self):
+        """关闭连接池中的所有连接"""
+        with self._pool_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        # 新的 threading.local 让各线程下次使用时重新建立连接
+        self._local = threading.local()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+    
     def init_database(self):
-        """初始化数据库表结构"""
-        conn = sqlite3.connect(self.db_path)
+        """初始化数据库表结构，并把已有数据库升级到最新版本"""
+        with self.connection() as conn:
+            self._create_tables(conn)
+        # 迁移和全文检索检查使用同一个连接，子类改写 connection() 时不会与之争用数据库锁
+        conn = self.get_connection()
+        apply_migrations(conn)
+        self.fts_enabled = question_search.fts_available(conn)
+    
+    def explain_query_plan(self, sql: str, params: Tuple = ()) -> List[str]:
+        """返回查询计划的描述，用于检查查询是否命中索引"""
+        with self.connection() as conn:
+            rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        return [row[3] for row in rows]
+    
+    def _create_tables(self, conn: sqlite3.Connection):
+        """创建基础表结构"""
         cursor = conn.cursor()
         
         # 题库表
@@ -71,169 +177,387 @@ class DatabaseManager:
                 FOREIGN KEY (question_id) REFERENCES questions (id)
             )
         ''')
-        
-        conn.commit()
-        conn.close()
     
     def add_question(self, subject: str, difficulty: str, question: str, 
                     standard_answer: str, knowledge_points: List[str], 
-                    created_by: str) -> int:
-        """管理员添加题目"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+                    created_by: str, check_near_duplicates: bool = True) -> int:
+        """管理员添加题目
         
-        cursor.execute('''
-            INSERT INTO questions (subject, difficulty, question, standard_answer, 
-                                 knowledge_points, created_by)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (subject, difficulty, question, standard_answer, 
-              json.dumps(knowledge_points, ensure_ascii=False), created_by))
-        
-        question_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        题目与题库中已有题目完全重复（忽略空白、标点和全半角差异），或近似重复（且标准答案相同）时
+        抛出 DuplicateQuestionError；check_near_duplicates=False 时只检查完全重复，
+        用于管理员确认近似重复的题目确实是不同的题目后强制添加。
+        """
+        fingerprint = question_dedup.question_fingerprint(subject, question)
+        keys = question_dedup.lsh_keys(subject, question)
+        with self.connection() as conn:
+            duplicate = question_dedup.find_duplicate(conn, subject, question, standard_answer,
+                                                      fingerprint, keys, near=check_near_duplicates)
+            if duplicate:
+                raise question_dedup.DuplicateQuestionError(
+                    question_dedup.duplicate_message(*duplicate), *duplicate)
+            
+            cursor = conn.cursor()
+            try:
+                cursor.execute('''
+                    INSERT INTO questions (subject, difficulty, question, standard_answer, 
+                                         knowledge_points, created_by, fingerprint)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (subject, difficulty, question, standard_answer, 
+                      json.dumps(knowledge_points, ensure_ascii=False), created_by, fingerprint))
+            except sqlite3.IntegrityError:
+                # 其他连接在查重之后抢先写入了同一道题
+                existing_id = question_dedup.find_exact_duplicate(conn, fingerprint)
+                raise question_dedup.DuplicateQuestionError(
+                    question_dedup.duplicate_message(existing_id, 1.0), existing_id)
+            
+            question_id = cursor.lastrowid
+            link_question_points(conn, [(question_id, knowledge_points)])
+            question_dedup.index_lsh(conn, [(question_id, keys)])
+            if self.fts_enabled:
+                question_search.index_questions(
+                    conn, [(question_id, question, standard_answer, knowledge_points)])
+        self.question_cache.invalidate(subject)
         return question_id
     
+    def add_questions_bulk(self, questions: Iterable[Dict], chunk_size: int = 1000,
+                           check_near_duplicates: bool = True) -> Dict:
+        """批量导入题目
+        
+        题目按 chunk_size 分块，每块在一个事务中通过 executemany 写入，
+        单条题目出错不会影响同批次的其他题目。与题库或同批次中前面的题目重复的题目
+        不会写入，作为错误返回。
+        
+        Args:
+            questions: 题目字典的可迭代对象（可以是生成器），字段同 add_question
+            chunk_size: 每个事务写入的题目数量
+            check_near_duplicates: 是否检查近似重复，关闭后只检查完全重复，导入更快
+        
+        Returns:
+            {'ids': 与输入顺序一一对应的题目ID列表（失败的位置为None）,
+             'errors': [{'index': 序号, 'question': 原始数据, 'error': 错误信息}, ...]}
+            重复题目的错误信息中还有 'duplicate_of'（已有题目的ID）和 'similarity'
+        """
+        ids: List[Optional[int]] = []
+        errors: List[Dict] = []
+        chunk: List[Tuple[int, Tuple, Dict]] = []
+        subjects = set()
+        
+        for index, q_data in enumerate(questions):
+            try:
+                chunk.append((index, self._question_row(q_data), q_data))
+            except (KeyError, TypeError, ValueError) as e:
+                ids.append(None)
+                errors.append({'index': index, 'question': q_data, 'error': f"数据不完整: {e}"})
+                continue
+            ids.append(None)
+            subjects.add(q_data['subject'])
+            if len(chunk) >= chunk_size:
+                self._insert_question_chunk(chunk, ids, errors, check_near_duplicates)
+                chunk = []
+        
+        if chunk:
+            self._insert_question_chunk(chunk, ids, errors, check_near_duplicates)
+        
+        for subject in subjects:
+            self.question_cache.invalidate(subject)
+        errors.sort(key=lambda item: item['index'])
+        return {'ids': ids, 'errors': errors}
+    
+    @staticmethod
+    def _question_row(q_data: Dict) -> Tuple:
+        """把题目字典转换为 questions 表的一行数据（最后一列为题目指纹）"""
+        row = (q_data['subject'], q_data['difficulty'], q_data['question'],
+               q_data['standard_answer'])
+        if not all(isinstance(value, str) and value.strip() for value in row):
+            raise ValueError("科目、难度、题目内容和标准答案不能为空")
+        knowledge_points = q_data.get('knowledge_points') or []
+        return row + (json.dumps(list(knowledge_points), ensure_ascii=False),
+                      q_data.get('created_by') or 'System',
+                      question_dedup.question_fingerprint(q_data['subject'], q_data['question']))
+    
+    @staticmethod
+    def _filter_duplicates(conn: sqlite3.Connection, chunk: List[Tuple[int, Tuple, Dict]],
+                           errors: List[Dict], check_near: bool) -> Tuple[List, Dict, List]:
+        """去掉与题库或本批次前面的题目重复的题目
+        
+        Returns:
+            (保留的题目, {序号: LSH分段键}, [(重复题目的错误信息, 本批次中被重复的题目序号)])
+        """
+        fingerprints = [row[-1] for _, row, _ in chunk]
+        existing = {}
+        for start in range(0, len(fingerprints), 500):
+            batch = fingerprints[start:start + 500]
+            existing.update(conn.execute(
+                f"SELECT fingerprint, id FROM questions WHERE fingerprint IN ({','.join('?' * len(batch))})",
+                batch).fetchall())
+        
+        kept = []
+        keys_by_index = {}
+        in_chunk_duplicates = []
+        first_by_fingerprint = {}
+        # 本批次已保留题目的 LSH 分段键 -> [(序号, 题目内容, 标准答案)]
+        chunk_buckets: Dict[int, List[Tuple[int, str, str]]] = {}
+        
+        for index, row, q_data in chunk:
+            subject, question, standard_answer, fingerprint = row[0], row[2], row[3], row[-1]
+            duplicate = None
+            if fingerprint in existing:
+                duplicate = (existing[fingerprint], 1.0, None)
+            elif fingerprint in first_by_fingerprint:
+                duplicate = (None, 1.0, first_by_fingerprint[fingerprint])
+            elif check_near:
+                keys = question_dedup.lsh_keys(subject, question)
+                keys_by_index[index] = keys
+                found = question_dedup.find_near_duplicate(conn, subject, question,
+                                                           standard_answer, keys)
+                if found:
+                    duplicate = found + (None,)
+                else:
+                    candidates = {candidate for key in keys
+                                  for candidate in chunk_buckets.get(key, ())}
+                    for candidate_index, candidate, candidate_answer in sorted(candidates):
+                        score = question_dedup.near_duplicate_score(
+                            question, standard_answer, candidate, candidate_answer)
+                        if score is not None:
+                            duplicate = (None, score, candidate_index)
+                            break
+            
+            if duplicate:
+                existing_id, score, chunk_index = duplicate
+                error = {'index': index, 'question': q_data,
+                         'error': question_dedup.duplicate_message(existing_id, score),
+                         'duplicate_of': existing_id, 'similarity': score}
+                errors.append(error)
+                if chunk_index is not None:
+                    in_chunk_duplicates.append((error, chunk_index))
+                continue
+            
+            first_by_fingerprint[fingerprint] = index
+            if index in keys_by_index:
+                for key in keys_by_index[index]:
+                    chunk_buckets.setdefault(key, []).append((index, question, standard_answer))
+            kept.append((index, row, q_data))
+        return kept, keys_by_index, in_chunk_duplicates
+    
+    def _insert_question_chunk(self, chunk: List[Tuple[int, Tuple, Dict]],
+                               ids: List[Optional[int]], errors: List[Dict],
+                               check_near_duplicates: bool = True):
+        """在一个事务中写入一批题目，并回填分配到的ID"""
+        insert_sql = '''
+            INSERT INTO questions (subject, difficulty, question, standard_answer, 
+                                 knowledge_points, created_by, fingerprint)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        '''
+        with self.connection() as conn:
+            # 显式开启事务，保证查重、题目和知识点关联在同一个事务中提交；
+            # 先查重后写入，需要一开始就取得写锁，否则其他连接在此期间提交后无法升级为写锁
+            if not conn.in_transaction:
+                conn.execute('BEGIN IMMEDIATE')
+            chunk, keys_by_index, in_chunk_duplicates = self._filter_duplicates(
+                conn, chunk, errors, check_near_duplicates)
+            if not chunk:
+                return
+            conn.execute('SAVEPOINT bulk_chunk')
+            try:
+                conn.executemany(insert_sql, [row for _, row, _ in chunk])
+            except sqlite3.DatabaseError:
+                # 整块写入失败时退回到逐条写入，定位出错的题目
+                conn.execute('ROLLBACK TO bulk_chunk')
+                conn.execute('RELEASE bulk_chunk')
+                for index, row, q_data in chunk:
+                    try:
+                        ids[index] = conn.execute(insert_sql, row).lastrowid
+                    except sqlite3.DatabaseError as e:
+                        errors.append({'index': index, 'question': q_data, 'error': str(e)})
+            else:
+                conn.execute('RELEASE bulk_chunk')
+                # 同一事务内持有写锁，AUTOINCREMENT 分配的ID是连续的
+                last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+                first_id = last_id - len(chunk) + 1
+                for offset, (index, _, _) in enumerate(chunk):
+                    ids[index] = first_id + offset
+            
+            for error, chunk_index in in_chunk_duplicates:
+                error['duplicate_of'] = ids[chunk_index]
+                error['error'] = question_dedup.duplicate_message(ids[chunk_index], error['similarity'])
+            
+            inserted = [(index, row, q_data) for index, row, q_data in chunk if ids[index] is not None]
+            link_question_points(conn, [
+                (ids[index], q_data.get('knowledge_points') or [])
+                for index, _, q_data in inserted
+            ])
+            # 不检查近似重复时也要建立索引，后续写入的题目才能查到这些题目
+            question_dedup.index_lsh(conn, [
+                (ids[index], keys_by_index.get(index) or question_dedup.lsh_keys(row[0], row[2]))
+                for index, row, _ in inserted
+            ])
+            if self.fts_enabled:
+                question_search.index_questions(conn, [
+                    (ids[index], q_data['question'], q_data['standard_answer'],
+                     q_data.get('knowledge_points') or [])
+                    for index, _, q_data in inserted
+                ])
+    
     def get_questions_by_subject(self, subject: str, difficulty: str = None, 
                                limit: int = 5) -> List[Dict]:
-        """根据科目获取题目"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """根据科目随机获取题目"""
+        with self.connection() as conn:
+            return self.question_cache.sample(conn, subject, difficulty, limit)
+    
+    def get_questions_by_ids(self, question_ids: List[int]) -> List[Dict]:
+        """按ID获取题目（优先读取缓存），按传入顺序返回"""
+        with self.connection() as conn:
+            questions = self.question_cache.get_many(conn, question_ids)
+        return [questions[question_id] for question_id in question_ids if question_id in questions]
+    
+    def get_cache_stats(self) -> Dict:
+        """题目缓存的命中率等监控指标"""
+        return self.question_cache.stats()
+    
+    def iter_questions(self, subject: str = None, after_id: int = None,
+                       page_size: int = 500) -> Iterator[Dict]:
+        """按ID顺序逐条遍历题库
         
-        if difficulty:
-            cursor.execute('''
-                SELECT id, subject, difficulty, question, standard_answer, knowledge_points
-                FROM questions 
-                WHERE subject = ? AND difficulty = ?
-                ORDER BY RANDOM()
-                LIMIT ?
-            ''', (subject, difficulty, limit))
-        else:
-            cursor.execute('''
-                SELECT id, subject, difficulty, question, standard_answer, knowledge_points
-                FROM questions 
-                WHERE subject = ?
-                ORDER BY RANDOM()
-                LIMIT ?
-            ''', (subject, limit))
+        使用键集分页（WHERE id > 上一页最后的ID），每次只读取一页数据，
+        遍历大题库时内存占用保持不变，翻页速度也不会随页码增加而变慢。
         
-        questions = []
-        for row in cursor.fetchall():
-            questions.append({
-                'id': row[0],
-                'subject': row[1],
-                'difficulty': row[2],
-                'question': row[3],
-                'standard_answer': row[4],
-                'knowledge_points': json.loads(row[5]) if row[5] else []
-            })
+        Args:
+            subject: 只遍历指定科目
+            after_id: 从该ID之后开始遍历（用于断点续读）
+            page_size: 每次查询读取的题目数量
+        """
+        subject_filter = 'AND subject = ?' if subject else ''
+        last_id = after_id or 0
+        
+        while True:
+            params = (last_id,) + ((subject,) if subject else ()) + (page_size,)
+            with self.connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT {QUESTION_COLUMNS}
+                    FROM questions
+                    WHERE id > ? {subject_filter}
+                    ORDER BY id
+                    LIMIT ?
+                ''', params).fetchall()
+            
+            for row in rows:
+                yield question_from_row(row)
+            
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1][0]
+    
+    def search_questions(self, query: str, subject: str = None, limit: int = 20) -> List[Dict]:
+        """全文检索题库，按相关度排序
         
-        conn.close()
-        return questions
+        支持中文任意片段检索，多个关键词用空格分隔时需同时匹配。
+        """
+        with self.connection() as conn:
+            return question_search.search(conn, query, subject, limit)
     
     def create_student(self, name: str, grade: str = None) -> int:
         """创建学生记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO students (name, grade)
-            VALUES (?, ?)
-        ''', (name, grade))
-        
-        student_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO students (name, grade)
+                VALUES (?, ?)
+            ''', (name, grade))
+            
+            student_id = cursor.lastrowid
         return student_id
     
     def create_exam(self, student_id: int, subject: str) -> int:
         """创建考试记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO exams (student_id, subject)
-            VALUES (?, ?)
-        ''', (student_id, subject))
-        
-        exam_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO exams (student_id, subject)
+                VALUES (?, ?)
+            ''', (student_id, subject))
+            
+            exam_id = cursor.lastrowid
         return exam_id
     
     def save_answer(self, exam_id: int, question_id: int, student_answer: str, 
                    score: float, analysis: str, weak_points: List[str]) -> int:
         """保存学生答案和分析结果"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO answers (exam_id, question_id, student_answer, score, 
-                               analysis, weak_points)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (exam_id, question_id, student_answer, score, analysis,
-              json.dumps(weak_points, ensure_ascii=False)))
-        
-        answer_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO answers (exam_id, question_id, student_answer, score, 
+                                   analysis, weak_points)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (exam_id, question_id, student_answer, score, analysis,
+                  json.dumps(weak_points, ensure_ascii=False)))
+            
+            answer_id = cursor.lastrowid
+            link_answer_weak_points(conn, [(answer_id, weak_points)])
+            # 与答题记录在同一事务中更新统计，保证两者一致
+            record_weak_point_stats(conn, exam_id, weak_points)
         return answer_id
     
+    def save_exam_answers(self, exam_id: int, answers: List[Dict], total_score: float) -> List[int]:
+        """在一个事务中保存整场考试的答案并完成考试，返回答题记录ID列表"""
+        with self.connection():
+            answer_ids = [
+                self.save_answer(exam_id, answer['question_id'], answer['student_answer'],
+                                 answer['score'], answer['analysis'], answer['weak_points'])
+                for answer in answers
+            ]
+            self.complete_exam(exam_id, total_score)
+        return answer_ids
+    
     def complete_exam(self, exam_id: int, total_score: float):
         """完成考试，更新总分"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE exams 
-            SET total_score = ?, end_time = CURRENT_TIMESTAMP, status = 'completed'
-            WHERE id = ?
-        ''', (total_score, exam_id))
-        
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            conn.execute('''
+                UPDATE exams 
+                SET total_score = ?, end_time = CURRENT_TIMESTAMP, status = 'completed'
+                WHERE id = ?
+            ''', (total_score, exam_id))
     
     def get_exam_results(self, exam_id: int) -> Dict:
         """获取考试结果详情"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 获取考试基本信息
-        cursor.execute('''
-            SELECT e.id, s.name, e.subject, e.total_score, e.start_time, e.end_time
-            FROM exams e
-            JOIN students s ON e.student_id = s.id
-            WHERE e.id = ?
-        ''', (exam_id,))
-        
-        exam_info = cursor.fetchone()
-        if not exam_info:
-            conn.close()
-            return None
-        
-        # 获取答题详情
-        cursor.execute('''
-            SELECT a.question_id, q.question, q.standard_answer, a.student_answer,
-                   a.score, a.analysis, a.weak_points
-            FROM answers a
-            JOIN questions q ON a.question_id = q.id
-            WHERE a.exam_id = ?
-            ORDER BY a.id
-        ''', (exam_id,))
-        
-        answers = []
-        for row in cursor.fetchall():
-            answers.append({
-                'question_id': row[0],
-                'question': row[1],
-                'standard_answer': row[2],
-                'student_answer': row[3],
-                'score': row[4],
-                'analysis': row[5],
-                'weak_points': json.loads(row[6]) if row[6] else []
-            })
-        
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            # 获取考试基本信息
+            cursor.execute('''
+                SELECT e.id, s.name, e.subject, e.total_score, e.start_time, e.end_time
+                FROM exams e
+                JOIN students s ON e.student_id = s.id
+                WHERE e.id = ?
+            ''', (exam_id,))
+            
+            exam_info = cursor.fetchone()
+            if not exam_info:
+                return None
+            
+            # 获取答题详情
+            cursor.execute('''
+                SELECT a.question_id, q.question, q.standard_answer, a.student_answer,
+                       a.score, a.analysis, a.weak_points
+                FROM answers a
+                JOIN questions q ON a.question_id = q.id
+                WHERE a.exam_id = ?
+                ORDER BY a.id
+            ''', (exam_id,))
+            
+            answers = []
+            for row in cursor.fetchall():
+                answers.append({
+                    'question_id': row[0],
+                    'question': row[1],
+                    'standard_answer': row[2],
+                    'student_answer': row[3],
+                    'score': row[4],
+                    'analysis': row[5],
+                    'weak_points': json.loads(row[6]) if row[6] else []
+                })
         
         return {
             'exam_id': exam_info[0],
@@ -245,35 +569,38 @@ class DatabaseManager:
             'answers': answers
         }
     
-    def get_student_weak_points(self, student_id: int, subject: str = None) -> List[str]:
-        """分析学生薄弱知识点"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        if subject:
-            cursor.execute('''
-                SELECT a.weak_points
-                FROM answers a
-                JOIN exams e ON a.exam_id = e.id
-                WHERE e.student_id = ? AND e.subject = ?
-            ''', (student_id, subject))
-        else:
-            cursor.execute('''
-                SELECT a.weak_points
-                FROM answers a
-                JOIN exams e ON a.exam_id = e.id
-                WHERE e.student_id = ?
-            ''', (student_id,))
+    def get_student_weak_points(self, student_id: int, subject: str = None,
+                                limit: int = None) -> List[str]:
+        """分析学生薄弱知识点，按出现次数从高到低排列
         
-        all_weak_points = []
-        for row in cursor.fetchall():
-            if row[0]:
-                weak_points = json.loads(row[0])
-                all_weak_points.extend(weak_points)
+        读取增量维护的 student_weak_point_stats 统计表，耗时与学生的答题历史长度无关。
+        """
+        limit_clause = 'LIMIT ?' if limit is not None else ''
         
-        conn.close()
-        
-        # 统计频次，返回最常见的薄弱点
-        from collections import Counter
-        weak_point_counts = Counter(all_weak_points)
-        return [point for point, count in weak_point_counts.most_common()]
+        with self.connection() as conn:
+            if subject:
+                params = (student_id, subject) + ((limit,) if limit is not None else ())
+                cursor = conn.execute(f'''
+                    SELECT point
+                    FROM student_weak_point_stats
+                    WHERE student_id = ? AND subject = ?
+                    ORDER BY count DESC, last_seen DESC
+                    {limit_clause}
+                ''', params)
+            else:
+                params = (student_id,) + ((limit,) if limit is not None else ())
+                cursor = conn.execute(f'''
+                    SELECT point
+                    FROM student_weak_point_stats
+                    WHERE student_id = ?
+                    GROUP BY point
+                    ORDER BY SUM(count) DESC, MAX(last_seen) DESC
+                    {limit_clause}
+                ''', params)
+            
+            return [row[0] for row in cursor.fetchall()]
+    
+    def rebuild_weak_point_stats(self, student_id: int = None) -> int:
+        """根据答题记录重建薄弱点统计表，用于修复统计偏差"""
+        with self.connection() as conn:
+            return rebuild_weak_point_stats(conn, student_id)
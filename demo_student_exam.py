@@ -74,29 +74,21 @@ def demo_exam():
     print("\n🎯 开始考试...")
     print("=" * 60)
     
-    # 逐题答题和评分
-    for i, question_data in enumerate(questions, 1):
+    # 预设答案不足时视为不会做
+    answers = [student_answers[i] if i < len(student_answers) else "不知道"
+               for i in range(len(questions))]
+    
+    # 交卷后所有题目并发评分
+    print("🤖 AI正在并发评分全部题目...")
+    grading_results = system.grade_exam(questions, answers)
+    
+    for i, (question_data, student_answer, grading_result) in enumerate(
+            zip(questions, answers, grading_results), 1):
         print(f"\n📋 第 {i} 题")
         print(f"题目：{question_data['question']}")
         print(f"标准答案：{question_data['standard_answer']}")
-        
-        # 使用预设的学生答案
-        if i <= len(student_answers):
-            student_answer = student_answers[i-1]
-        else:
-            student_answer = "不知道"
-            
         print(f"学生答案：{student_answer}")
         
-        # AI阅卷
-        print("🤖 AI正在评分中...")
-        grading_result = system.grade_answer(
-            question_data['question'],
-            question_data['standard_answer'],
-            student_answer,
-            question_data['knowledge_points']
-        )
-        
         score = grading_result['score']
         total_score += score
         
@@ -134,16 +126,10 @@ def demo_exam():
     print("=" * 60)
     
     exam_results = system.db.get_exam_results(exam_id)
-    tutoring_report = system.generate_tutoring_report(
-        exam_results['student_name'],
-        exam_results
-    )
-    
-    print("📋 个性化辅导报告：")
-    print(tutoring_report)
     
-    # 保存报告
+    # 流式生成报告，每段文本同时显示并写入文件
     filename = f"demo_report_{student_name}_{exam_id}.txt"
+    print("📋 个性化辅导报告：")
     with open(filename, 'w', encoding='utf-8') as f:
         f.write(f"学生: {student_name}\n")
         f.write(f"年级: {grade}\n")
@@ -151,10 +137,20 @@ def demo_exam():
         f.write(f"总分: {total_score}/50\n")
         f.write(f"考试ID: {exam_id}\n")
         f.write("="*60 + "\n")
-        f.write(tutoring_report)
+        for chunk in system.stream_tutoring_report(exam_results['student_name'], exam_results):
+            print(chunk, end="", flush=True)
+            f.write(chunk)
+            f.flush()
+    print()
     
     print(f"\n💾 辅导报告已保存到: {filename}")
     
+    # 阅卷统计
+    fast_path_stats = system.get_grading_stats()['fast_path']
+    if fast_path_stats:
+        print(f"⚡ 本地快速阅卷：{fast_path_stats['absorbed']}/{fast_path_stats['calls']} 题 "
+              f"({fast_path_stats['absorbed_rate']*100:.0f}%) 无需调用LLM")
+    
     print("\n" + "="*60)
     print("🎯 演示完成！")
     print("这就是完整的智能教学系统学生考试流程：")
@@ -0,0 +1,164 @@
+"""
+缓冲式考试会话模块
+考试过程中的答案先保存在内存和本地日志文件中，交卷时一次性写入数据库
+"""
+import glob
+import json
+import os
+from typing import List, Dict
+from database import DatabaseManager
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 flock，此时不对日志加锁
+    fcntl = None
+
+def default_journal_dir(db: DatabaseManager) -> str:
+    """答题日志目录，默认放在数据库文件旁边"""
+    return os.path.splitext(os.path.abspath(db.db_path))[0] + "_exam_journal"
+
+def _try_lock(journal) -> bool:
+    """对日志文件加排他锁（不等待），已被其他会话持有时返回False
+
+    锁随文件关闭或进程退出自动释放，因此崩溃进程遗留的日志总能加锁成功。
+    """
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+def _still_linked(journal, path: str) -> bool:
+    """加锁期间日志可能已被其他进程删除（或删除后重建），此时锁住的不是当前文件"""
+    try:
+        return os.path.samestat(os.fstat(journal.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+class BufferedExamSession:
+    """缓冲式考试会话
+
+    每道题的答案追加写入日志文件（JSON Lines），交卷时所有答案与考试总分在
+    同一个事务中提交。进程在考试中途崩溃时，可以用 recover_exam_sessions()
+    根据日志补写，不会丢失已作答的题目。
+    """
+
+    def __init__(self, db: DatabaseManager, exam_id: int, journal_dir: str = None,
+                 durable: bool = True):
+        """
+        Args:
+            db: 数据库管理器
+            exam_id: 考试ID
+            journal_dir: 日志目录，默认见 default_journal_dir()
+            durable: 每写一条日志是否调用 fsync，关闭后更快但断电时可能丢失最后几题
+        """
+        self.db = db
+        self.exam_id = exam_id
+        self.durable = durable
+        self.answers: List[Dict] = []
+        self.committed = False
+
+        journal_dir = journal_dir or default_journal_dir(db)
+        os.makedirs(journal_dir, exist_ok=True)
+        self.journal_path = os.path.join(journal_dir, f"exam_{exam_id}.jsonl")
+        self._journal = self._open_locked_journal()
+
+    def _open_locked_journal(self):
+        """打开并锁定日志文件，防止其他进程把进行中的考试当作崩溃遗留而恢复"""
+        while True:
+            journal = open(self.journal_path, 'a', encoding='utf-8')
+            if not _try_lock(journal):
+                journal.close()
+                raise RuntimeError(f"考试 {self.exam_id} 正在另一个会话中进行")
+            # 加锁前日志可能刚被恢复流程删除，此时需要重新创建
+            if _still_linked(journal, self.journal_path):
+                return journal
+            journal.close()
+
+    @property
+    def total_score(self) -> float:
+        """当前已作答题目的总分"""
+        return sum(answer['score'] for answer in self.answers)
+
+    def add_answer(self, question_id: int, student_answer: str, score: float,
+                   analysis: str, weak_points: List[str]):
+        """记录一道题的答案（暂不写入数据库）"""
+        if self.committed:
+            raise RuntimeError("考试已提交，不能继续作答")
+        answer = {
+            'question_id': question_id,
+            'student_answer': student_answer,
+            'score': score,
+            'analysis': analysis,
+            'weak_points': weak_points
+        }
+        self._journal.write(json.dumps(answer, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        if self.durable:
+            os.fsync(self._journal.fileno())
+        self.answers.append(answer)
+
+    def commit(self, total_score: float = None) -> List[int]:
+        """交卷：在一个事务中写入全部答案和考试总分，返回答题记录ID列表"""
+        if total_score is None:
+            total_score = self.total_score
+        answer_ids = self.db.save_exam_answers(self.exam_id, self.answers, total_score)
+        self.committed = True
+        self._close_journal(remove=True)
+        return answer_ids
+
+    def _close_journal(self, remove: bool):
+        if not self._journal.closed:
+            self._journal.close()
+        if remove and os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # 出现异常时保留日志，供下次启动时恢复
+        if exc_type is None and not self.committed:
+            self.commit()
+        else:
+            self._close_journal(remove=self.committed)
+
+def recover_exam_sessions(db: DatabaseManager, journal_dir: str = None) -> List[int]:
+    """根据遗留的答题日志补写未提交的考试，返回恢复的考试ID列表"""
+    journal_dir = journal_dir or default_journal_dir(db)
+    recovered = []
+
+    for journal_path in sorted(glob.glob(os.path.join(journal_dir, "exam_*.jsonl"))):
+        exam_id = int(os.path.basename(journal_path)[len("exam_"):-len(".jsonl")])
+
+        try:
+            f = open(journal_path, encoding='utf-8')
+        except FileNotFoundError:
+            continue
+        with f:
+            # 日志仍被进行中的考试会话锁定，不是崩溃遗留；或已被其他进程恢复
+            if not _try_lock(f) or not _still_linked(f, journal_path):
+                continue
+            answers = []
+            for line in f:
+                try:
+                    answers.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # 崩溃时最后一行可能只写了一半
+                    break
+
+            # 状态检查和补写在同一个写事务中，避免与其他进程的恢复或交卷重复写入
+            with db.connection() as conn:
+                if not conn.in_transaction:
+                    conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute('SELECT status FROM exams WHERE id = ?', (exam_id,)).fetchone()
+                # 提交成功但日志未来得及删除时，不能重复写入
+                if row is not None and row[0] != 'completed':
+                    db.save_exam_answers(exam_id, answers, sum(a['score'] for a in answers))
+                    recovered.append(exam_id)
+            # 持有锁时删除，其他进程不会再读到这份日志
+            os.remove(journal_path)
+
+    return recovered
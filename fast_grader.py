@@ -0,0 +1,145 @@
+"""
+客观题本地快速阅卷模块
+标准答案是数字（可带单位）、选择题选项或简短词语时，直接在本地比对给分，
+只有无法明确判断的答案才交给LLM阅卷
+"""
+import re
+import threading
+import unicodedata
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional, Tuple
+
+# 常见量词，"8个苹果" 与 "8个"、"8苹果" 视为同一答案
+MEASURE_WORDS = set('个只支本条张块头匹辆棵朵位名件双把颗粒根座间片枝杯瓶盒袋次岁元角分')
+
+# 明确表示没有作答的答案
+NO_ANSWER = {'', '未作答', '不知道', '不会', '不懂', '没有答案'}
+
+# 短文本题的标准答案最大长度，更长的答案可能有多种正确表述，交给LLM判断
+MAX_SHORT_TEXT_LENGTH = 8
+
+_NUMBER_PATTERN = re.compile(r'^(?:答[:：]?)?(?:[a-z]=)?(-?\d+(?:\.\d+)?)(\D*)$')
+# 在算式、分数、百分数中有含义的标点，比对时保留
+MEANINGFUL_PUNCTUATION = set('-/%.')
+
+def _normalize(text: str) -> str:
+    """全角转半角、去空白和句末标点、统一小写"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    text = re.sub(r'\s+', '', text)
+    return text.rstrip('。.!！')
+
+def _strip_punctuation(text: str) -> str:
+    """去掉空白和标点（Unicode P 类），运算符、比较符号、对错符号等按原样保留"""
+    return ''.join(char for char in text
+                   if not char.isspace() and (char in MEANINGFUL_PUNCTUATION
+                                              or not unicodedata.category(char).startswith('P')))
+
+def parse_numeric_answer(text: str) -> Optional[Tuple[Decimal, str]]:
+    """解析 "13"、"x = 4"、"8个苹果"、"25平方厘米" 这类答案，返回 (数值, 单位)"""
+    match = _NUMBER_PATTERN.match(_normalize(text))
+    if not match:
+        return None
+    try:
+        value = Decimal(match.group(1))
+    except InvalidOperation:
+        return None
+    return value, match.group(2)
+
+def _units_compatible(student_unit: str, standard_unit: str) -> bool:
+    """单位相同，或只省略了量词/名词时视为一致
+
+    标准答案的单位是百分号、长度面积等计量单位时，省略单位的答案（如 "0.5" 对 "50%"、
+    "25" 对 "25平方厘米"）数值含义不确定，视为不一致，交给LLM判断。
+    """
+    if student_unit == standard_unit:
+        return True
+    if not student_unit:
+        return standard_unit[0] in MEASURE_WORDS
+
+    def split(unit: str) -> Tuple[str, str]:
+        if unit and unit[0] in MEASURE_WORDS:
+            return unit[0], unit[1:]
+        return '', unit
+
+    student_measure, student_noun = split(student_unit)
+    standard_measure, standard_noun = split(standard_unit)
+    # 标准答案没有量词时，学生补上量词（如 "9个"）也算一致
+    return (student_measure in ('', standard_measure) or not standard_measure) \
+        and student_noun in ('', standard_noun)
+
+def _result(score: int, analysis: str, weak_points: List[str], standard_answer: str) -> Dict:
+    return {
+        "score": score,
+        "analysis": analysis,
+        "weak_points": weak_points,
+        "suggestions": "继续保持" if score else "请仔细审题并检查计算过程",
+        "correct_answer": standard_answer,
+        "graded_by": "rule"
+    }
+
+def fast_grade(standard_answer: str, student_answer: str,
+               knowledge_points: List[str]) -> Optional[Dict]:
+    """本地快速阅卷，能明确判断时返回评分结果（满分或零分），否则返回None"""
+    # 标准答案为空或只有标点时无从比对，交给LLM
+    if not _strip_punctuation(_normalize(standard_answer)):
+        return None
+    student = _normalize(student_answer)
+    if student in NO_ANSWER:
+        return _result(0, "学生未作答。", list(knowledge_points), standard_answer)
+
+    # 数值题：数值与单位都能明确比对时给分
+    standard_number = parse_numeric_answer(standard_answer)
+    if standard_number is not None:
+        student_number = parse_numeric_answer(student_answer)
+        if student_number is None:
+            return None
+        if not _units_compatible(student_number[1], standard_number[1]):
+            return None
+        if student_number[0] == standard_number[0]:
+            return _result(10, "答案正确。", [], standard_answer)
+        return _result(0, f"答案错误，正确答案是 {standard_answer}。",
+                       list(knowledge_points), standard_answer)
+
+    standard = _normalize(standard_answer)
+
+    # 选择题：标准答案为单个选项字母
+    if re.fullmatch(r'[a-h]', standard):
+        student_choice = re.sub(r'^(?:答案?[:：]?|选)', '', student)
+        if re.fullmatch(r'[a-h]', student_choice):
+            if student_choice == standard:
+                return _result(10, "答案正确。", [], standard_answer)
+            return _result(0, f"答案错误，正确选项是 {standard_answer}。",
+                           list(knowledge_points), standard_answer)
+        return None
+
+    # 简短词语：去掉标点后完全一致才判满分，不一致可能是同义表述，交给LLM
+    if len(standard) <= MAX_SHORT_TEXT_LENGTH:
+        if _strip_punctuation(student) == _strip_punctuation(standard):
+            return _result(10, "答案正确。", [], standard_answer)
+    return None
+
+class FastPathGrader:
+    """带命中统计的本地快速阅卷器"""
+
+    def __init__(self):
+        self.calls = 0
+        self.absorbed = 0
+        self._lock = threading.Lock()
+
+    def grade(self, standard_answer: str, student_answer: str,
+              knowledge_points: List[str]) -> Optional[Dict]:
+        result = fast_grade(standard_answer, student_answer, knowledge_points)
+        with self._lock:
+            self.calls += 1
+            if result is not None:
+                self.absorbed += 1
+        return result
+
+    def stats(self) -> Dict:
+        """本地快速阅卷处理的调用占比"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'absorbed': self.absorbed,
+                'absorbed_rate': self.absorbed / self.calls if self.calls else 0.0
+            }
@@ -0,0 +1,119 @@
+"""
+阅卷结果缓存模块
+相同题目的相同答案（规范化后）直接复用之前的评分结果，无需再次调用LLM
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional
+from database import DatabaseManager
+
+def normalize_answer(answer: str) -> str:
+    """规范化学生答案：全角转半角、统一大小写、合并空白"""
+    answer = unicodedata.normalize('NFKC', answer or '')
+    return re.sub(r'\s+', ' ', answer).strip().lower()
+
+class GradingCache:
+    """基于SQLite的持久化阅卷缓存
+
+    缓存键由题目（题目内容+标准答案的哈希）、规范化后的学生答案、模型提供商、
+    模型名称和阅卷提示词版本共同决定，任何一项变化都不会命中旧结果。
+    条目超过 ttl_seconds 后失效，总数超过 max_entries 时淘汰最久未使用的条目。
+    """
+
+    # 命中时最多每隔这么久才更新一次 last_used，避免每次命中都写库
+    TOUCH_INTERVAL = 60.0
+    # 每写入这么多条检查一次容量
+    EVICT_CHECK_INTERVAL = 100
+
+    def __init__(self, db: DatabaseManager, ttl_seconds: float = 30 * 24 * 3600,
+                 max_entries: int = 100000):
+        self.db = db
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(question: str, standard_answer: str, student_answer: str,
+                 provider: str, model: str, prompt_version: str) -> str:
+        """生成缓存键"""
+        question_hash = hashlib.sha256(
+            f"{question}\x1f{standard_answer}".encode('utf-8')).hexdigest()
+        raw_key = "\x1f".join([question_hash, normalize_answer(student_answer),
+                               provider, model, prompt_version])
+        return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """读取缓存的评分结果，未命中或已过期时返回None"""
+        return self.get_first([key])
+
+    def get_first(self, keys: List[str]) -> Optional[Dict]:
+        """按顺序返回第一个命中的缓存结果（如先查升级模型、再查基础模型），只计一次命中或未命中"""
+        now = time.time()
+        placeholders = ', '.join('?' * len(keys))
+        with self.db.connection() as conn:
+            rows = conn.execute(f'SELECT cache_key, result, created_at, last_used FROM grading_cache '
+                                f'WHERE cache_key IN ({placeholders})', keys).fetchall()
+            found = {}
+            for key, result, created_at, last_used in rows:
+                if now - created_at > self.ttl_seconds:
+                    conn.execute('DELETE FROM grading_cache WHERE cache_key = ?', (key,))
+                else:
+                    found[key] = (result, last_used)
+            key = next((key for key in keys if key in found), None)
+            if key is not None and now - found[key][1] > self.TOUCH_INTERVAL:
+                conn.execute('UPDATE grading_cache SET last_used = ? WHERE cache_key = ?',
+                             (now, key))
+
+        with self._lock:
+            if key is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(found[key][0])
+
+    def put(self, key: str, result: Dict):
+        """保存评分结果"""
+        now = time.time()
+        with self.db.connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO grading_cache (cache_key, result, created_at, last_used)
+                VALUES (?, ?, ?, ?)
+            ''', (key, json.dumps(result, ensure_ascii=False), now, now))
+
+            with self._lock:
+                self._puts += 1
+                check_capacity = self._puts % self.EVICT_CHECK_INTERVAL == 0
+            if check_capacity:
+                self._evict(conn, now)
+
+    def _evict(self, conn, now: float):
+        conn.execute('DELETE FROM grading_cache WHERE created_at < ?', (now - self.ttl_seconds,))
+        count = conn.execute('SELECT COUNT(*) FROM grading_cache').fetchone()[0]
+        if count > self.max_entries:
+            conn.execute('''
+                DELETE FROM grading_cache WHERE cache_key IN (
+                    SELECT cache_key FROM grading_cache ORDER BY last_used LIMIT ?
+                )
+            ''', (count - self.max_entries,))
+
+    def clear(self):
+        """清空缓存"""
+        with self.db.connection() as conn:
+            conn.execute('DELETE FROM grading_cache')
+
+    def stats(self) -> Dict:
+        """命中率等监控指标"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
@@ -0,0 +1,247 @@
+"""
+LLM返回内容的JSON提取模块
+模型经常在JSON前后附带说明文字或Markdown代码块，偶尔还会输出尾随逗号、中文引号、
+"8分" 这样不合法的数字。本模块找出第一个括号配对完整的JSON对象（或数组），
+解析失败时修复常见问题后重试；还支持从流式输出中增量解析，字段一生成完就能使用。
+"""
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+_CLOSERS = {'{': '}', '[': ']'}
+_OPENERS_BY_TYPE = {dict: '{', list: '['}
+
+# 中文引号出现在这些符号之后时作为字符串的开始引号，其后只有空白和这些符号时作为结束引号
+_CN_QUOTES = set('“”')
+_BEFORE_CN_OPEN_QUOTE = set('{[,:：，')
+_AFTER_CN_CLOSE_QUOTE = re.compile(r'\s*(?:[:：,，}\]]|$)')
+# 值位置上带单位或满分的数字，如 8分、8/10、85%
+_NUMBER_WITH_SUFFIX = re.compile(r'(:\s*-?\d+(?:\.\d+)?)\s*(?:分|%|/\s*\d+(?:\.\d+)?)')
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+
+def _repair_outside_strings(segment: str) -> str:
+    segment = segment.replace('：', ':').replace('，', ',')
+    segment = _NUMBER_WITH_SUFFIX.sub(r'\1', segment)
+    return _TRAILING_COMMA.sub(r'\1', segment)
+
+def _string_end(text: str, start: int) -> int:
+    """返回 start 处的双引号开始的字符串之后的位置，字符串不完整时返回文本长度"""
+    escaped = False
+    for pos in range(start + 1, len(text)):
+        char = text[pos]
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '"':
+            return pos + 1
+    return len(text)
+
+def _previous_char(text: str, pos: int) -> str:
+    """pos 之前第一个非空白字符"""
+    pos -= 1
+    while pos >= 0 and text[pos].isspace():
+        pos -= 1
+    return text[pos] if pos >= 0 else ''
+
+def _cn_string_end(text: str, start: int) -> Optional[int]:
+    """返回 start 处的中文引号开始的字符串的结束引号位置，找不到时返回None"""
+    for pos in range(start + 1, len(text)):
+        if text[pos] in _CN_QUOTES and _AFTER_CN_CLOSE_QUOTE.match(text, pos + 1):
+            return pos
+    return None
+
+def repair_json(text: str) -> str:
+    """修复常见的JSON格式问题：中文引号定界符、中文冒号和逗号、带单位的数字、尾随逗号
+
+    只修改字符串字面量以外的部分，分析文字中的中文引号、冒号、逗号保持不变。
+    """
+    parts = []
+    segment_start = pos = 0
+    while pos < len(text):
+        char = text[pos]
+        if char == '"':
+            end = _string_end(text, pos)
+            parts.append(_repair_outside_strings(text[segment_start:pos]))
+            parts.append(text[pos:end])
+            segment_start = pos = end
+            continue
+        if char in _CN_QUOTES and _previous_char(text, pos) in _BEFORE_CN_OPEN_QUOTE:
+            end = _cn_string_end(text, pos)
+            if end is not None:
+                parts.append(_repair_outside_strings(text[segment_start:pos]))
+                parts.append('"' + text[pos + 1:end].replace('"', '\\"') + '"')
+                segment_start = pos = end + 1
+                continue
+        pos += 1
+    parts.append(_repair_outside_strings(text[segment_start:]))
+    return ''.join(parts)
+
+def _loads(candidate: str) -> Optional[Any]:
+    """解析JSON，失败时修复后重试，仍失败返回None（允许字符串中出现未转义的换行）"""
+    try:
+        return json.loads(candidate, strict=False)
+    except ValueError:
+        pass
+    try:
+        return json.loads(repair_json(candidate), strict=False)
+    except ValueError:
+        return None
+
+def _matching_end(text: str, start: int) -> Optional[int]:
+    """返回与 start 处的左括号配对的右括号之后的位置，括号不完整或不匹配时返回None"""
+    stack = []
+    in_string = escaped = False
+    for pos in range(start, len(text)):
+        char = text[pos]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+        elif char in '}]':
+            if not stack or char != stack.pop():
+                return None
+            if not stack:
+                return pos + 1
+    return None
+
+def extract_json(text: str, expect: type = None) -> Optional[Any]:
+    """从LLM的回复中提取第一个完整的JSON值
+
+    Args:
+        text: LLM返回的文本，JSON前后可以有说明文字或代码块标记
+        expect: dict 或 list，只接受该类型的JSON值；默认两者均可
+
+    Returns:
+        解析得到的对象，找不到可解析的JSON时返回None
+    """
+    if not text:
+        return None
+    openers = _OPENERS_BY_TYPE[expect] if expect else '{['
+
+    # 大多数回复本身就是合法的JSON
+    stripped = text.strip()
+    if stripped[:1] in openers:
+        try:
+            value = json.loads(stripped, strict=False)
+            if expect is None or isinstance(value, expect):
+                return value
+        except ValueError:
+            pass
+
+    pos = 0
+    while True:
+        starts = [index for index in (text.find(opener, pos) for opener in openers) if index != -1]
+        if not starts:
+            return None
+        start = min(starts)
+        end = _matching_end(text, start)
+        if end is not None:
+            value = _loads(text[start:end])
+            if value is not None and (expect is None or isinstance(value, expect)):
+                return value
+        pos = start + 1
+
+class JsonStreamExtractor:
+    """从流式输出中增量提取JSON
+
+    每次 feed() 传入新的文本片段，返回本次新完成的顶层字段（对象为 (键, 值)，
+    数组为 (序号, 元素)）。例如阅卷结果中的 score 一生成完就能显示，不必等分析全部输出。
+    字段使用中文引号等不规范写法时可能无法提前解析，finish() 仍会对完整文本做容错解析。
+    """
+
+    def __init__(self, expect: type = None):
+        """
+        Args:
+            expect: dict 或 list，只接受该类型的顶层JSON值；默认两者均可
+        """
+        self.expect = expect
+        self._openers = _OPENERS_BY_TYPE[expect] if expect else '{['
+        self.text = ''
+        self.fields = {}
+        self.items: List[Any] = []
+        self.result = None
+        self._reset(0)
+
+    def _reset(self, pos: int):
+        """从 pos 处重新查找JSON的开头"""
+        self._pos = pos
+        self._start = None
+        self._stack = []
+        self._in_string = self._escaped = False
+        self._member_start = None
+        self.fields = {}
+        self.items = []
+
+    def feed(self, chunk: str) -> List[Tuple[Any, Any]]:
+        """追加文本片段，返回新完成的顶层字段"""
+        self.text += chunk or ''
+        completed = []
+        text = self.text
+        while self._pos < len(text) and self.result is None:
+            pos = self._pos
+            char = text[pos]
+            self._pos += 1
+            if self._start is None:
+                if char in self._openers:
+                    self._start = pos
+                    self._stack = [_CLOSERS[char]]
+                    self._member_start = pos + 1
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in _CLOSERS:
+                self._stack.append(_CLOSERS[char])
+            elif char == ',' and len(self._stack) == 1:
+                self._complete_member(pos, completed)
+                self._member_start = pos + 1
+            elif char in '}]':
+                if char != self._stack[-1]:
+                    self._reset(self._start + 1)
+                    continue
+                if len(self._stack) > 1:
+                    self._stack.pop()
+                    continue
+                self._complete_member(pos, completed)
+                value = _loads(text[self._start:pos + 1])
+                if value is not None and (self.expect is None or isinstance(value, self.expect)):
+                    self.result = value
+                else:
+                    # 不是有效的JSON（例如说明文字中的括号），从下一个字符继续查找
+                    self._reset(self._start + 1)
+        return completed
+
+    def _complete_member(self, end: int, completed: List[Tuple[Any, Any]]):
+        member = self.text[self._member_start:end]
+        if not member.strip():
+            return
+        if self.text[self._start] == '{':
+            value = _loads('{' + member + '}')
+            if isinstance(value, dict):
+                for key, field in value.items():
+                    self.fields[key] = field
+                    completed.append((key, field))
+        else:
+            value = _loads('[' + member + ']')
+            if isinstance(value, list) and len(value) == 1:
+                completed.append((len(self.items), value[0]))
+                self.items.append(value[0])
+
+    def finish(self) -> Optional[Any]:
+        """输出结束后返回完整的解析结果，流式解析未得到结果时对全文做容错提取"""
+        if self.result is None:
+            self.result = extract_json(self.text, self.expect)
+        return self.result
@@ -0,0 +1,94 @@
+"""
+知识点规范化存储模块
+维护 knowledge_points 字典表、题目/答题记录与知识点之间的关联表，
+以及按学生、科目增量维护的薄弱点统计表
+"""
+import sqlite3
+from typing import Dict, Iterable, List, Tuple
+
+def _clean_names(names: Iterable) -> List[str]:
+    """去除空值和重复项，保持原有顺序"""
+    cleaned = []
+    seen = set()
+    for name in names or []:
+        name = str(name).strip()
+        if name and name not in seen:
+            seen.add(name)
+            cleaned.append(name)
+    return cleaned
+
+def get_point_ids(conn: sqlite3.Connection, names: Iterable[str]) -> Dict[str, int]:
+    """获取知识点ID，不存在的知识点会自动创建"""
+    names = _clean_names(names)
+    if not names:
+        return {}
+    conn.executemany('INSERT OR IGNORE INTO knowledge_points (name) VALUES (?)',
+                     [(name,) for name in names])
+    point_ids = {}
+    # 分批查询，避免超过 SQLite 的参数数量上限
+    for start in range(0, len(names), 500):
+        batch = names[start:start + 500]
+        placeholders = ','.join('?' * len(batch))
+        rows = conn.execute(f'SELECT name, id FROM knowledge_points WHERE name IN ({placeholders})',
+                            batch)
+        point_ids.update(rows)
+    return point_ids
+
+def link_points(conn: sqlite3.Connection, table: str, owner_column: str,
+                pairs: List[Tuple[int, Iterable[str]]]):
+    """批量写入关联表
+
+    Args:
+        table: 关联表名（question_knowledge_points 或 answer_weak_points）
+        owner_column: 关联表中指向题目/答题记录的列名
+        pairs: [(题目ID或答题记录ID, 知识点名称列表), ...]
+    """
+    pairs = [(owner_id, _clean_names(names)) for owner_id, names in pairs]
+    point_ids = get_point_ids(conn, (name for _, names in pairs for name in names))
+    rows = [(owner_id, point_ids[name]) for owner_id, names in pairs for name in names]
+    if rows:
+        conn.executemany(f'INSERT OR IGNORE INTO {table} ({owner_column}, knowledge_point_id) '
+                         f'VALUES (?, ?)', rows)
+
+def link_question_points(conn: sqlite3.Connection, pairs: List[Tuple[int, Iterable[str]]]):
+    """写入题目与知识点的关联"""
+    link_points(conn, 'question_knowledge_points', 'question_id', pairs)
+
+def link_answer_weak_points(conn: sqlite3.Connection, pairs: List[Tuple[int, Iterable[str]]]):
+    """写入答题记录与薄弱知识点的关联"""
+    link_points(conn, 'answer_weak_points', 'answer_id', pairs)
+
+def record_weak_point_stats(conn: sqlite3.Connection, exam_id: int, names: Iterable[str]):
+    """在学生薄弱点统计表中为本次答题出现的薄弱点计数加一"""
+    rows = [(name, exam_id) for name in _clean_names(names)]
+    if not rows:
+        return
+    conn.executemany('''
+        INSERT INTO student_weak_point_stats (student_id, subject, point, count, last_seen)
+        SELECT student_id, subject, ?, 1, CURRENT_TIMESTAMP
+        FROM exams
+        WHERE id = ? AND student_id IS NOT NULL
+        ON CONFLICT (student_id, subject, point)
+        DO UPDATE SET count = count + 1, last_seen = excluded.last_seen
+    ''', rows)
+
+def rebuild_weak_point_stats(conn: sqlite3.Connection, student_id: int = None) -> int:
+    """根据答题记录重新计算学生薄弱点统计，返回写入的统计行数"""
+    if student_id is None:
+        student_filter, params = '', ()
+        conn.execute('DELETE FROM student_weak_point_stats')
+    else:
+        student_filter, params = 'AND e.student_id = ?', (student_id,)
+        conn.execute('DELETE FROM student_weak_point_stats WHERE student_id = ?', params)
+
+    cursor = conn.execute(f'''
+        INSERT INTO student_weak_point_stats (student_id, subject, point, count, last_seen)
+        SELECT e.student_id, e.subject, kp.name, COUNT(*), MAX(a.answered_at)
+        FROM answer_weak_points w
+        JOIN answers a ON a.id = w.answer_id
+        JOIN exams e ON e.id = a.exam_id
+        JOIN knowledge_points kp ON kp.id = w.knowledge_point_id
+        WHERE e.student_id IS NOT NULL {student_filter}
+        GROUP BY e.student_id, e.subject, kp.name
+    ''', params)
+    return cursor.rowcount
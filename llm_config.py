@@ -3,10 +3,59 @@ LLM模型配置管理
 支持 Qwen3 和 Gemini 模型的配置和切换
 """
 import os
+import asyncio
+import atexit
+import hashlib
+import threading
+import weakref
 from enum import Enum
-from typing import Dict, Any
+from typing import Dict, Any, Tuple
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
+from rate_limiter import RateLimitedLLM, get_provider_limiter
+
+try:
+    import httpx
+except ImportError:  # httpx 随 openai 一起安装，缺失时使用 SDK 默认连接池
+    httpx = None
+
+if httpx is not None:
+    class LoopLocalAsyncClient(httpx.AsyncClient):
+        """按事件循环分别建立连接池的异步HTTP客户端
+        
+        httpx 的连接属于创建它的事件循环，每次 asyncio.run 都是新的事件循环，
+        复用上一个循环的连接会出现 "Event loop is closed"。本客户端把请求交给当前事件循环
+        专用的 AsyncClient，同一个循环内仍然复用长连接，循环关闭后丢弃其连接池。
+        """
+        
+        def __init__(self, **options):
+            super().__init__(**options)
+            self._options = options
+            self._loop_clients = weakref.WeakKeyDictionary()
+            self._loop_lock = threading.Lock()
+        
+        def _client_for_running_loop(self) -> "httpx.AsyncClient":
+            loop = asyncio.get_running_loop()
+            with self._loop_lock:
+                for closed_loop in [item for item in self._loop_clients if item.is_closed()]:
+                    del self._loop_clients[closed_loop]
+                client = self._loop_clients.get(loop)
+                if client is None:
+                    client = self._loop_clients[loop] = httpx.AsyncClient(**self._options)
+            return client
+        
+        async def send(self, request, **kwargs):
+            return await self._client_for_running_loop().send(request, **kwargs)
+        
+        async def aclose(self):
+            """关闭当前事件循环的连接池；其他循环的连接无法在这里关闭，直接丢弃"""
+            loop = asyncio.get_running_loop()
+            with self._loop_lock:
+                client = self._loop_clients.pop(loop, None)
+                self._loop_clients.clear()
+            if client is not None:
+                await client.aclose()
+            await super().aclose()
 
 class LLMProvider(Enum):
     """支持的LLM提供商"""
@@ -20,6 +69,10 @@ class LLMConfig:
     """LLM配置类"""
     
     # 模型配置
+    # rpm/tpm 为账号的每分钟请求数和Token数配额，超出部分在本地排队等待，请按实际配额调整
+    # escalation_model 为分级阅卷中基础模型没有把握时使用的更强模型
+    # structured_output 为阅卷和出题使用的结构化输出方式（with_structured_output 的 method），
+    # 未配置时在提示词中要求JSON并解析文本
     MODELS = {
         LLMProvider.QWEN3: {
             "class": ChatOpenAI,
@@ -27,7 +80,11 @@ class LLMConfig:
             "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1",
             "model_name": "qwen-turbo",
             "temperature": 0.7,
-            "display_name": "通义千问 Qwen3"
+            "display_name": "通义千问 Qwen3",
+            "escalation_model": "qwen-plus",
+            "structured_output": "json_mode",
+            "rpm": 600,
+            "tpm": 1000000
         },
         # 国内Gemini
         LLMProvider.GEMINI_OPENAI: {
@@ -36,7 +93,10 @@ class LLMConfig:
             "base_url": "https://spectacular-swan-be0181.netlify.app/edge",
             "model_name": "gemini-2.0-flash",
             "temperature": 0.7,
-            "display_name": "Google Gemini"
+            "display_name": "Google Gemini",
+            "escalation_model": "gemini-2.5-pro",
+            "rpm": 15,
+            "tpm": 1000000
         },
         # 海外Gemini
         LLMProvider.GEMINI: {
@@ -44,7 +104,11 @@ class LLMConfig:
             "api_key_env": "GOOGLE_API_KEY",
             "model_name": "gemini-2.0-flash",
             "temperature": 0.7,
-            "display_name": "Google Gemini"
+            "display_name": "Google Gemini",
+            "escalation_model": "gemini-2.5-pro",
+            "structured_output": "function_calling",
+            "rpm": 15,
+            "tpm": 1000000
         }
     }
     
@@ -57,8 +121,24 @@ class LLMConfig:
         }
     
     @classmethod
-    def create_llm(cls, provider: LLMProvider, **kwargs) -> Any:
-        """创建指定的LLM实例"""
+    def create_llm(cls, provider: LLMProvider, rate_limited: bool = True, **kwargs) -> Any:
+        """创建指定的LLM实例
+        
+        Args:
+            rate_limited: 为True时按 rpm/tpm 配额限流，并由限流层对临时错误做指数退避重试
+        """
+        llm = cls._create_raw_llm(provider, max_retries=0 if rate_limited else None, **kwargs)
+        if not rate_limited:
+            return llm
+        config = {**cls.MODELS[provider], **kwargs}
+        # 配额按模型计算，同一提供商的不同模型（如基础模型和升级模型）分别限流
+        limiter = get_provider_limiter(f"{provider.value}/{config['model_name']}",
+                                       config.get("rpm"), config.get("tpm"))
+        return RateLimitedLLM(llm, limiter)
+    
+    @classmethod
+    def _create_raw_llm(cls, provider: LLMProvider, max_retries: int = None, **kwargs) -> Any:
+        """创建未经包装的LLM实例"""
         if provider not in cls.MODELS:
             raise ValueError(f"不支持的LLM提供商: {provider}")
         
@@ -71,16 +151,28 @@ class LLMConfig:
         if not api_key:
             raise ValueError(f"未设置API密钥环境变量: {api_key_env}")
         
+        # 共享的HTTP连接池（仅OpenAI兼容接口支持），同步和异步调用各用一个
+        http_options = {}
+        for name in ("http_client", "http_async_client"):
+            client = kwargs.pop(name, None)
+            if client is not None:
+                http_options[name] = client
+        
         # 合并用户自定义参数
         config.update(kwargs)
         
+        # 由限流层负责重试时关闭SDK自带的重试，避免重试次数叠加
+        retry_options = {"max_retries": max_retries} if max_retries is not None else {}
+        
         # 根据不同的LLM类型创建实例
         if provider == LLMProvider.QWEN3:
             return llm_class(
                 api_key=api_key,
                 base_url=config["base_url"],
                 model=config["model_name"],
-                temperature=config["temperature"]
+                temperature=config["temperature"],
+                **http_options,
+                **retry_options
             )
         # 国内Gemini
         elif provider == LLMProvider.GEMINI_OPENAI:
@@ -88,14 +180,17 @@ class LLMConfig:
                 api_key=api_key,
                 base_url=config["base_url"],
                 model=config["model_name"],
-                temperature=config["temperature"]
+                temperature=config["temperature"],
+                **http_options,
+                **retry_options
             )
         # 海外Gemini
         elif provider == LLMProvider.GEMINI:
             return llm_class(
                 google_api_key=api_key,
                 model=config["model_name"],
-                temperature=config["temperature"]
+                temperature=config["temperature"],
+                **retry_options
             )
     
     @classmethod
@@ -107,14 +202,115 @@ class LLMConfig:
             results[provider.value] = bool(os.getenv(api_key_env))
         return results
 
-def get_llm_by_name(provider_name: str, **kwargs) -> Any:
-    """根据提供商名称获取LLM实例"""
+class LLMClientRegistry:
+    """共享LLM客户端注册表
+    
+    按 (提供商, 模型, temperature, base_url, API密钥, 其他创建参数) 缓存LLM实例，同一进程内的
+    多个教学会话复用同一个客户端及其HTTP长连接（同步调用一个连接池，异步调用每个事件循环
+    一个连接池），避免重复建立TCP/TLS连接。
+    客户端本身是线程安全的，可在多线程中并发调用。
+    """
+    
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 120.0, timeout: float = 60.0):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self._clients: Dict[Tuple, Any] = {}
+        self._http_clients: Dict[Tuple, Any] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, provider: LLMProvider, **kwargs) -> Any:
+        """获取共享的LLM实例，不存在时创建"""
+        if provider not in LLMConfig.MODELS:
+            raise ValueError(f"不支持的LLM提供商: {provider}")
+        config = {**LLMConfig.MODELS[provider], **kwargs}
+        api_key = os.getenv(config["api_key_env"]) or ""
+        # 其他创建参数（如 rate_limited=False）不同的实例不能共用
+        extra = {name: value for name, value in kwargs.items()
+                 if name not in ("model_name", "temperature", "base_url")}
+        extra.setdefault("rate_limited", True)
+        key = (provider, config["model_name"], config["temperature"], config.get("base_url"),
+               hashlib.sha256(api_key.encode()).hexdigest(),
+               tuple(sorted((name, repr(value)) for name, value in extra.items())))
+        
+        with self._lock:
+            llm = self._clients.get(key)
+            if llm is None:
+                http_client, http_async_client = self._get_http_clients(config.get("base_url"))
+                llm = LLMConfig.create_llm(provider, http_client=http_client,
+                                           http_async_client=http_async_client, **kwargs)
+                self._clients[key] = llm
+            return llm
+    
+    def _get_http_clients(self, base_url: str) -> Tuple[Any, Any]:
+        """同一个服务地址的所有模型共用一对带长连接的HTTP连接池（同步、异步）"""
+        if httpx is None or base_url is None:
+            return None, None
+        http_clients = self._http_clients.get(base_url)
+        if http_clients is None:
+            options = dict(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=10.0)
+            )
+            http_clients = (httpx.Client(**options), LoopLocalAsyncClient(**options))
+            self._http_clients[base_url] = http_clients
+        return http_clients
+    
+    def close(self):
+        """关闭所有HTTP连接池并清空缓存的客户端"""
+        with self._lock:
+            http_clients = list(self._http_clients.values())
+            self._http_clients.clear()
+            self._clients.clear()
+        for http_client, http_async_client in http_clients:
+            http_client.close()
+            self._close_async_client(http_async_client)
+    
+    @staticmethod
+    def _close_async_client(http_async_client: Any):
+        """关闭异步连接池：在事件循环中调用时交给该循环执行，否则新建循环执行"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        try:
+            if loop is not None:
+                loop.create_task(http_async_client.aclose())
+            else:
+                asyncio.run(http_async_client.aclose())
+        except Exception as e:
+            # 连接所属的事件循环已关闭时无法正常关闭，进程退出时由系统回收
+            print(f"⚠️  关闭异步HTTP连接池出错: {e}")
+
+# 进程级共享注册表，进程退出时自动关闭连接
+llm_registry = LLMClientRegistry()
+atexit.register(llm_registry.close)
+
+def get_llm_by_name(provider_name: str, shared: bool = True, **kwargs) -> Any:
+    """根据提供商名称获取LLM实例
+    
+    Args:
+        provider_name: 提供商名称
+        shared: 为True时从共享注册表获取（复用连接），为False时创建独立实例
+    """
     try:
         provider = LLMProvider(provider_name)
+        if shared:
+            return llm_registry.get(provider, **kwargs)
         return LLMConfig.create_llm(provider, **kwargs)
     except ValueError as e:
         raise ValueError(f"无法创建LLM实例: {e}")
 
+def shutdown_llm_clients() -> None:
+    """关闭共享的LLM客户端及其HTTP连接"""
+    llm_registry.close()
+
 def list_available_models() -> None:
     """列出所有可用的模型"""
     print("支持的LLM模型:")
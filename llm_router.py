@@ -0,0 +1,500 @@
+"""
+多模型路由模块
+按任务类型（出题、阅卷、辅导报告）分别统计各模型的延迟和错误率（指数加权移动平均），
+每次请求发给当前得分最好的模型，并以小概率随机探索其他模型；
+主模型在历史延迟的高分位时间内没有返回时，向备用模型发出一份对冲请求，采用先返回的结果；
+模型连续出错时熔断，请求自动转移到其他模型
+"""
+import asyncio
+import copy
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+class LatencyTracker:
+    """记录最近若干次成功请求的耗时，用于计算对冲等待时间"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """第 p 百分位的耗时，没有样本时返回None"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * p / 100))
+        return samples[index]
+
+class ProviderStats:
+    """某个模型在某类任务上的指数加权移动平均延迟和错误率"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self.routed = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float = None, error: bool = False):
+        with self._lock:
+            self.samples += 1
+            self.error_rate += self.alpha * ((1.0 if error else 0.0) - self.error_rate)
+            if not error:
+                self.latency = seconds if self.latency is None else \
+                    self.latency + self.alpha * (seconds - self.latency)
+
+    def record_routed(self):
+        with self._lock:
+            self.routed += 1
+
+    def score(self) -> Optional[float]:
+        """每次成功请求的期望耗时，越小越好；还没有成功样本时返回None"""
+        with self._lock:
+            if self.latency is None:
+                return None
+            return self.latency / max(0.05, 1.0 - self.error_rate)
+
+    def snapshot(self) -> Dict:
+        score = self.score()
+        with self._lock:
+            return {
+                'latency_ewma': self.latency,
+                'error_rate': self.error_rate,
+                'samples': self.samples,
+                'routed': self.routed,
+                'score': score
+            }
+
+class CircuitBreaker:
+    """熔断器：连续失败 failure_threshold 次后熔断 cooldown 秒，之后放行一次试探请求"""
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = self.clock()
+            if now - self.opened_at >= self.cooldown:
+                # 半开状态：放行一次请求，失败则重新计时
+                self.opened_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.opened_at is not None
+
+# 未指定任务类型的请求归入默认任务
+DEFAULT_TASK = 'default'
+
+# 路由器在回复的 response_metadata 中记录实际给出结果的提供商
+SERVED_BY_KEY = 'routed_provider'
+
+def _mark_served_by(response: Any, name: str) -> Any:
+    metadata = getattr(response, 'response_metadata', None)
+    if isinstance(metadata, dict):
+        metadata[SERVED_BY_KEY] = name
+    return response
+
+def served_by(response: Any) -> Optional[str]:
+    """经路由器得到的回复实际来自哪个提供商；没有经过路由或回复无法标记时返回None"""
+    metadata = getattr(response, 'response_metadata', None)
+    return metadata.get(SERVED_BY_KEY) if isinstance(metadata, dict) else None
+
+class RoutingLLM:
+    """在多个LLM之间自适应选择、对冲和故障转移的路由器
+
+    providers 的顺序为初始优先级。adaptive 为True时，每类任务按该任务上各模型的
+    加权平均延迟和错误率排序（还没有样本的模型排在后面，保持配置顺序），
+    并以 exploration_rate 的概率把其他模型临时提为主模型，以便发现变快的模型。
+    invoke/ainvoke：主模型超过对冲等待时间仍未返回时向下一个模型发出对冲请求，
+    先成功返回的结果生效，异步调用会取消落后的请求；同步调用无法中断正在进行的
+    HTTP请求，落后的请求在后台结束后结果被丢弃。请求失败时立即转移到下一个模型。
+    stream/astream：不做对冲，只在尚未输出任何内容时转移到下一个模型。
+    stream_fields：带回调的结构化流式请求（见 StructuredOutputLLM），不做对冲，出错时转移到下一个模型。
+    回复（流式请求的每个片段）的 response_metadata 中记录实际给出结果的提供商，见 served_by。
+    """
+
+    def __init__(self, providers: List[Tuple[str, Any]], hedge_percentile: float = 95,
+                 min_hedge_delay: float = 0.5, default_hedge_delay: float = 5.0,
+                 min_samples: int = 10, failure_threshold: int = 3, cooldown: float = 30.0,
+                 max_workers: int = 8, adaptive: bool = True, exploration_rate: float = 0.05,
+                 ewma_alpha: float = 0.2, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            providers: [(提供商名称, LLM实例), ...]，按优先级排列
+            hedge_percentile: 按主模型历史耗时的该百分位确定对冲等待时间
+            min_hedge_delay: 对冲等待时间下限（秒）
+            default_hedge_delay: 样本不足 min_samples 时使用的对冲等待时间（秒）
+            failure_threshold: 连续失败多少次后熔断
+            cooldown: 熔断持续时间（秒）
+            max_workers: 同步调用使用的线程数
+            adaptive: 是否按实时延迟和错误率选择主模型
+            exploration_rate: 随机选择非最优模型作为主模型的概率
+            ewma_alpha: 加权移动平均的平滑系数，越大越偏重最近的请求
+            clock: 计时函数，用于统计耗时和熔断计时，测试时可替换
+        """
+        if not providers:
+            raise ValueError("至少需要一个LLM提供商")
+        self.providers = list(providers)
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.min_samples = min_samples
+        self.adaptive = adaptive
+        self.exploration_rate = exploration_rate
+        self.ewma_alpha = ewma_alpha
+        self.clock = clock
+        self.breakers = {name: CircuitBreaker(failure_threshold, cooldown, clock)
+                         for name, _ in self.providers}
+        # 按 (任务类型, 提供商) 统计
+        self.latency: Dict[Tuple[str, str], LatencyTracker] = {}
+        self.task_stats: Dict[Tuple[str, str], ProviderStats] = {}
+        self.counters = {'requests': 0, 'hedges': 0, 'hedge_wins': 0, 'failovers': 0,
+                         'explorations': 0}
+        self._counter_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='llm-router')
+
+    @property
+    def primary_provider(self) -> str:
+        return self.providers[0][0]
+
+    def for_task(self, task: str) -> 'TaskRouter':
+        """绑定任务类型，返回的对象与LLM实例用法相同"""
+        return TaskRouter(self, task)
+
+    def _count(self, name: str):
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def _tracker(self, task: str, name: str) -> LatencyTracker:
+        with self._stats_lock:
+            return self.latency.setdefault((task, name), LatencyTracker())
+
+    def _provider_stats(self, task: str, name: str) -> ProviderStats:
+        with self._stats_lock:
+            stats = self.task_stats.get((task, name))
+            if stats is None:
+                stats = self.task_stats[(task, name)] = ProviderStats(self.ewma_alpha)
+            return stats
+
+    def _candidates(self, task: str) -> List[Tuple[str, Any]]:
+        """本次请求的模型尝试顺序，第一个为主模型；全部熔断时仍按配置顺序尝试"""
+        candidates = [(name, llm) for name, llm in self.providers
+                      if self.breakers[name].allow()] or list(self.providers)
+        if self.adaptive and len(candidates) > 1:
+            # 有样本的模型按得分排序，没有样本的排在后面并保持配置顺序
+            scores = {name: self._provider_stats(task, name).score() for name, _ in candidates}
+            candidates.sort(key=lambda item: (scores[item[0]] is None, scores[item[0]] or 0.0))
+            if random.random() < self.exploration_rate:
+                explored = candidates.pop(random.randrange(1, len(candidates)))
+                candidates.insert(0, explored)
+                self._count('explorations')
+        self._provider_stats(task, candidates[0][0]).record_routed()
+        return candidates
+
+    def hedge_delay(self, provider_name: str, task: str = DEFAULT_TASK) -> float:
+        """向备用模型发出对冲请求前的等待时间"""
+        tracker = self._tracker(task, provider_name)
+        if len(tracker) < self.min_samples:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, tracker.percentile(self.hedge_percentile))
+
+    def _record(self, task: str, name: str, started: float, error: Exception = None):
+        if error is None:
+            elapsed = self.clock() - started
+            self._tracker(task, name).record(elapsed)
+            self._provider_stats(task, name).record(elapsed)
+            self.breakers[name].record_success()
+        else:
+            self._provider_stats(task, name).record(error=True)
+            self.breakers[name].record_failure()
+
+    def _call(self, task: str, name: str, llm: Any, method: str, args, kwargs) -> Any:
+        started = self.clock()
+        try:
+            result = getattr(llm, method)(*args, **kwargs)
+        except Exception as e:
+            self._record(task, name, started, e)
+            raise
+        self._record(task, name, started)
+        return _mark_served_by(result, name)
+
+    async def _acall(self, task: str, name: str, llm: Any, method: str, args, kwargs) -> Any:
+        started = self.clock()
+        try:
+            result = await getattr(llm, method)(*args, **kwargs)
+        except Exception as e:
+            # 被取消的对冲请求（CancelledError）不计为失败
+            self._record(task, name, started, e)
+            raise
+        self._record(task, name, started)
+        return _mark_served_by(result, name)
+
+    def _route(self, task: str, method: str, args, kwargs) -> Any:
+        candidates = self._candidates(task)
+        self._count('requests')
+        pending: Dict[Any, str] = {}
+        next_index = 0
+        hedged = False
+        last_error = None
+
+        def launch():
+            nonlocal next_index
+            name, llm = candidates[next_index]
+            next_index += 1
+            future = self._executor.submit(self._call, task, name, llm, method, args, kwargs)
+            pending[future] = name
+
+        launch()
+        while pending:
+            timeout = None
+            if not hedged and next_index < len(candidates):
+                timeout = self.hedge_delay(candidates[0][0], task)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                self._count('hedges')
+                launch()
+                continue
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if name != candidates[0][0]:
+                    self._count('hedge_wins' if hedged else 'failovers')
+                for loser in pending:
+                    loser.cancel()
+                return result
+            if not pending and next_index < len(candidates):
+                print(f"⚠️  {name} 调用失败，切换到 {candidates[next_index][0]}: {last_error}")
+                launch()
+        raise last_error
+
+    async def _aroute(self, task: str, method: str, args, kwargs) -> Any:
+        candidates = self._candidates(task)
+        self._count('requests')
+        pending: Dict[asyncio.Task, str] = {}
+        next_index = 0
+        hedged = False
+        last_error = None
+
+        def launch():
+            nonlocal next_index
+            name, llm = candidates[next_index]
+            next_index += 1
+            future = asyncio.ensure_future(self._acall(task, name, llm, method, args, kwargs))
+            pending[future] = name
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if not hedged and next_index < len(candidates):
+                    timeout = self.hedge_delay(candidates[0][0], task)
+                done, _ = await asyncio.wait(pending, timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self._count('hedges')
+                    launch()
+                    continue
+                for future in done:
+                    name = pending.pop(future)
+                    if future.exception() is not None:
+                        last_error = future.exception()
+                        continue
+                    if name != candidates[0][0]:
+                        self._count('hedge_wins' if hedged else 'failovers')
+                    return future.result()
+                if not pending and next_index < len(candidates):
+                    print(f"⚠️  {name} 调用失败，切换到 {candidates[next_index][0]}: {last_error}")
+                    launch()
+            raise last_error
+        finally:
+            # 取消落后的对冲请求
+            for future in pending:
+                future.cancel()
+
+    def _call_in_order(self, task: str, method: str, args, kwargs) -> Any:
+        """按尝试顺序逐个调用，出错时转移到下一个模型；不做对冲，用于带回调、不能同时执行两份的请求"""
+        self._count('requests')
+        last_error = None
+        for index, (name, llm) in enumerate(self._candidates(task)):
+            try:
+                result = self._call(task, name, llm, method, args, kwargs)
+            except Exception as e:
+                last_error = e
+                continue
+            if index:
+                self._count('failovers')
+            return result
+        raise last_error
+
+    def _stream(self, task: str, args, kwargs):
+        self._count('requests')
+        last_error = None
+        for index, (name, llm) in enumerate(self._candidates(task)):
+            started = self.clock()
+            produced = False
+            try:
+                for chunk in llm.stream(*args, **kwargs):
+                    produced = True
+                    yield _mark_served_by(chunk, name)
+            except Exception as e:
+                self._record(task, name, started, e)
+                if produced:
+                    raise
+                last_error = e
+                continue
+            self._record(task, name, started)
+            if index:
+                self._count('failovers')
+            return
+        raise last_error
+
+    async def _astream(self, task: str, args, kwargs):
+        self._count('requests')
+        last_error = None
+        for index, (name, llm) in enumerate(self._candidates(task)):
+            started = self.clock()
+            produced = False
+            try:
+                async for chunk in llm.astream(*args, **kwargs):
+                    produced = True
+                    yield _mark_served_by(chunk, name)
+            except Exception as e:
+                self._record(task, name, started, e)
+                if produced:
+                    raise
+                last_error = e
+                continue
+            self._record(task, name, started)
+            if index:
+                self._count('failovers')
+            return
+        raise last_error
+
+    def invoke(self, *args, **kwargs) -> Any:
+        return self._route(DEFAULT_TASK, 'invoke', args, kwargs)
+
+    async def ainvoke(self, *args, **kwargs) -> Any:
+        return await self._aroute(DEFAULT_TASK, 'ainvoke', args, kwargs)
+
+    def stream(self, *args, **kwargs):
+        return self._stream(DEFAULT_TASK, args, kwargs)
+
+    def astream(self, *args, **kwargs):
+        return self._astream(DEFAULT_TASK, args, kwargs)
+
+    def stream_fields(self, *args, **kwargs) -> Any:
+        return self._call_in_order(DEFAULT_TASK, 'stream_fields', args, kwargs)
+
+    def map_providers(self, wrap: Callable[[str, Any], Any]) -> 'RoutingLLM':
+        """用 wrap(提供商名称, LLM) 包装每个模型，返回与本路由器共享统计和熔断状态的新路由器"""
+        # 浅拷贝共享延迟统计、熔断状态和线程池，不会另建线程池
+        router = copy.copy(self)
+        router.providers = [(name, wrap(name, llm)) for name, llm in self.providers]
+        return router
+
+    def with_structured_output(self, *args, **kwargs) -> 'RoutingLLM':
+        """各模型的结构化输出同样参与路由、对冲和故障转移"""
+        return self.map_providers(lambda name, llm: llm.with_structured_output(*args, **kwargs))
+
+    def stats(self) -> Dict:
+        """路由统计：对冲、故障转移和探索次数，各模型的熔断状态，
+        以及每类任务上各模型的加权平均延迟、错误率、得分、作为主模型的次数和延迟分位数"""
+        with self._counter_lock:
+            stats = dict(self.counters)
+        stats['circuit_open'] = {name: self.breakers[name].is_open for name, _ in self.providers}
+        with self._stats_lock:
+            keys = sorted(self.task_stats)
+        tasks: Dict[str, Dict] = {}
+        for task, name in keys:
+            provider_stats = self._provider_stats(task, name).snapshot()
+            tracker = self._tracker(task, name)
+            provider_stats['p50'] = tracker.percentile(50)
+            provider_stats['p95'] = tracker.percentile(95)
+            tasks.setdefault(task, {})[name] = provider_stats
+        stats['tasks'] = tasks
+        return stats
+
+class TaskRouter:
+    """绑定了任务类型的路由器视图，请求的统计和模型选择按该任务类型进行"""
+
+    def __init__(self, router: RoutingLLM, task: str):
+        self.router = router
+        self.task = task
+
+    def invoke(self, *args, **kwargs) -> Any:
+        return self.router._route(self.task, 'invoke', args, kwargs)
+
+    async def ainvoke(self, *args, **kwargs) -> Any:
+        return await self.router._aroute(self.task, 'ainvoke', args, kwargs)
+
+    def stream(self, *args, **kwargs):
+        return self.router._stream(self.task, args, kwargs)
+
+    def astream(self, *args, **kwargs):
+        return self.router._astream(self.task, args, kwargs)
+
+    def stream_fields(self, *args, **kwargs) -> Any:
+        return self.router._call_in_order(self.task, 'stream_fields', args, kwargs)
+
+    def map_providers(self, wrap: Callable[[str, Any], Any]) -> 'TaskRouter':
+        return self.router.map_providers(wrap).for_task(self.task)
+
+    def with_structured_output(self, *args, **kwargs) -> 'TaskRouter':
+        return self.router.with_structured_output(*args, **kwargs).for_task(self.task)
+
+def create_routing_llm(provider_names: List[str], **kwargs) -> RoutingLLM:
+    """按优先级创建路由器，缺少API密钥等无法初始化的备用模型会被跳过"""
+    from llm_config import get_llm_by_name
+
+    providers = []
+    for index, provider_name in enumerate(provider_names):
+        try:
+            providers.append((provider_name, get_llm_by_name(provider_name)))
+        except Exception as e:
+            if index == 0:
+                raise
+            print(f"⚠️  备用模型 {provider_name} 初始化失败，已跳过: {e}")
+    return RoutingLLM(providers, **kwargs)
@@ -149,9 +149,13 @@ def admin_menu(admin_tools: AdminTools):
         print("1. 添加题目")
         print("2. 查看题库")
         print("3. 初始化示例数据")
-        print("4. 返回主菜单")
+        print("4. 重建薄弱点统计")
+        print("5. 搜索题目")
+        print("6. 查看模型路由统计")
+        print("7. AI批量出题")
+        print("8. 返回主菜单")
         
-        choice = input("请选择功能 (1-4): ").strip()
+        choice = input("请选择功能 (1-8): ").strip()
         
         if choice == '1':
             admin_tools.add_question_interactive()
@@ -161,6 +165,14 @@ def admin_menu(admin_tools: AdminTools):
         elif choice == '3':
             init_sample_data(admin_tools)
         elif choice == '4':
+            admin_tools.rebuild_weak_point_stats()
+        elif choice == '5':
+            admin_tools.search_questions_interactive()
+        elif choice == '6':
+            admin_tools.show_routing_stats()
+        elif choice == '7':
+            admin_tools.generate_questions_interactive()
+        elif choice == '8':
             break
         else:
             print("无效选择，请重新输入")
@@ -194,9 +206,13 @@ def student_menu(system: IntelligentTutoringSystem):
             if exam_id:
                 # 生成个性化辅导报告
                 print("\n" + "="*60)
-                report = system.generate_final_report(exam_id)
-                print(report)
-                print("="*60)
+                # 边生成边显示，不必等待整篇报告完成
+                report_chunks = []
+                for chunk in system.stream_final_report(exam_id):
+                    print(chunk, end="", flush=True)
+                    report_chunks.append(chunk)
+                report = "".join(report_chunks)
+                print("\n" + "="*60)
                 
                 # 询问是否保存报告
                 save_report = input("\n是否将报告保存到文件? (y/n): ").strip().lower()
@@ -230,7 +246,11 @@ def main():
     try:
         # 初始化系统
         print(f"\n正在初始化系统 (使用 {LLMConfig.MODELS[LLMProvider(selected_model)]['display_name']})...")
-        system = IntelligentTutoringSystem(llm_provider=selected_model)
+        # 其他已配置API密钥的模型作为备用，主模型响应慢或出错时自动切换
+        fallback_providers = [provider for provider, has_key in LLMConfig.validate_api_keys().items()
+                              if has_key and provider != selected_model]
+        system = IntelligentTutoringSystem(llm_provider=selected_model,
+                                           fallback_providers=fallback_providers)
         admin_tools = AdminTools(system)
         print("系统初始化完成！")
         
@@ -0,0 +1,205 @@
+"""
+数据库结构迁移模块
+通过 schema_version 表记录已执行的迁移，打开旧的数据库文件时自动就地升级
+"""
+import json
+import sqlite3
+from typing import Callable, List, Tuple
+from knowledge_points import (link_question_points, link_answer_weak_points,
+                              rebuild_weak_point_stats)
+import question_search
+import question_dedup
+
+def _add_core_indexes(conn: sqlite3.Connection):
+    """为高频查询添加二级索引"""
+    # get_exam_results：按考试查询答题记录
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_answers_exam_id ON answers (exam_id)')
+    # get_student_weak_points：按学生和科目查询考试
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_exams_student_subject ON exams (student_id, subject)')
+    # 按科目、难度筛选题目
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_questions_subject_difficulty ON questions (subject, difficulty)')
+
+def _backfill_json_points(conn: sqlite3.Connection, select_sql: str, link: Callable):
+    """把 JSON 文本列中的知识点分批回填到关联表"""
+    cursor = conn.execute(select_sql)
+    while True:
+        rows = cursor.fetchmany(5000)
+        if not rows:
+            break
+        pairs = []
+        for owner_id, points_json in rows:
+            try:
+                points = json.loads(points_json) if points_json else []
+            except json.JSONDecodeError:
+                continue
+            if isinstance(points, list):
+                pairs.append((owner_id, points))
+        link(conn, pairs)
+
+def _normalize_knowledge_points(conn: sqlite3.Connection):
+    """新增知识点字典表和关联表，并从 JSON 列回填数据"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS knowledge_points (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS question_knowledge_points (
+            question_id INTEGER NOT NULL,
+            knowledge_point_id INTEGER NOT NULL,
+            PRIMARY KEY (question_id, knowledge_point_id),
+            FOREIGN KEY (question_id) REFERENCES questions (id),
+            FOREIGN KEY (knowledge_point_id) REFERENCES knowledge_points (id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS answer_weak_points (
+            answer_id INTEGER NOT NULL,
+            knowledge_point_id INTEGER NOT NULL,
+            PRIMARY KEY (answer_id, knowledge_point_id),
+            FOREIGN KEY (answer_id) REFERENCES answers (id),
+            FOREIGN KEY (knowledge_point_id) REFERENCES knowledge_points (id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_question_knowledge_points_point
+                    ON question_knowledge_points (knowledge_point_id)''')
+    
+    _backfill_json_points(conn, 'SELECT id, knowledge_points FROM questions', link_question_points)
+    _backfill_json_points(conn, 'SELECT id, weak_points FROM answers', link_answer_weak_points)
+
+def _add_weak_point_stats(conn: sqlite3.Connection):
+    """新增按学生、科目增量维护的薄弱点统计表，并根据历史答题记录初始化"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS student_weak_point_stats (
+            student_id INTEGER NOT NULL,
+            subject TEXT NOT NULL,
+            point TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            last_seen TIMESTAMP,
+            PRIMARY KEY (student_id, subject, point)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_weak_point_stats_rank
+                    ON student_weak_point_stats (student_id, subject, count DESC)''')
+    rebuild_weak_point_stats(conn)
+
+def _add_question_fts(conn: sqlite3.Connection):
+    """新增题库全文索引（SQLite 不支持 FTS5 时跳过，检索退化为模糊匹配）"""
+    if question_search.create_fts_table(conn):
+        question_search.rebuild_index(conn)
+
+def _add_question_keyset_index(conn: sqlite3.Connection):
+    """按科目分页浏览题库时使用的 (subject, id) 索引"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_questions_subject_id ON questions (subject, id)')
+
+def _add_grading_cache(conn: sqlite3.Connection):
+    """新增阅卷结果缓存表"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS grading_cache (
+            cache_key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_grading_cache_last_used ON grading_cache (last_used)')
+
+def _add_question_dedup(conn: sqlite3.Connection):
+    """新增题目指纹列（唯一索引）和近似重复检索表
+
+    已有数据中的重复题目只有ID最小的一道写入指纹，其余保持 NULL，不影响已有的答题记录。
+    """
+    conn.execute('ALTER TABLE questions ADD COLUMN fingerprint TEXT')
+    _backfill_question_fingerprints(conn)
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_questions_fingerprint ON questions (fingerprint)')
+    question_dedup.create_lsh_table(conn)
+    question_dedup.rebuild_lsh_index(conn)
+
+def _backfill_question_fingerprints(conn: sqlite3.Connection):
+    """按当前的规范化规则计算所有题目的指纹，重复题目只有ID最小的一道写入指纹"""
+    seen = set()
+    updates = []
+    # 遍历结束后再统一更新，避免边读边改同一张表
+    for question_id, subject, question in conn.execute(
+            'SELECT id, subject, question FROM questions ORDER BY id'):
+        fingerprint = question_dedup.question_fingerprint(subject, question)
+        if fingerprint not in seen:
+            seen.add(fingerprint)
+            updates.append((fingerprint, question_id))
+    # 先全部清空，重新计算时新旧指纹不会在唯一索引上冲突
+    conn.execute('UPDATE questions SET fingerprint = NULL')
+    conn.executemany('UPDATE questions SET fingerprint = ? WHERE id = ?', updates)
+
+def _recompute_question_fingerprints(conn: sqlite3.Connection):
+    """题目规范化改为保留括号、小数点、分数线和百分号后，重新计算指纹和近似重复索引
+
+    按旧规则计算的指纹会把 "(3+5)×2=?" 与 "3+5×2=?"、"1.5+2=?" 与 "15+2=?" 视为同一道题。
+    """
+    _backfill_question_fingerprints(conn)
+    question_dedup.rebuild_lsh_index(conn)
+
+def _add_semantic_grading_cache(conn: sqlite3.Connection):
+    """新增语义阅卷缓存表（按题目范围保存已评分的答案）"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS semantic_grading_cache (
+            id INTEGER PRIMARY KEY,
+            scope TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_semantic_grading_cache_scope '
+                 'ON semantic_grading_cache (scope, id)')
+
+# 迁移列表：(版本号, 说明, 迁移函数)，版本号必须递增，已发布的迁移不要修改
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "添加答题、考试、题目的二级索引", _add_core_indexes),
+    (2, "知识点与薄弱点规范化存储", _normalize_knowledge_points),
+    (3, "学生薄弱点增量统计表", _add_weak_point_stats),
+    (4, "题库全文索引", _add_question_fts),
+    (5, "题库按科目分页索引", _add_question_keyset_index),
+    (6, "阅卷结果缓存表", _add_grading_cache),
+    (7, "题目查重指纹与近似重复索引", _add_question_dedup),
+    (8, "语义阅卷缓存表", _add_semantic_grading_cache),
+    (9, "题目指纹保留括号、小数点等有含义的符号", _recompute_question_fingerprints),
+]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """获取数据库当前的结构版本号"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+def apply_migrations(conn: sqlite3.Connection) -> List[int]:
+    """执行所有未应用的迁移，返回本次执行的版本号列表
+
+    每个迁移在独立的事务中执行，失败时回滚该迁移并抛出异常。
+    """
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+
+        # IMMEDIATE 事务获取写锁，多个进程同时打开数据库时只有一个会执行迁移
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            migrate(conn)
+            conn.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                         (version, description))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
@@ -0,0 +1,173 @@
+"""
+题库抽题与缓存模块
+在内存中按 (科目, 难度) 维护题目ID列表，抽题时无需对整张表排序；
+并缓存解析后的题目，避免每次考试都查询数据库、重复解析知识点JSON
+"""
+import json
+import random
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Iterable, Optional, Tuple
+
+QUESTION_COLUMNS = 'id, subject, difficulty, question, standard_answer, knowledge_points'
+
+def question_from_row(row: Tuple) -> Dict:
+    """把按 QUESTION_COLUMNS 顺序查询的一行数据转换为题目字典"""
+    return {
+        'id': row[0],
+        'subject': row[1],
+        'difficulty': row[2],
+        'question': row[3],
+        'standard_answer': row[4],
+        'knowledge_points': json.loads(row[5]) if row[5] else []
+    }
+
+class QuestionSampler:
+    """题目ID索引与随机抽样器
+
+    首次抽取某个 (科目, 难度) 时从数据库加载对应的ID列表，之后每次抽题都是
+    O(k) 的 random.sample。题库写入后需调用 invalidate() 使缓存失效。
+    """
+
+    def __init__(self):
+        self._ids: Dict[Tuple[str, Optional[str]], List[int]] = {}
+        self._lock = threading.Lock()
+        # 每次失效都会递增，防止并发加载把失效前的旧数据写回缓存
+        self._generation = 0
+
+    def sample(self, conn: sqlite3.Connection, subject: str,
+               difficulty: Optional[str], k: int) -> List[int]:
+        """随机抽取最多 k 个不重复的题目ID"""
+        ids = self._get_ids(conn, subject, difficulty)
+        return random.sample(ids, min(k, len(ids)))
+
+    def invalidate(self, subject: Optional[str] = None):
+        """使缓存失效；不指定科目时清空全部缓存"""
+        with self._lock:
+            self._generation += 1
+            if subject is None:
+                self._ids.clear()
+            else:
+                for key in [key for key in self._ids if key[0] == subject]:
+                    del self._ids[key]
+
+    def _get_ids(self, conn: sqlite3.Connection, subject: str,
+                 difficulty: Optional[str]) -> List[int]:
+        key = (subject, difficulty or None)
+        with self._lock:
+            ids = self._ids.get(key)
+            generation = self._generation
+        if ids is not None:
+            return ids
+
+        if difficulty:
+            rows = conn.execute('SELECT id FROM questions WHERE subject = ? AND difficulty = ?',
+                                (subject, difficulty))
+        else:
+            rows = conn.execute('SELECT id FROM questions WHERE subject = ?', (subject,))
+        ids = [row[0] for row in rows]
+
+        with self._lock:
+            if generation == self._generation:
+                self._ids[key] = ids
+        return ids
+
+class QuestionCache:
+    """进程内题目缓存（读穿透 + LRU淘汰）
+
+    按题目ID缓存解析后的题目字典，未命中时从数据库批量读取。按 (科目, 难度)
+    分组的ID列表由 sampler 维护。题库写入后需调用 invalidate()。
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.sampler = QuestionSampler()
+        self._questions: "OrderedDict[int, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, conn: sqlite3.Connection, question_ids: Iterable[int]) -> Dict[int, Dict]:
+        """按ID获取题目，返回 {题目ID: 题目字典}，不存在的ID不会出现在结果中"""
+        found = {}
+        missing = []
+        with self._lock:
+            for question_id in question_ids:
+                question = self._questions.get(question_id)
+                if question is None:
+                    missing.append(question_id)
+                else:
+                    self._questions.move_to_end(question_id)
+                    found[question_id] = question
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            loaded = self._load(conn, missing)
+            with self._lock:
+                for question_id, question in loaded.items():
+                    self._questions[question_id] = question
+                    self._questions.move_to_end(question_id)
+                while len(self._questions) > self.max_size:
+                    self._questions.popitem(last=False)
+                    self.evictions += 1
+            found.update(loaded)
+
+        # 返回副本，调用方修改结果不会污染缓存
+        return {question_id: dict(question, knowledge_points=list(question['knowledge_points']))
+                for question_id, question in found.items()}
+
+    def sample(self, conn: sqlite3.Connection, subject: str,
+               difficulty: Optional[str], k: int) -> List[Dict]:
+        """随机抽取最多 k 道不重复的题目"""
+        question_ids = self.sampler.sample(conn, subject, difficulty, k)
+        questions = self.get_many(conn, question_ids)
+        # 按抽样顺序返回，保持随机性
+        return [questions[question_id] for question_id in question_ids if question_id in questions]
+
+    def invalidate(self, subject: Optional[str] = None,
+                   question_ids: Iterable[int] = None):
+        """使缓存失效
+
+        Args:
+            subject: 新增题目所属科目，清除该科目的分组ID列表；为None且未指定
+                question_ids 时清空全部缓存
+            question_ids: 内容被修改的题目ID，从缓存中移除
+        """
+        if question_ids is not None:
+            with self._lock:
+                for question_id in question_ids:
+                    self._questions.pop(question_id, None)
+        elif subject is None:
+            with self._lock:
+                self._questions.clear()
+
+        if subject is not None or question_ids is None:
+            self.sampler.invalidate(subject)
+
+    def stats(self) -> Dict:
+        """命中率等监控指标"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._questions),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+    @staticmethod
+    def _load(conn: sqlite3.Connection, question_ids: List[int]) -> Dict[int, Dict]:
+        loaded = {}
+        for start in range(0, len(question_ids), 500):
+            batch = question_ids[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            rows = conn.execute(f'SELECT {QUESTION_COLUMNS} FROM questions WHERE id IN ({placeholders})',
+                                batch)
+            for row in rows:
+                loaded[row[0]] = question_from_row(row)
+        return loaded
@@ -0,0 +1,192 @@
+"""
+题目查重模块
+完全重复：题目规范化后的指纹写入 questions.fingerprint 列，由唯一索引保证不重复
+近似重复：题目文本的字符 n-gram 计算 MinHash 签名，按 LSH 分段写入 question_lsh 表，
+查重时只需按分段键查索引取得少量候选，再精确计算相似度
+
+数学题只改了数字（如 "3 + 5 = ?" 与 "3 + 6 = ?"）是不同的题目，
+因此近似重复还要求两道题中出现的数字序列完全相同；选择题只改了一个词（如 "比喻" 与 "拟人"）
+时文本相似度可能高达 0.8 以上，因此还要求标准答案相同。
+"""
+import hashlib
+import random
+import re
+import sqlite3
+import unicodedata
+import zlib
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 没有 NumPy 时逐个计算签名，结果相同
+    np = None
+
+NGRAM_SIZE = 3
+NUM_PERM = 48
+LSH_BANDS = 12
+LSH_ROWS = NUM_PERM // LSH_BANDS
+# Jaccard 相似度达到该值、数字序列和标准答案都相同时视为近似重复
+NEAR_DUPLICATE_THRESHOLD = 0.7
+
+_PRIME = (1 << 31) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+if np is not None:
+    _PERM_A = np.array([a for a, _ in _PERMUTATIONS], dtype=np.uint64)[:, None]
+    _PERM_B = np.array([b for _, b in _PERMUTATIONS], dtype=np.uint64)[:, None]
+
+_NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+
+class DuplicateQuestionError(ValueError):
+    """题目与题库中已有题目重复"""
+
+    def __init__(self, message: str, existing_id: int = None, similarity: float = 1.0):
+        super().__init__(message)
+        self.existing_id = existing_id
+        self.similarity = similarity
+
+# 在算式、分数、百分数中有含义的标点，规范化时保留（与 fast_grader.MEANINGFUL_PUNCTUATION 一致），
+# 另外保留括号："(3+5)×2" 与 "3+5×2" 是不同的题目
+MEANINGFUL_PUNCTUATION = set('-/%.()[]{}')
+
+def normalize_question_text(text: str) -> str:
+    """全角转半角、统一小写，去掉空白和标点（保留运算符号、括号、小数点、分数线和百分号）"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    kept = []
+    for index, ch in enumerate(text):
+        if ch.isspace():
+            continue
+        if unicodedata.category(ch).startswith('P') and ch not in MEANINGFUL_PUNCTUATION:
+            continue
+        # 句点只作为小数点（后面紧跟数字）时保留，句末的英文句号去掉
+        if ch == '.' and not text[index + 1:index + 2].isdigit():
+            continue
+        kept.append(ch)
+    return ''.join(kept)
+
+def question_fingerprint(subject: str, question: str) -> str:
+    """题目指纹：同一科目下规范化后相同的题目指纹相同"""
+    raw = normalize_question_text(subject) + '\x1f' + normalize_question_text(question)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def number_sequence(text: str) -> Tuple[str, ...]:
+    """题目中按顺序出现的数字"""
+    return tuple(_NUMBER_PATTERN.findall(unicodedata.normalize('NFKC', text or '')))
+
+def shingles(text: str) -> Set[str]:
+    """规范化文本的字符 n-gram 集合，短于 n 的文本整体作为一个元素"""
+    normalized = normalize_question_text(text)
+    if len(normalized) <= NGRAM_SIZE:
+        return {normalized}
+    return {normalized[i:i + NGRAM_SIZE] for i in range(len(normalized) - NGRAM_SIZE + 1)}
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def minhash_signature(shingle_set: Set[str]) -> List[int]:
+    """MinHash 签名"""
+    hashes = [zlib.crc32(item.encode('utf-8')) % _PRIME for item in shingle_set] or [0]
+    if np is not None:
+        values = np.array(hashes, dtype=np.uint64)[None, :]
+        return ((_PERM_A * values + _PERM_B) % _PRIME).min(axis=1).tolist()
+    return [min([(a * h + b) % _PRIME for h in hashes]) for a, b in _PERMUTATIONS]
+
+def lsh_keys(subject: str, question: str) -> List[int]:
+    """题目的 LSH 分段键：签名分为 LSH_BANDS 段，任意一段完全相同的题目互为候选
+
+    分段键中还包含科目和数字序列，同一模板只改了数字的大量题目彼此不会成为候选，
+    每次查重的候选数量不随题库规模增长。
+    """
+    signature = minhash_signature(shingles(question))
+    prefix = '\x1f'.join((normalize_question_text(subject),) + number_sequence(question))
+    prefix = prefix.encode('utf-8') + b'\x1f'
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(prefix + f"{band}:{rows}".encode('ascii'), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'big', signed=True))
+    return keys
+
+def similarity(question_a: str, question_b: str) -> Optional[float]:
+    """两道题的 Jaccard 相似度；数字序列不同时返回None（不可能是重复题）"""
+    if number_sequence(question_a) != number_sequence(question_b):
+        return None
+    return jaccard(shingles(question_a), shingles(question_b))
+
+def near_duplicate_score(question_a: str, answer_a: str, question_b: str,
+                         answer_b: str) -> Optional[float]:
+    """两道题构成近似重复时返回相似度，否则返回None"""
+    if normalize_question_text(answer_a) != normalize_question_text(answer_b):
+        return None
+    score = similarity(question_a, question_b)
+    return score if score is not None and score >= NEAR_DUPLICATE_THRESHOLD else None
+
+def create_lsh_table(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS question_lsh (
+            band_key INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            PRIMARY KEY (band_key, question_id)
+        ) WITHOUT ROWID
+    ''')
+
+def index_lsh(conn: sqlite3.Connection, rows: Iterable[Tuple[int, Sequence[int]]]):
+    """把题目的 LSH 分段键写入索引
+
+    Args:
+        rows: [(题目ID, lsh_keys() 的返回值), ...]
+    """
+    conn.executemany('INSERT OR IGNORE INTO question_lsh (band_key, question_id) VALUES (?, ?)',
+                     [(key, question_id) for question_id, keys in rows for key in keys])
+
+def rebuild_lsh_index(conn: sqlite3.Connection):
+    """根据 questions 表重建近似重复索引（只索引有指纹的题目，已知的重复题不参与）"""
+    conn.execute('DELETE FROM question_lsh')
+    cursor = conn.execute('SELECT id, subject, question FROM questions WHERE fingerprint IS NOT NULL')
+    while True:
+        rows = cursor.fetchmany(5000)
+        if not rows:
+            break
+        index_lsh(conn, [(question_id, lsh_keys(subject, question))
+                         for question_id, subject, question in rows])
+
+def find_exact_duplicate(conn: sqlite3.Connection, fingerprint: str) -> Optional[int]:
+    row = conn.execute('SELECT id FROM questions WHERE fingerprint = ?', (fingerprint,)).fetchone()
+    return row[0] if row else None
+
+def find_near_duplicate(conn: sqlite3.Connection, subject: str, question: str,
+                        standard_answer: str, keys: Sequence[int] = None
+                        ) -> Optional[Tuple[int, float]]:
+    """在题库中查找与该题近似重复的题目，返回 (题目ID, 相似度)，没有时返回None"""
+    keys = keys or lsh_keys(subject, question)
+    placeholders = ','.join('?' * len(keys))
+    candidates = conn.execute(f'''
+        SELECT id, question, standard_answer FROM questions
+        WHERE id IN (SELECT question_id FROM question_lsh WHERE band_key IN ({placeholders}))
+          AND subject = ?
+    ''', tuple(keys) + (subject,)).fetchall()
+
+    best = None
+    for candidate_id, candidate, candidate_answer in candidates:
+        score = near_duplicate_score(question, standard_answer, candidate, candidate_answer)
+        if score is not None and (best is None or score > best[1]):
+            best = (candidate_id, score)
+    return best
+
+def find_duplicate(conn: sqlite3.Connection, subject: str, question: str, standard_answer: str,
+                   fingerprint: str = None, keys: Sequence[int] = None,
+                   near: bool = True) -> Optional[Tuple[int, float]]:
+    """查找完全重复或近似重复的题目，返回 (题目ID, 相似度)，完全重复时相似度为 1.0"""
+    existing_id = find_exact_duplicate(conn, fingerprint or question_fingerprint(subject, question))
+    if existing_id is not None:
+        return existing_id, 1.0
+    if near:
+        return find_near_duplicate(conn, subject, question, standard_answer, keys)
+    return None
+
+def duplicate_message(existing_id: Optional[int], similarity_score: float) -> str:
+    if similarity_score >= 1.0:
+        return f"与题目 #{existing_id} 完全重复"
+    return f"与题目 #{existing_id} 近似重复（相似度 {similarity_score:.0%}）"
@@ -0,0 +1,226 @@
+"""
+AI批量出题模块
+按出题计划（科目、难度配比、知识点、目标数量）并发调用LLM生成题目，
+校验、去重后批量写入题库，支持进度显示和中断后继续
+"""
+import asyncio
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+from question_dedup import question_fingerprint
+
+DEFAULT_DIFFICULTY_MIX = {'简单': 0.3, '中等': 0.5, '困难': 0.2}
+
+# 生成的题目写入数据库时 created_by 字段的前缀，后接任务名，用于断点续做
+CREATED_BY_PREFIX = 'AI出题:'
+
+def allocate_counts(total: int, mix: Dict[str, float]) -> Dict[str, int]:
+    """按比例把题目总数分配到各难度（最大余数法，保证总和等于 total）"""
+    weight_sum = sum(mix.values())
+    if total <= 0 or weight_sum <= 0:
+        return {difficulty: 0 for difficulty in mix}
+    shares = {difficulty: total * weight / weight_sum for difficulty, weight in mix.items()}
+    counts = {difficulty: int(share) for difficulty, share in shares.items()}
+    remainder = total - sum(counts.values())
+    for difficulty in sorted(shares, key=lambda d: shares[d] - counts[d], reverse=True)[:remainder]:
+        counts[difficulty] += 1
+    return counts
+
+class QuestionSpec:
+    """出题计划"""
+
+    def __init__(self, subject: str, count: int, knowledge_points: List[str] = None,
+                 difficulty_mix: Dict[str, float] = None, job_name: str = None):
+        """
+        Args:
+            subject: 科目
+            count: 目标题目数量
+            knowledge_points: 知识点列表，轮流分配给每道题
+            difficulty_mix: 难度配比，如 {'简单': 0.3, '中等': 0.5, '困难': 0.2}
+            job_name: 任务名，默认为科目名；同名任务再次运行时只补齐尚未生成的题目
+        """
+        self.subject = subject
+        self.count = count
+        self.knowledge_points = list(knowledge_points or [])
+        self.difficulty_mix = difficulty_mix or DEFAULT_DIFFICULTY_MIX
+        self.job_name = job_name or subject
+
+    @property
+    def created_by(self) -> str:
+        return CREATED_BY_PREFIX + self.job_name
+
+class QuestionFactory:
+    """并发批量出题
+
+    生成的题目按 flush_size 分批写入题库，created_by 记为 "AI出题:任务名"。
+    任务中断后用相同的 QuestionSpec 再次运行，会先统计该任务已写入的各难度题目数，
+    只生成剩余部分，已写入的题目不会丢失也不会重复生成。
+    """
+
+    def __init__(self, system, max_concurrency: int = 5, flush_size: int = 20,
+                 max_attempts_factor: int = 3,
+                 on_progress: Optional[Callable[[Dict], None]] = None):
+        """
+        Args:
+            system: IntelligentTutoringSystem 实例
+            max_concurrency: 同时进行的出题请求数上限
+            flush_size: 每积累多少道题写入一次数据库
+            max_attempts_factor: 最多尝试 剩余题数 × 该系数 次生成，超过后停止
+                                 （无效或重复的题目会重新生成）
+            on_progress: 进度回调，参数同 run() 的返回值；默认打印进度
+        """
+        self.system = system
+        self.db = system.db
+        self.max_concurrency = max_concurrency
+        self.flush_size = flush_size
+        self.max_attempts_factor = max_attempts_factor
+        self.on_progress = on_progress or self._print_progress
+
+    def run(self, spec: QuestionSpec) -> Dict:
+        """执行出题计划（同步调用入口）"""
+        return asyncio.run(self.arun(spec))
+
+    async def arun(self, spec: QuestionSpec) -> Dict:
+        """执行出题计划
+
+        Returns:
+            {'target', 'existing', 'inserted', 'invalid', 'duplicates', 'failed',
+             'elapsed_seconds', 'questions_per_minute'}
+        """
+        started = time.monotonic()
+        targets = allocate_counts(spec.count, spec.difficulty_mix)
+        existing = self._existing_counts(spec)
+        todo: List[str] = []
+        for difficulty, target in targets.items():
+            todo.extend([difficulty] * max(0, target - existing.get(difficulty, 0)))
+
+        report = {
+            'target': spec.count,
+            'existing': sum(min(existing.get(d, 0), t) for d, t in targets.items()),
+            'inserted': 0,
+            'invalid': 0,
+            'duplicates': 0,
+            'failed': 0,
+            'elapsed_seconds': 0.0,
+            'questions_per_minute': 0.0
+        }
+        if not todo:
+            return report
+
+        seen = self._existing_keys(spec.subject)
+        buffer: List[Dict] = []
+        attempts_left = len(todo) * self.max_attempts_factor
+        sequence = 0
+
+        def flush():
+            if not buffer:
+                return
+            result = self.db.add_questions_bulk(list(buffer))
+            buffer.clear()
+            report['inserted'] += sum(1 for question_id in result['ids'] if question_id is not None)
+            for error in result['errors']:
+                # 与题库近似重复或写入失败的题目重新排队
+                if 'duplicate_of' in error:
+                    report['duplicates'] += 1
+                else:
+                    report['failed'] += 1
+                todo.append(error['question']['difficulty'])
+            elapsed = time.monotonic() - started
+            report['elapsed_seconds'] = elapsed
+            report['questions_per_minute'] = report['inserted'] * 60 / elapsed if elapsed else 0.0
+            self.on_progress(dict(report))
+
+        async def worker():
+            nonlocal attempts_left, sequence
+            while todo and attempts_left > 0:
+                difficulty = todo.pop()
+                attempts_left -= 1
+                knowledge_points = self._knowledge_points_for(spec, sequence)
+                sequence += 1
+
+                question_data = await self.system.agenerate_question(
+                    spec.subject, difficulty, knowledge_points)
+                question = self._validate(question_data, spec, difficulty, knowledge_points)
+                if question is None:
+                    report['invalid'] += 1
+                    todo.append(difficulty)
+                    continue
+                key = question_fingerprint(spec.subject, question['question'])
+                if key in seen:
+                    report['duplicates'] += 1
+                    todo.append(difficulty)
+                    continue
+                seen.add(key)
+                buffer.append(question)
+                if len(buffer) >= self.flush_size:
+                    flush()
+
+        # 最后一批写入失败的题目会重新排队，需要再生成一轮
+        while todo and attempts_left > 0:
+            await asyncio.gather(*[worker() for _ in range(self.max_concurrency)])
+            flush()
+        elapsed = time.monotonic() - started
+        report['elapsed_seconds'] = elapsed
+        report['questions_per_minute'] = report['inserted'] * 60 / elapsed if elapsed else 0.0
+        return report
+
+    @staticmethod
+    def _knowledge_points_for(spec: QuestionSpec, sequence: int) -> List[str]:
+        """知识点轮流分配，使题目覆盖全部知识点"""
+        if not spec.knowledge_points:
+            return []
+        return [spec.knowledge_points[sequence % len(spec.knowledge_points)]]
+
+    @staticmethod
+    def _validate(question_data: Optional[Dict], spec: QuestionSpec, difficulty: str,
+                  knowledge_points: List[str]) -> Optional[Dict]:
+        """校验LLM生成的题目，缺少题目内容或标准答案时返回None"""
+        if not isinstance(question_data, dict):
+            return None
+        question = question_data.get('question')
+        standard_answer = question_data.get('standard_answer')
+        if not isinstance(question, str) or len(question.strip()) < 5:
+            return None
+        if not isinstance(standard_answer, (str, int, float)) or isinstance(standard_answer, bool):
+            return None
+        standard_answer = str(standard_answer).strip()
+        if not standard_answer:
+            return None
+        points = question_data.get('knowledge_points')
+        if not isinstance(points, list) or not all(isinstance(p, str) for p in points):
+            points = knowledge_points
+        return {
+            'subject': spec.subject,
+            # 以计划的难度为准，保证难度配比
+            'difficulty': difficulty,
+            'question': question.strip(),
+            'standard_answer': standard_answer,
+            'knowledge_points': [p.strip() for p in points if p.strip()] or knowledge_points,
+            'created_by': spec.created_by
+        }
+
+    def _existing_counts(self, spec: QuestionSpec) -> Counter:
+        """该任务已写入题库的各难度题目数"""
+        with self.db.connection() as conn:
+            rows = conn.execute('''
+                SELECT difficulty, COUNT(*) FROM questions
+                WHERE subject = ? AND created_by = ?
+                GROUP BY difficulty
+            ''', (spec.subject, spec.created_by)).fetchall()
+        return Counter(dict(rows))
+
+    def _existing_keys(self, subject: str) -> set:
+        """该科目已有题目的指纹，用于在写入前去掉完全重复的题目（近似重复由写入时的查重发现）"""
+        with self.db.connection() as conn:
+            cursor = conn.execute('''
+                SELECT fingerprint FROM questions WHERE subject = ? AND fingerprint IS NOT NULL
+            ''', (subject,))
+            return {row[0] for row in cursor}
+
+    @staticmethod
+    def _print_progress(report: Dict):
+        done = report['existing'] + report['inserted']
+        print(f"出题进度: {done}/{report['target']} "
+              f"({done * 100 // max(report['target'], 1)}%) | "
+              f"无效 {report['invalid']} | 重复 {report['duplicates']} | "
+              f"{report['questions_per_minute']:.1f} 题/分钟")
@@ -0,0 +1,129 @@
+"""
+题库全文检索模块
+基于 SQLite FTS5 建立题目内容、标准答案和知识点的全文索引
+
+unicode61 分词器会把连续的中文当作一个词，因此写入索引前先在每个中日韩
+字符之间插入空格，使每个汉字成为独立的词；查询时同样切分并作为短语匹配，
+这样任意长度的中文片段都能检索到，并可使用 bm25 排序。
+"""
+import json
+import re
+import sqlite3
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+FTS_TABLE = 'questions_fts'
+
+# 中日韩统一表意文字及常用扩展区、假名、韩文音节
+_CJK_PATTERN = re.compile(r'([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff])')
+
+def segment_text(text: str) -> str:
+    """全角转半角，并把中日韩字符切分为以空格分隔的单字"""
+    text = unicodedata.normalize('NFKC', text or '')
+    return _CJK_PATTERN.sub(r' \1 ', text)
+
+def build_match_query(query: str) -> Optional[str]:
+    """把用户输入转换为 FTS5 MATCH 表达式，多个关键词之间为"与"关系"""
+    phrases = []
+    for term in query.split():
+        tokens = re.findall(r'\w+', segment_text(term))
+        if tokens:
+            phrases.append('"' + ' '.join(tokens) + '"')
+    return ' AND '.join(phrases) if phrases else None
+
+def fts_available(conn: sqlite3.Connection) -> bool:
+    """全文索引表是否存在（SQLite 未编译 FTS5 时不会创建）"""
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                       (FTS_TABLE,)).fetchone()
+    return row is not None
+
+def create_fts_table(conn: sqlite3.Connection) -> bool:
+    """创建全文索引表，当前 SQLite 不支持 FTS5 时返回 False"""
+    try:
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5 (
+                question, standard_answer, knowledge_points,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+        ''')
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+def index_questions(conn: sqlite3.Connection,
+                    rows: Iterable[Tuple[int, str, str, Iterable[str]]]):
+    """把题目写入全文索引
+
+    Args:
+        rows: [(题目ID, 题目内容, 标准答案, 知识点列表), ...]
+    """
+    conn.executemany(f'''
+        INSERT OR REPLACE INTO {FTS_TABLE} (rowid, question, standard_answer, knowledge_points)
+        VALUES (?, ?, ?, ?)
+    ''', [
+        (question_id, segment_text(question), segment_text(standard_answer),
+         segment_text(' '.join(knowledge_points or [])))
+        for question_id, question, standard_answer, knowledge_points in rows
+    ])
+
+def rebuild_index(conn: sqlite3.Connection):
+    """根据 questions 表重建全文索引"""
+    conn.execute(f'DELETE FROM {FTS_TABLE}')
+    cursor = conn.execute('SELECT id, question, standard_answer, knowledge_points FROM questions')
+    while True:
+        rows = cursor.fetchmany(5000)
+        if not rows:
+            break
+        index_questions(conn, [
+            (question_id, question, standard_answer, _load_points(points_json))
+            for question_id, question, standard_answer, points_json in rows
+        ])
+
+def search(conn: sqlite3.Connection, query: str, subject: str = None,
+           limit: int = 20) -> List[Dict]:
+    """按相关度检索题目；不支持 FTS5 时退化为 LIKE 模糊匹配"""
+    subject_filter = 'AND q.subject = ?' if subject else ''
+    subject_params = (subject,) if subject else ()
+
+    if fts_available(conn):
+        match_query = build_match_query(query)
+        if not match_query:
+            return []
+        # 题目内容的权重最高，其次是知识点和标准答案
+        cursor = conn.execute(f'''
+            SELECT q.id, q.subject, q.difficulty, q.question, q.standard_answer,
+                   q.knowledge_points, bm25({FTS_TABLE}, 10.0, 2.0, 5.0) AS rank
+            FROM {FTS_TABLE}
+            JOIN questions q ON q.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH ? {subject_filter}
+            ORDER BY rank
+            LIMIT ?
+        ''', (match_query,) + subject_params + (limit,))
+    else:
+        pattern = f"%{query.strip()}%"
+        cursor = conn.execute(f'''
+            SELECT q.id, q.subject, q.difficulty, q.question, q.standard_answer,
+                   q.knowledge_points, 0 AS rank
+            FROM questions q
+            WHERE (q.question LIKE ? OR q.standard_answer LIKE ? OR q.knowledge_points LIKE ?)
+                  {subject_filter}
+            ORDER BY q.id
+            LIMIT ?
+        ''', (pattern, pattern, pattern) + subject_params + (limit,))
+
+    return [{
+        'id': row[0],
+        'subject': row[1],
+        'difficulty': row[2],
+        'question': row[3],
+        'standard_answer': row[4],
+        'knowledge_points': _load_points(row[5]),
+        'rank': row[6]
+    } for row in cursor.fetchall()]
+
+def _load_points(points_json: str) -> List[str]:
+    try:
+        points = json.loads(points_json) if points_json else []
+    except json.JSONDecodeError:
+        return []
+    return points if isinstance(points, list) else []
@@ -0,0 +1,280 @@
+"""
+LLM调用限流与重试模块
+按模型提供商限制每分钟请求数（RPM）和每分钟Token数（TPM），
+遇到 429 限流、超时、5xx 等临时错误时按带随机抖动的指数退避自动重试
+"""
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# 可以重试的HTTP状态码
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# 没有状态码时按异常类名判断是否为临时错误
+_TRANSIENT_NAME_PATTERN = re.compile(
+    r'RateLimit|Timeout|TimedOut|Connection|ServiceUnavailable|ResourceExhausted|'
+    r'InternalServer|Overloaded|TooManyRequests', re.IGNORECASE)
+
+_CJK_PATTERN = re.compile(r'([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff])')
+
+class TokenBucket:
+    """令牌桶，每分钟补充 rate_per_minute 个令牌，最多积攒 capacity 个
+
+    reserve() 采用预约方式：令牌不足时余额可以为负，调用方按返回的时间等待，
+    因此多个线程/协程同时等待时按到达顺序依次放行，不会互相抢占。
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1) -> float:
+        """预约 amount 个令牌，返回需要等待的秒数"""
+        # 单次请求超过桶容量时按容量计算，避免永远等不到
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(self.clock())
+            self._tokens -= amount
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def refund(self, amount: float):
+        """归还预估多扣的令牌（amount 为负数时补扣）"""
+        with self._lock:
+            self._refill(self.clock())
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+class ProviderRateLimiter:
+    """单个模型提供商的限流器，同时限制请求数和Token数"""
+
+    def __init__(self, rpm: float = None, tpm: float = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.requests = TokenBucket(rpm, clock=clock) if rpm else None
+        self.tokens = TokenBucket(tpm, clock=clock) if tpm else None
+        self.waited_seconds = 0.0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        wait = 0.0
+        if self.requests:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens:
+            wait = max(wait, self.tokens.reserve(estimated_tokens))
+        if wait:
+            with self._lock:
+                self.waited_seconds += wait
+        return wait
+
+    def acquire(self, estimated_tokens: int = 0):
+        """等待到配额允许发出请求"""
+        wait = self._reserve(estimated_tokens)
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self, estimated_tokens: int = 0):
+        """等待到配额允许发出请求（异步版本）"""
+        wait = self._reserve(estimated_tokens)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """请求完成后按实际用量修正Token桶"""
+        if self.tokens and actual_tokens is not None:
+            self.tokens.refund(estimated_tokens - actual_tokens)
+
+    def release(self, estimated_tokens: int):
+        """请求失败（未消耗Token）时归还预约的Token，请求数配额不归还"""
+        if self.tokens:
+            # 预约时超过桶容量的部分按容量扣除，归还时同样按容量计算
+            self.tokens.refund(min(estimated_tokens, self.tokens.capacity))
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'waited_seconds': self.waited_seconds, 'retries': self.retries}
+
+_limiters: Dict[str, ProviderRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_provider_limiter(provider_name: str, rpm: float = None,
+                         tpm: float = None) -> ProviderRateLimiter:
+    """获取进程级共享限流器，同一名称（提供商/模型）的所有客户端共用配额"""
+    with _limiters_lock:
+        limiter = _limiters.get(provider_name)
+        if limiter is None:
+            limiter = ProviderRateLimiter(rpm, tpm)
+            _limiters[provider_name] = limiter
+        return limiter
+
+def estimate_tokens(messages: Any, expected_output_tokens: int = 500) -> int:
+    """粗略估算一次请求消耗的Token数：中日韩字符约1个Token，其他字符约4个字符1个Token"""
+    if isinstance(messages, str):
+        texts: Iterable[str] = [messages]
+    else:
+        texts = [getattr(message, 'content', message) for message in messages]
+    total = 0
+    for text in texts:
+        if not isinstance(text, str):
+            continue
+        cjk = len(_CJK_PATTERN.findall(text))
+        total += cjk + (len(text) - cjk) // 4
+    return total + expected_output_tokens
+
+def _actual_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, 'usage_metadata', None)
+    if isinstance(usage, dict) and usage.get('total_tokens'):
+        return usage['total_tokens']
+    return None
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status if isinstance(status, int) else None
+
+def is_transient_error(error: Exception) -> bool:
+    """限流、超时、连接中断和服务端错误可以重试，参数错误、认证失败等不重试"""
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    return any(_TRANSIENT_NAME_PATTERN.search(cls.__name__) for cls in type(error).__mro__)
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """读取服务端返回的 Retry-After 响应头"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, base_delay: float = 1.0, max_delay: float = 30.0) -> float:
+    """第 attempt 次重试前的等待时间（指数退避 + 全随机抖动）"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+class RateLimitedLLM:
+    """为LLM实例加上限流和重试
+
+    invoke/ainvoke 失败时按指数退避重试；stream/astream 只在还没有产出任何内容时重试，
+    已经输出一部分后出错则直接抛出，避免重复内容。其他属性和方法透传给原始实例。
+    """
+
+    def __init__(self, llm: Any, limiter: ProviderRateLimiter, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 30.0):
+        self.llm = llm
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def __getattr__(self, name: str) -> Any:
+        if name == 'llm':
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """返回重试前的等待秒数，不应重试时返回None"""
+        if attempt >= self.max_retries or not is_transient_error(error):
+            return None
+        self.limiter.record_retry()
+        delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+        return max(delay, retry_after_seconds(error) or 0.0)
+
+    def invoke(self, messages: Any, *args, **kwargs) -> Any:
+        estimated = estimate_tokens(messages)
+        attempt = 0
+        while True:
+            self.limiter.acquire(estimated)
+            try:
+                response = self.llm.invoke(messages, *args, **kwargs)
+            except Exception as e:
+                # 失败的请求没有消耗Token，归还预约，重试时重新预约
+                self.limiter.release(estimated)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.limiter.settle(estimated, _actual_tokens(response))
+            return response
+
+    async def ainvoke(self, messages: Any, *args, **kwargs) -> Any:
+        estimated = estimate_tokens(messages)
+        attempt = 0
+        while True:
+            await self.limiter.aacquire(estimated)
+            try:
+                response = await self.llm.ainvoke(messages, *args, **kwargs)
+            except Exception as e:
+                self.limiter.release(estimated)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.limiter.settle(estimated, _actual_tokens(response))
+            return response
+
+    def stream(self, messages: Any, *args, **kwargs):
+        estimated = estimate_tokens(messages)
+        attempt = 0
+        while True:
+            self.limiter.acquire(estimated)
+            started = False
+            try:
+                for chunk in self.llm.stream(messages, *args, **kwargs):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                # 已经输出部分内容时Token已消耗，不归还
+                if not started:
+                    self.limiter.release(estimated)
+                delay = None if started else self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    async def astream(self, messages: Any, *args, **kwargs):
+        estimated = estimate_tokens(messages)
+        attempt = 0
+        while True:
+            await self.limiter.aacquire(estimated)
+            started = False
+            try:
+                async for chunk in self.llm.astream(messages, *args, **kwargs):
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if not started:
+                    self.limiter.release(estimated)
+                delay = None if started else self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def with_structured_output(self, *args, **kwargs) -> 'RateLimitedLLM':
+        """结构化输出的调用同样受限流和重试保护"""
+        return RateLimitedLLM(self.llm.with_structured_output(*args, **kwargs), self.limiter,
+                              self.max_retries, self.base_delay, self.max_delay)
@@ -0,0 +1,263 @@
+"""
+语义阅卷缓存模块
+精确缓存只能命中规范化后完全相同的答案，主观题答案常常只差标点或语序。
+本模块把答案转换为字符 n-gram 哈希向量，在同一道题已评分的答案中查找最相似的一条，
+余弦相似度超过阈值时复用其评分结果；按比例抽查命中的答案并重新评分，统计分数偏差，
+用于调整阈值。
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from database import DatabaseManager
+
+try:
+    import numpy as np
+except ImportError:  # 没有 NumPy 时逐条计算相似度，结果相同
+    np = None
+
+# 否定词会让字面相似的答案意思相反，两条答案中的否定词必须一致才能复用评分
+NEGATION_CHARS = '不没无非未否别勿'
+
+_NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+
+def normalize_text(answer: str) -> str:
+    """全角转半角、统一小写，去掉空白和标点"""
+    answer = unicodedata.normalize('NFKC', answer or '').lower()
+    return ''.join(ch for ch in answer
+                   if not ch.isspace() and not unicodedata.category(ch).startswith('P'))
+
+def answer_signature(normalized: str) -> Tuple:
+    """答案中的数字（不计顺序）和否定词，两条答案的签名不同时不能互相复用评分"""
+    return (tuple(sorted(_NUMBER_PATTERN.findall(normalized))),
+            ''.join(sorted(ch for ch in normalized if ch in NEGATION_CHARS)))
+
+def ngram_vector(normalized: str, dim: int, ngram_sizes: Tuple[int, ...] = (1, 2)) -> Dict[int, float]:
+    """字符 n-gram 哈希向量（稀疏表示，已做L2归一化）
+
+    只使用单字和双字，语序调整后大部分 n-gram 不变，相似度仍然很高。
+    """
+    vector: Dict[int, float] = {}
+    for size in ngram_sizes:
+        for i in range(len(normalized) - size + 1):
+            bucket = zlib.crc32(normalized[i:i + size].encode('utf-8')) % dim
+            vector[bucket] = vector.get(bucket, 0.0) + 1.0
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    return {bucket: value / norm for bucket, value in vector.items()} if norm else {}
+
+class _ScopeIndex:
+    """同一道题（及同一模型、提示词版本）已评分答案的向量索引"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.ids: List[int] = []
+        self.signatures: List[Tuple] = []
+        self.vectors: List[Dict[int, float]] = []
+        self.results: List[Dict] = []
+        self._matrix = None
+
+    def add(self, entry_id: int, signature: Tuple, vector: Dict[int, float], result: Dict):
+        self.ids.append(entry_id)
+        self.signatures.append(signature)
+        self.vectors.append(vector)
+        self.results.append(result)
+        self._matrix = None
+
+    def trim(self, max_entries: int):
+        """只保留最近的 max_entries 条"""
+        if len(self.ids) > max_entries:
+            for items in (self.ids, self.signatures, self.vectors, self.results):
+                del items[:len(items) - max_entries]
+            self._matrix = None
+
+    def similarities(self, vector: Dict[int, float]) -> List[float]:
+        if np is not None:
+            if self._matrix is None:
+                self._matrix = np.zeros((len(self.vectors), self.dim), dtype=np.float32)
+                for row, item in enumerate(self.vectors):
+                    self._matrix[row, list(item)] = list(item.values())
+            query = np.zeros(self.dim, dtype=np.float32)
+            query[list(vector)] = list(vector.values())
+            return (self._matrix @ query).tolist()
+        return [sum(weight * item.get(bucket, 0.0) for bucket, weight in vector.items())
+                for item in self.vectors]
+
+    def nearest(self, signature: Tuple, vector: Dict[int, float],
+                threshold: float) -> Optional[Tuple[int, float]]:
+        """相似度不低于阈值且签名相同的最相似答案，返回 (序号, 相似度)"""
+        if not self.vectors or not vector:
+            return None
+        scores = self.similarities(vector)
+        for position in sorted(range(len(scores)), key=scores.__getitem__, reverse=True):
+            if scores[position] < threshold:
+                break
+            if self.signatures[position] == signature:
+                return position, scores[position]
+        return None
+
+class SemanticGradingCache:
+    """基于答案相似度的阅卷缓存
+
+    作用范围与精确缓存相同（题目内容+标准答案、模型提供商、模型名称、阅卷提示词版本），
+    只在同一范围内查找相似答案。过短的答案（如 "李白"）字面相近时意思往往不同，不参与匹配。
+    命中的答案按 audit_rate 的比例仍交给LLM评分，记录与复用分数之间的偏差。
+    """
+
+    def __init__(self, db: DatabaseManager, threshold: float = 0.9, dim: int = 1024,
+                 min_answer_length: int = 8, audit_rate: float = 0.05,
+                 max_entries_per_question: int = 500, max_loaded_questions: int = 1000):
+        """
+        Args:
+            db: 数据库管理器
+            threshold: 余弦相似度达到该值时复用评分
+            dim: n-gram 哈希向量的维数
+            min_answer_length: 规范化后少于该字数的答案不参与相似匹配
+            audit_rate: 命中后仍重新评分以统计分数偏差的比例
+            max_entries_per_question: 每道题最多保存的已评分答案数
+            max_loaded_questions: 内存中最多保留多少道题的向量索引
+        """
+        self.db = db
+        self.threshold = threshold
+        self.dim = dim
+        self.min_answer_length = min_answer_length
+        self.audit_rate = audit_rate
+        self.max_entries_per_question = max_entries_per_question
+        self.max_loaded_questions = max_loaded_questions
+        self._indexes: "OrderedDict[str, _ScopeIndex]" = OrderedDict()
+        # 等待LLM评分结果的答案：精确缓存键 -> (范围, 规范化答案, 抽查时复用的分数)
+        self._pending: "OrderedDict[str, Tuple[str, str, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.skipped = 0
+        self.similarity_sum = 0.0
+        self.audits = 0
+        self.drift_sum = 0.0
+        self.max_drift = 0.0
+        self.drift_over_one = 0
+
+    @staticmethod
+    def make_scope(question: str, standard_answer: str, provider: str, model: str,
+                   prompt_version: str) -> str:
+        raw = "\x1f".join([question, standard_answer, provider, model, prompt_version])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def lookup(self, scope: str, cache_key: str, student_answer: str) -> Optional[Dict]:
+        """查找相似答案的评分结果，未命中时返回None
+
+        未命中的答案在LLM评分后通过 put(cache_key, result) 加入索引。
+        """
+        normalized = normalize_text(student_answer)
+        with self._lock:
+            if len(normalized) < self.min_answer_length:
+                self.skipped += 1
+                return None
+            self.lookups += 1
+
+        index = self._get_index(scope)
+        signature = answer_signature(normalized)
+        with self._lock:
+            match = index.nearest(signature, ngram_vector(normalized, self.dim), self.threshold)
+            audit_score = None
+            if match is not None:
+                position, similarity = match
+                result = index.results[position]
+                if random.random() >= self.audit_rate:
+                    self.hits += 1
+                    self.similarity_sum += similarity
+                    return dict(result)
+                audit_score = result.get('score')
+            self._pending[cache_key] = (scope, normalized, audit_score)
+            # 阅卷失败的答案不会调用 put，限制等待表的大小
+            while len(self._pending) > 10000:
+                self._pending.popitem(last=False)
+        return None
+
+    def put(self, cache_key: str, result: Dict):
+        """保存LLM对 lookup 未命中答案的评分结果"""
+        with self._lock:
+            pending = self._pending.pop(cache_key, None)
+        if pending is None or 'score' not in result:
+            return
+        scope, normalized, audit_score = pending
+        if isinstance(audit_score, (int, float)) and isinstance(result['score'], (int, float)):
+            drift = abs(result['score'] - audit_score)
+            with self._lock:
+                self.audits += 1
+                self.drift_sum += drift
+                self.max_drift = max(self.max_drift, drift)
+                self.drift_over_one += drift > 1
+
+        with self.db.connection() as conn:
+            entry_id = conn.execute('''
+                INSERT INTO semantic_grading_cache (scope, answer, result, created_at)
+                VALUES (?, ?, ?, ?)
+            ''', (scope, normalized, json.dumps(result, ensure_ascii=False), time.time())).lastrowid
+            # 只保留该题最近的 max_entries_per_question 条
+            conn.execute('''
+                DELETE FROM semantic_grading_cache WHERE scope = ? AND id < (
+                    SELECT id FROM semantic_grading_cache WHERE scope = ?
+                    ORDER BY id DESC LIMIT 1 OFFSET ?
+                )
+            ''', (scope, scope, self.max_entries_per_question - 1))
+
+        index = self._get_index(scope)
+        with self._lock:
+            index.add(entry_id, answer_signature(normalized), ngram_vector(normalized, self.dim), result)
+            index.trim(self.max_entries_per_question)
+
+    def _get_index(self, scope: str) -> _ScopeIndex:
+        """取得一道题的向量索引，不在内存中时从数据库加载"""
+        with self._lock:
+            index = self._indexes.get(scope)
+            if index is not None:
+                self._indexes.move_to_end(scope)
+                return index
+
+        with self.db.connection() as conn:
+            rows = conn.execute('''
+                SELECT id, answer, result FROM semantic_grading_cache
+                WHERE scope = ? ORDER BY id DESC LIMIT ?
+            ''', (scope, self.max_entries_per_question)).fetchall()
+        index = _ScopeIndex(self.dim)
+        for entry_id, answer, result in reversed(rows):
+            index.add(entry_id, answer_signature(answer), ngram_vector(answer, self.dim),
+                      json.loads(result))
+
+        with self._lock:
+            # 并发加载同一道题时以先加载的为准
+            index = self._indexes.setdefault(scope, index)
+            self._indexes.move_to_end(scope)
+            while len(self._indexes) > self.max_loaded_questions:
+                self._indexes.popitem(last=False)
+        return index
+
+    def clear(self):
+        """清空缓存"""
+        with self.db.connection() as conn:
+            conn.execute('DELETE FROM semantic_grading_cache')
+        with self._lock:
+            self._indexes.clear()
+            self._pending.clear()
+
+    def stats(self) -> Dict:
+        """命中率、命中答案的平均相似度，以及抽查得到的分数偏差"""
+        with self._lock:
+            return {
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+                'skipped_short_answers': self.skipped,
+                'mean_hit_similarity': self.similarity_sum / self.hits if self.hits else 0.0,
+                'audits': self.audits,
+                'mean_abs_drift': self.drift_sum / self.audits if self.audits else 0.0,
+                'max_abs_drift': self.max_drift,
+                'drift_over_one_point': self.drift_over_one
+            }
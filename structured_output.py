@@ -0,0 +1,188 @@
+"""
+结构化输出模块
+模型支持时通过提供商的 JSON 模式或函数调用（with_structured_output）按 Pydantic 模型返回结果，
+不支持时退回到提示词要求JSON + 文本解析；解析失败时重新请求，并按模型统计解析失败和重新请求次数。
+"""
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Type
+from pydantic import BaseModel, Field
+from json_extractor import extract_json, JsonStreamExtractor
+
+class GradingResult(BaseModel):
+    """阅卷结果"""
+    score: float = Field(description="分数(0-10)", ge=0, le=10)
+    analysis: str = Field(description="详细的答案分析")
+    weak_points: List[str] = Field(default_factory=list, description="薄弱知识点")
+    suggestions: str = Field(default="", description="改进建议")
+    correct_answer: str = Field(default="", description="正确答案要点")
+    # 部分模型会按百分制给出置信度，由 cascade_grader.grading_confidence 统一换算
+    confidence: Optional[float] = Field(default=None, description="评分把握程度(0-1)")
+
+class GeneratedQuestion(BaseModel):
+    """AI生成的题目"""
+    question: str = Field(description="题目内容")
+    question_type: str = Field(default="", description="题目类型")
+    difficulty: str = Field(default="", description="难度等级")
+    knowledge_points: List[str] = Field(default_factory=list, description="知识点")
+    standard_answer: str = Field(description="标准答案")
+    explanation: str = Field(default="", description="答案解释")
+
+def _to_dict(parsed: Any) -> Optional[Dict]:
+    """把结构化输出的结果转换为字典，整数值的浮点数（如分数 8.0）转换为整数"""
+    if isinstance(parsed, BaseModel):
+        parsed = parsed.model_dump() if hasattr(parsed, 'model_dump') else parsed.dict()
+    if not isinstance(parsed, dict):
+        return None
+    return {key: int(value) if isinstance(value, float) and value.is_integer() else value
+            for key, value in parsed.items()}
+
+class StructuredResponse:
+    """StructuredOutputLLM 的返回值，content 为结果的JSON文本，与LLM消息的用法相同"""
+
+    def __init__(self, content: str, parsed: Optional[Dict], usage_metadata: Dict = None):
+        self.content = content
+        self.parsed = parsed
+        self.usage_metadata = usage_metadata
+        self.response_metadata: Dict[str, Any] = {}
+
+class StructuredOutputStats:
+    """按模型统计结构化输出的请求、解析失败和重新请求次数"""
+
+    COUNTERS = ('requests', 'structured', 'recovered', 'parse_failures', 're_requests')
+
+    def __init__(self):
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, counter: str):
+        with self._lock:
+            counts = self._counts.setdefault(provider, dict.fromkeys(self.COUNTERS, 0))
+            counts[counter] += 1
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """各模型的统计：
+        requests: LLM请求次数（含重新请求）；structured: 其中使用结构化输出的次数；
+        recovered: 结构化解析失败但从文本中解析成功的次数；parse_failures: 无法解析的次数；
+        re_requests: 因无法解析而重新请求的次数；wasted_call_rate: 重新请求占全部请求的比例
+        """
+        with self._lock:
+            snapshot = {provider: dict(counts) for provider, counts in self._counts.items()}
+        for counts in snapshot.values():
+            counts['wasted_call_rate'] = (counts['re_requests'] / counts['requests']
+                                          if counts['requests'] else 0.0)
+        return snapshot
+
+class StructuredOutputLLM:
+    """按模型能力请求结构化输出的LLM包装
+
+    invoke/ainvoke 返回 StructuredResponse：解析成功时 content 为结果的JSON文本，
+    parsed 为结果字典；重新请求后仍无法解析时 content 为模型的原始回复，parsed 为None。
+    stream/astream 直接使用文本输出；stream_fields 流式显示字段，结束后同样校验和重新请求。
+    """
+
+    def __init__(self, llm: Any, provider: str, schema: Type[BaseModel], method: Optional[str],
+                 stats: StructuredOutputStats, max_re_requests: int = 1):
+        """
+        Args:
+            llm: 原始LLM实例
+            provider: 统计中使用的模型名称
+            schema: 结果的 Pydantic 模型
+            method: with_structured_output 的 method 参数（如 "json_mode"、"function_calling"），
+                    为None时使用文本输出
+            stats: 统计对象
+            max_re_requests: 无法解析时最多重新请求的次数
+        """
+        self.llm = llm
+        self.provider = provider
+        self.schema = schema
+        self.stats = stats
+        self.max_re_requests = max_re_requests
+        self.structured_llm = None
+        if method:
+            try:
+                self.structured_llm = llm.with_structured_output(schema, method=method,
+                                                                 include_raw=True)
+            except (NotImplementedError, TypeError, ValueError) as e:
+                print(f"⚠️  {provider} 不支持结构化输出，改用文本解析: {e}")
+
+    def invoke(self, messages: Any, *args, **kwargs) -> StructuredResponse:
+        return self._invoke(messages, 0, args, kwargs)
+
+    def _invoke(self, messages: Any, first_attempt: int, args, kwargs) -> StructuredResponse:
+        for attempt in range(first_attempt, self.max_re_requests + 1):
+            if attempt:
+                self.stats.record(self.provider, 're_requests')
+            response = self._parse((self.structured_llm or self.llm).invoke(messages, *args, **kwargs))
+            if response.parsed is not None:
+                break
+        return response
+
+    def stream_fields(self, messages: Any, on_field: Callable[[Any, Any], None],
+                      *args, **kwargs) -> StructuredResponse:
+        """以文本方式流式请求，每个顶层字段生成完就回调 on_field(字段名, 值)
+
+        输出结束后按 schema 校验，无法解析或校验失败时按 invoke 重新请求（使用结构化输出），
+        统计方式与 invoke 相同。
+        """
+        extractor = JsonStreamExtractor(dict)
+        for chunk in self.llm.stream(messages, *args, **kwargs):
+            content = getattr(chunk, 'content', None)
+            for key, value in extractor.feed(content if isinstance(content, str) else ''):
+                on_field(key, value)
+        self.stats.record(self.provider, 'requests')
+        parsed = self._validate(extractor.finish())
+        if parsed is not None:
+            return StructuredResponse(json.dumps(parsed, ensure_ascii=False), parsed)
+        self.stats.record(self.provider, 'parse_failures')
+        if self.max_re_requests < 1:
+            return StructuredResponse(extractor.text, None)
+        return self._invoke(messages, 1, args, kwargs)
+
+    async def ainvoke(self, messages: Any, *args, **kwargs) -> StructuredResponse:
+        for attempt in range(self.max_re_requests + 1):
+            if attempt:
+                self.stats.record(self.provider, 're_requests')
+            response = self._parse(
+                await (self.structured_llm or self.llm).ainvoke(messages, *args, **kwargs))
+            if response.parsed is not None:
+                break
+        return response
+
+    def stream(self, *args, **kwargs):
+        return self.llm.stream(*args, **kwargs)
+
+    def astream(self, *args, **kwargs):
+        return self.llm.astream(*args, **kwargs)
+
+    def _parse(self, response: Any) -> StructuredResponse:
+        self.stats.record(self.provider, 'requests')
+        if self.structured_llm is not None:
+            self.stats.record(self.provider, 'structured')
+            # include_raw=True 时返回 {'raw': 原始消息, 'parsed': 结果, 'parsing_error': 错误}
+            raw = response.get('raw') if isinstance(response, dict) else response
+            parsed = _to_dict(response.get('parsed')) if isinstance(response, dict) else None
+        else:
+            raw, parsed = response, None
+        usage = getattr(raw, 'usage_metadata', None)
+        if parsed is not None:
+            return StructuredResponse(json.dumps(parsed, ensure_ascii=False), parsed, usage)
+
+        text = getattr(raw, 'content', None)
+        text = text if isinstance(text, str) else ''
+        parsed = self._validate(extract_json(text, dict))
+        if parsed is None:
+            self.stats.record(self.provider, 'parse_failures')
+            return StructuredResponse(text, None, usage)
+        if self.structured_llm is not None:
+            self.stats.record(self.provider, 'recovered')
+        return StructuredResponse(json.dumps(parsed, ensure_ascii=False), parsed, usage)
+
+    def _validate(self, parsed: Optional[Dict]) -> Optional[Dict]:
+        """文本中的JSON同样按 schema 校验（如分数越界、缺少题目内容时视为解析失败）"""
+        if not isinstance(parsed, dict):
+            return None
+        try:
+            return _to_dict(self.schema(**parsed))
+        except (TypeError, ValueError):
+            return None
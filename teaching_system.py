@@ -5,18 +5,48 @@
 import os
 import json
 import re
-from typing import List, Dict, Tuple, Optional, Any
-from langchain.schema import HumanMessage, SystemMessage
+import asyncio
+from functools import partial
+from typing import List, Dict, Tuple, Optional, Any, Callable, Iterator, AsyncIterator
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
 from database import DatabaseManager
+from exam_session import BufferedExamSession, recover_exam_sessions
+from grading_cache import GradingCache
+from json_extractor import extract_json, JsonStreamExtractor
+from structured_output import (GradingResult, GeneratedQuestion, StructuredOutputLLM,
+                               StructuredOutputStats, StructuredResponse)
+from semantic_grading_cache import SemanticGradingCache
+from fast_grader import FastPathGrader
+from cascade_grader import GradingCascade, grading_confidence
+from question_factory import QuestionFactory, QuestionSpec
+from question_dedup import DuplicateQuestionError
 from llm_config import LLMProvider, LLMConfig, get_llm_by_name
+from llm_router import RoutingLLM, SERVED_BY_KEY, create_routing_llm, served_by
+
+# 阅卷提示词版本号，修改 system_prompts['grader'] 或 ['batch_grader'] 时需同步递增，使旧的缓存结果失效
+GRADER_PROMPT_VERSION = "2"
 
 class IntelligentTutoringSystem:
-    def __init__(self, llm_provider: str = "qwen3", api_key: str = None):
+    def __init__(self, llm_provider: str = "qwen3", api_key: str = None,
+                 use_grading_cache: bool = True, use_fast_grader: bool = True,
+                 fallback_providers: List[str] = None, use_cascade: bool = True,
+                 confidence_threshold: float = 0.8, use_semantic_cache: bool = False,
+                 semantic_threshold: float = 0.9, use_structured_output: bool = True):
         """初始化智能教学系统
         
         Args:
             llm_provider: LLM提供商 ('qwen3' 或 'gemini')
             api_key: API密钥（可选，如果未设置环境变量）
+            use_grading_cache: 是否复用相同答案的历史评分结果
+            use_fast_grader: 是否对数值、选项、简短词语等客观题答案在本地直接判分
+            fallback_providers: 备用LLM提供商，主模型响应慢时发出对冲请求，出错时自动切换
+            use_cascade: 是否分级阅卷，基础模型置信度低或题目为开放性问答时改用
+                         LLMConfig.MODELS 中配置的 escalation_model
+            confidence_threshold: 基础模型自报置信度低于该值时升级；低于该值的结果不写入缓存
+            use_semantic_cache: 是否复用同一道题相似答案（只差标点、语序等）的历史评分结果
+            semantic_threshold: 答案相似度达到该值时复用评分
+            use_structured_output: 阅卷和出题是否使用模型原生的结构化输出（LLMConfig.MODELS 中
+                                   配置了 structured_output 的模型），其他模型仍解析文本中的JSON
         """
         self.llm_provider = llm_provider
         
@@ -29,7 +59,11 @@ class IntelligentTutoringSystem:
         
         # 初始化LLM模型
         try:
-            self.llm = get_llm_by_name(llm_provider)
+            if fallback_providers:
+                self.llm = create_routing_llm(
+                    [llm_provider] + [p for p in fallback_providers if p != llm_provider])
+            else:
+                self.llm = get_llm_by_name(llm_provider)
             print(f"✅ 已初始化 {LLMConfig.MODELS[LLMProvider(llm_provider)]['display_name']} 模型")
         except Exception as e:
             print(f"❌ 初始化LLM模型失败: {e}")
@@ -38,29 +72,40 @@ class IntelligentTutoringSystem:
         # 初始化数据库
         self.db = DatabaseManager()
         
-        # 辅助函数：处理LLM返回的可能包含Markdown代码块的JSON字符串
-        def parse_llm_json_response(response_content: str) -> Optional[Any]:
-            """解析LLM返回的可能包含Markdown代码块的JSON字符串"""
-            response_content = response_content.strip()
-            
-            # 处理可能带有Markdown代码块标记的JSON
-            if response_content.startswith('```json'):
-                # 移除```json和```标记
-                response_content = response_content.replace('```json', '', 1)
-                if response_content.endswith('```'):
-                    response_content = response_content[:-3]
-                response_content = response_content.strip()
-            # 处理只有```而没有json标识符的情况
-            elif response_content.startswith('```') and response_content.endswith('```'):
-                response_content = response_content[3:-3].strip()
-            
-            try:
-                return json.loads(response_content)
-            except json.JSONDecodeError:
-                return None
+        # 恢复上次异常退出时未提交的缓冲考试
+        recovered_exams = recover_exam_sessions(self.db)
+        if recovered_exams:
+            print(f"✅ 已恢复 {len(recovered_exams)} 场未提交的考试: {recovered_exams}")
         
-        # 将辅助函数添加为实例方法
-        self.parse_llm_json_response = parse_llm_json_response
+        # 阅卷结果缓存
+        self.grading_cache = GradingCache(self.db) if use_grading_cache else None
+        self.semantic_cache = (SemanticGradingCache(self.db, semantic_threshold)
+                               if use_semantic_cache else None)
+        
+        # 客观题本地快速阅卷
+        self.fast_grader = FastPathGrader() if use_fast_grader else None
+        
+        # 分级阅卷：基础模型没有把握时升级到更强的模型
+        self.cascade = None
+        self.confidence_threshold = confidence_threshold
+        escalation_model = LLMConfig.MODELS[LLMProvider(llm_provider)].get('escalation_model')
+        self.escalation_model = escalation_model if use_cascade else None
+        if use_cascade and escalation_model:
+            self.cascade = GradingCascade(
+                get_llm_by_name(llm_provider, model_name=escalation_model), confidence_threshold)
+        
+        # 结构化输出：按模型统计解析失败和重新请求次数
+        self.use_structured_output = use_structured_output
+        self.structured_stats = StructuredOutputStats()
+        self._structured_llms: Dict[Tuple[str, type], Any] = {}
+        self._escalation_grader = None
+        if self.cascade:
+            self._escalation_grader = self._wrap_structured(
+                self.cascade.escalation_llm, llm_provider, GradingResult,
+                f"{llm_provider}/{escalation_model}")
+        
+        # 批量阅卷统计：合并请求次数、合并的题目数、需要单独重试的题目数
+        self.batch_stats = {'batches': 0, 'items': 0, 'retried': 0}
         
         # 系统提示词模板
         self.system_prompts = {
@@ -96,9 +141,31 @@ class IntelligentTutoringSystem:
     "analysis": "详细的答案分析",
     "weak_points": ["薄弱知识点1", "薄弱知识点2"],
     "suggestions": "改进建议",
-    "correct_answer": "正确答案要点"
+    "correct_answer": "正确答案要点",
+    "confidence": 评分把握程度(0-1)
 }""",
             
+            'batch_grader': """你是一位经验丰富的阅卷老师，负责一次评判多道题目的学生答案并给出详细分析。
+评分标准：
+1. 每道题满分10分
+2. 根据答案的准确性、完整性、逻辑性进行评分
+3. 给出具体的扣分原因
+4. 识别学生的薄弱知识点
+5. 提供改进建议
+
+每道题都有编号，请逐题评分，不要遗漏，严格按照JSON数组格式输出，数组中每个元素对应一道题：
+[
+    {
+        "id": 题目编号,
+        "score": 分数(0-10),
+        "analysis": "详细的答案分析",
+        "weak_points": ["薄弱知识点1", "薄弱知识点2"],
+        "suggestions": "改进建议",
+        "correct_answer": "正确答案要点",
+        "confidence": 评分把握程度(0-1)
+    }
+]""",
+            
             'tutor': """你是一位个性化辅导专家，根据学生的答题情况提供专业的学习建议。
 分析要点：
 1. 识别学生的学习模式和特点
@@ -115,8 +182,62 @@ class IntelligentTutoringSystem:
 - 后续学习计划"""
         }
     
+    def _llm_for(self, task: str) -> Any:
+        """按任务类型（system_prompts 的键）获取LLM，多模型路由时按该任务的实时表现选择模型"""
+        if isinstance(self.llm, RoutingLLM):
+            return self.llm.for_task(task)
+        return self.llm
+    
+    def _structured_llm_for(self, task: str, schema: type) -> Any:
+        """按任务类型获取返回 schema 结构的LLM，未启用结构化输出时与 _llm_for 相同"""
+        if not self.use_structured_output:
+            return self._llm_for(task)
+        llm = self._structured_llms.get((task, schema))
+        if llm is None:
+            if isinstance(self.llm, RoutingLLM):
+                # 每个模型按自己的能力选择结构化输出或文本解析
+                llm = self.llm.map_providers(
+                    lambda name, provider_llm: self._wrap_structured(provider_llm, name, schema)
+                ).for_task(task)
+            else:
+                llm = self._wrap_structured(self.llm, self.llm_provider, schema)
+            self._structured_llms[(task, schema)] = llm
+        return llm
+    
+    def _wrap_structured(self, llm: Any, provider_name: str, schema: type,
+                         label: str = None) -> Any:
+        if not self.use_structured_output:
+            return llm
+        method = LLMConfig.MODELS[LLMProvider(provider_name)].get('structured_output')
+        return StructuredOutputLLM(llm, label or provider_name, schema, method,
+                                   self.structured_stats)
+    
     def generate_question(self, subject: str, difficulty: str, knowledge_points: List[str]) -> Dict:
         """LLM生成题目"""
+        messages = self._question_messages(subject, difficulty, knowledge_points)
+        
+        try:
+            response = self._structured_llm_for('question_generator', GeneratedQuestion).invoke(messages)
+            return self._parse_generated_question(response.content)
+        except Exception as e:
+            print(f"生成题目时出错: {e}")
+            return None
+    
+    async def agenerate_question(self, subject: str, difficulty: str,
+                                 knowledge_points: List[str]) -> Dict:
+        """LLM生成题目（异步版本）"""
+        messages = self._question_messages(subject, difficulty, knowledge_points)
+        
+        try:
+            response = await self._structured_llm_for(
+                'question_generator', GeneratedQuestion).ainvoke(messages)
+            return self._parse_generated_question(response.content)
+        except Exception as e:
+            print(f"生成题目时出错: {e}")
+            return None
+    
+    def _question_messages(self, subject: str, difficulty: str, knowledge_points: List[str]) -> List:
+        """构造出题请求的消息"""
         prompt = f"""
 科目：{subject}
 难度：{difficulty}
@@ -125,26 +246,374 @@ class IntelligentTutoringSystem:
 请根据以上信息生成一道高质量的考试题目。
 """
         
-        messages = [
+        return [
             SystemMessage(content=self.system_prompts['question_generator']),
             HumanMessage(content=prompt)
         ]
+    
+    def _parse_generated_question(self, response_content: str) -> Optional[Dict]:
+        """解析JSON响应"""
+        question_data = extract_json(response_content, dict)
+        if question_data is None:
+            print("生成题目时出错: 返回内容不是有效的JSON格式")
+            return None
+        return question_data
+    
+    def grade_answer(self, question: str, standard_answer: str, student_answer: str, 
+                    knowledge_points: List[str],
+                    on_field: Callable[[str, Any], None] = None) -> Dict:
+        """LLM阅卷评分
+        
+        Args:
+            on_field: 传入时以流式方式请求LLM，评分结果的每个字段（如 score）一生成完
+                      就以 (字段名, 值) 回调，不必等待整个回复结束
+        """
+        grading_result, cache_keys = self._pre_grade(question, standard_answer,
+                                                     student_answer, knowledge_points)
+        if grading_result is not None:
+            return grading_result
         
+        messages = self._grading_messages(question, standard_answer, student_answer, knowledge_points)
+        
+        tiers, escalation_reason = self._grading_tiers(question, standard_answer)
+        fallback = None
+        for index, (escalated, llm) in enumerate(tiers):
+            try:
+                response = self._invoke_grader(llm, messages, on_field)
+            except Exception as e:
+                print(f"阅卷时出错: {e}")
+                response = None
+            grading_result, fallback, escalation_reason = self._review_grading(
+                response, standard_answer, escalated, index == len(tiers) - 1, fallback,
+                escalation_reason)
+            if grading_result is not None:
+                return self._accept_grading(
+                    grading_result, self._producer_cache_keys(response, cache_keys, escalated),
+                    escalation_reason, escalated)
+        return self._grading_fallback(fallback, standard_answer, escalation_reason)
+    
+    def _invoke_grader(self, llm, messages: List,
+                       on_field: Callable[[str, Any], None] = None) -> Any:
+        """请求LLM评分，返回LLM的回复；传入 on_field 时边接收边解析已完成的字段"""
+        if on_field is None:
+            return llm.invoke(messages)
+        if self.use_structured_output:
+            # 流式结果同样按 GradingResult 校验，失败时重新请求，并计入结构化输出统计
+            return llm.stream_fields(messages, on_field)
+        extractor = JsonStreamExtractor(dict)
+        provider = None
+        for chunk in llm.stream(messages):
+            provider = provider or served_by(chunk)
+            for key, value in extractor.feed(chunk.content):
+                on_field(key, value)
+        return AIMessage(content=extractor.text,
+                         response_metadata={SERVED_BY_KEY: provider} if provider else {})
+    
+    async def agrade_answer(self, question: str, standard_answer: str, student_answer: str,
+                            knowledge_points: List[str]) -> Dict:
+        """LLM阅卷评分（异步版本）"""
+        grading_result, cache_keys = self._pre_grade(question, standard_answer,
+                                                     student_answer, knowledge_points)
+        if grading_result is not None:
+            return grading_result
+        return await self._agrade_single(question, standard_answer, student_answer,
+                                         knowledge_points, cache_keys)
+    
+    async def agrade_exam(self, questions: List[Dict], student_answers: List[str],
+                          max_concurrency: int = 5, batch: bool = True) -> List[Dict]:
+        """批改整份试卷，返回与题目顺序一致的评分结果
+        
+        Args:
+            questions: 题目列表（get_questions_by_subject 的返回值）
+            student_answers: 与题目一一对应的学生答案
+            max_concurrency: 同时进行的LLM请求数上限
+            batch: 为True时需要LLM评分的题目合并为一次请求，阅卷提示词只发送一次；
+                   批量结果中缺失或格式不正确的题目再单独并发重试
+        """
+        results: List[Optional[Dict]] = []
+        pending = []
+        for index, (question_data, student_answer) in enumerate(zip(questions, student_answers)):
+            grading_result, cache_keys = self._pre_grade(
+                question_data['question'], question_data['standard_answer'],
+                student_answer, question_data['knowledge_points']
+            )
+            results.append(grading_result)
+            if grading_result is None:
+                pending.append((index, cache_keys))
+        
+        # 分级阅卷时开放性问答直接交给升级模型，不参与批量请求
+        batch_pending = [(index, cache_keys) for index, cache_keys in pending
+                         if not (self.cascade and self.cascade.skip_base(
+                             questions[index]['question'], questions[index]['standard_answer']))]
+        low_confidence: Dict[int, Dict] = {}
+        if batch and len(batch_pending) > 1:
+            batch_results, low_confidence = await self._agrade_batch(
+                questions, student_answers, batch_pending)
+            for index, _ in batch_pending:
+                results[index] = batch_results.get(index)
+            self.batch_stats['retried'] += sum(
+                1 for index, _ in batch_pending
+                if results[index] is None and index not in low_confidence)
+            pending = [(index, cache_keys) for index, cache_keys in pending if results[index] is None]
+        
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def grade(index: int, cache_keys: Optional[Dict[str, str]]):
+            question_data = questions[index]
+            async with semaphore:
+                results[index] = await self._agrade_single(
+                    question_data['question'],
+                    question_data['standard_answer'],
+                    student_answers[index],
+                    question_data['knowledge_points'],
+                    cache_keys,
+                    fallback=low_confidence.get(index)
+                )
+        
+        await asyncio.gather(*[grade(index, cache_keys) for index, cache_keys in pending])
+        return results
+    
+    def grade_exam(self, questions: List[Dict], student_answers: List[str],
+                   max_concurrency: int = 5, batch: bool = True) -> List[Dict]:
+        """批改整份试卷（同步调用入口），耗时约等于一次LLM请求"""
+        return asyncio.run(self.agrade_exam(questions, student_answers, max_concurrency, batch))
+    
+    async def _agrade_single(self, question: str, standard_answer: str, student_answer: str,
+                             knowledge_points: List[str], cache_keys: Optional[Dict[str, str]],
+                             fallback: Dict = None) -> Dict:
+        """单独请求LLM评分一道题（已经过快速路径和缓存检查）
+        
+        Args:
+            fallback: 基础模型已给出但置信度不足的结果，传入时直接升级，升级失败时使用该结果
+        """
+        messages = self._grading_messages(question, standard_answer, student_answer, knowledge_points)
+        
+        tiers, escalation_reason = self._grading_tiers(
+            question, standard_answer, 'low_confidence' if fallback else None)
+        for index, (escalated, llm) in enumerate(tiers):
+            try:
+                response = await llm.ainvoke(messages)
+            except Exception as e:
+                print(f"阅卷时出错: {e}")
+                response = None
+            grading_result, fallback, escalation_reason = self._review_grading(
+                response, standard_answer, escalated, index == len(tiers) - 1, fallback,
+                escalation_reason)
+            if grading_result is not None:
+                return self._accept_grading(
+                    grading_result, self._producer_cache_keys(response, cache_keys, escalated),
+                    escalation_reason, escalated)
+        return self._grading_fallback(fallback, standard_answer, escalation_reason)
+    
+    def _grading_tiers(self, question: str, standard_answer: str,
+                       escalation_reason: str = None) -> Tuple[List[Tuple[bool, Any]], Optional[str]]:
+        """本题依次尝试的模型 [(是否为升级模型, LLM), ...] 及初始的升级原因"""
+        base = (False, self._structured_llm_for('grader', GradingResult))
+        if not self.cascade:
+            return [base], None
+        escalated = (True, self._escalation_grader)
+        if escalation_reason:
+            return [escalated], escalation_reason
+        if self.cascade.skip_base(question, standard_answer):
+            return [escalated], 'open_ended'
+        return [base, escalated], None
+    
+    def _review_grading(self, response: Any, standard_answer: str, escalated: bool, is_last: bool,
+                        fallback: Optional[Dict], escalation_reason: Optional[str]
+                        ) -> Tuple[Optional[Dict], Optional[Dict], Optional[str]]:
+        """检查一个模型的评分，返回 (采用的结果或None, 备用结果, 升级原因)
+        
+        结构化输出按 GradingResult 校验过的结果为准，校验失败（parsed 为None）视为该模型评分失败，
+        不再从原始回复中解析；文本回复同样检查分数范围。
+        基础模型的结果置信度不足时不立即采用，作为备用结果并继续升级。
+        """
+        if isinstance(response, StructuredResponse):
+            grading_result = response.parsed
+        else:
+            grading_result = extract_json(response.content, dict) if response is not None else None
+        if isinstance(grading_result, dict):
+            grading_result = self._validate_grading_result(grading_result, standard_answer)
+        if grading_result is None:
+            if response is not None:
+                print("阅卷返回的内容不是有效的评分结果")
+            return None, fallback, escalation_reason or (None if escalated else 'base_failed')
+        if escalated or is_last or self.cascade.is_confident(grading_result):
+            return grading_result, fallback, escalation_reason
+        return None, grading_result, 'low_confidence'
+    
+    def _accept_grading(self, grading_result: Dict, cache_keys: Optional[Dict[str, str]],
+                        escalation_reason: Optional[str], escalated: bool = False) -> Dict:
+        """采用LLM的评分结果：记录分级阅卷统计，结果完整且有把握时按给出结果的模型写入缓存"""
+        if self.cascade:
+            self.cascade.record(escalation_reason)
+        if cache_keys and self._is_cacheable(grading_result):
+            cache_key = cache_keys['escalation' if escalated else 'base']
+            if self.grading_cache:
+                self.grading_cache.put(cache_key, grading_result)
+            if self.semantic_cache:
+                self.semantic_cache.put(cache_keys['base'], grading_result)
+        return grading_result
+    
+    def _producer_cache_keys(self, response: Any, cache_keys: Optional[Dict[str, str]],
+                             escalated: bool = False) -> Optional[Dict[str, str]]:
+        """缓存键按主模型（及升级模型）生成；多模型路由时由备用模型（对冲或故障转移）给出、
+        或无法确定来源的结果不写入缓存，返回None"""
+        if escalated or not isinstance(self.llm, RoutingLLM) or \
+                served_by(response) == self.llm.primary_provider:
+            return cache_keys
+        return None
+    
+    def _is_cacheable(self, grading_result: Dict) -> bool:
+        """有分数、且模型自报的置信度不低于阈值（未报置信度视为有把握）的结果才能复用"""
+        if 'score' not in grading_result:
+            return False
+        confidence = grading_confidence(grading_result)
+        return confidence is None or confidence >= self.confidence_threshold
+    
+    def _grading_fallback(self, fallback: Optional[Dict], standard_answer: str,
+                          escalation_reason: Optional[str]) -> Dict:
+        """所有模型都没有给出可用结果时，使用置信度不足的基础模型结果或默认结果（均不写入缓存）"""
+        if fallback is not None:
+            return self._accept_grading(fallback, None, escalation_reason)
+        return self._grading_error(standard_answer, "评分系统出错")
+    
+    async def _agrade_batch(self, questions: List[Dict], student_answers: List[str],
+                            pending: List[Tuple[int, Optional[Dict[str, str]]]]
+                            ) -> Tuple[Dict[int, Dict], Dict[int, Dict]]:
+        """把多道题合并为一次LLM请求
+        
+        Returns:
+            ({题目下标: 校验通过的评分结果}, {题目下标: 置信度不足、需要升级的评分结果})
+        """
+        items = []
+        for number, (index, _) in enumerate(pending, 1):
+            question_data = questions[index]
+            items.append(f"""【第{number}题】
+题目：{question_data['question']}
+标准答案：{question_data['standard_answer']}
+学生答案：{student_answers[index]}
+涉及知识点：{', '.join(question_data['knowledge_points'])}
+""")
+        prompt = "\n".join(items) + f"\n请对以上{len(pending)}道题的学生答案逐题评分和分析。"
+        messages = [
+            SystemMessage(content=self.system_prompts['batch_grader']),
+            HumanMessage(content=prompt)
+        ]
+        
+        self.batch_stats['batches'] += 1
+        self.batch_stats['items'] += len(pending)
         try:
-            response = self.llm.invoke(messages)
-            # 解析JSON响应
-            question_data = self.parse_llm_json_response(response.content)
-            if question_data is None:
-                print("生成题目时出错: 返回内容不是有效的JSON格式")
-                return None
-            return question_data
+            response = await self._llm_for('batch_grader').ainvoke(messages)
         except Exception as e:
-            print(f"生成题目时出错: {e}")
+            print(f"批量阅卷时出错: {e}")
+            return {}, {}
+        
+        batch_results = extract_json(response.content)
+        if isinstance(batch_results, dict):
+            # 部分模型会把数组包在一个对象里
+            batch_results = next((value for value in batch_results.values()
+                                  if isinstance(value, list)), None)
+        if not isinstance(batch_results, list):
+            print("批量阅卷返回的内容不是有效的JSON数组，改为逐题评分")
+            return {}, {}
+        
+        graded, low_confidence = {}, {}
+        for item in batch_results:
+            if not isinstance(item, dict):
+                continue
+            number = item.get('id')
+            if isinstance(number, str) and number.strip().isdigit():
+                number = int(number)
+            if not isinstance(number, int) or not 1 <= number <= len(pending):
+                continue
+            index, cache_keys = pending[number - 1]
+            if index in graded or index in low_confidence:
+                continue
+            grading_result = self._validate_grading_result(
+                item, questions[index]['standard_answer'])
+            if grading_result is None:
+                continue
+            if self.cascade and not self.cascade.is_confident(grading_result):
+                low_confidence[index] = grading_result
+                continue
+            graded[index] = self._accept_grading(
+                grading_result, self._producer_cache_keys(response, cache_keys), None)
+        return graded, low_confidence
+    
+    @staticmethod
+    def _validate_grading_result(item: Dict, standard_answer: str) -> Optional[Dict]:
+        """校验单道题的评分结果（批量阅卷的每一项、单题阅卷的回复），分数缺失或越界时返回None"""
+        score = item.get('score')
+        if isinstance(score, str):
+            try:
+                score = float(score)
+            except ValueError:
+                return None
+        if isinstance(score, bool) or not isinstance(score, (int, float)) or not 0 <= score <= 10:
+            return None
+        if isinstance(score, float) and score.is_integer():
+            score = int(score)
+        analysis = item.get('analysis')
+        if not isinstance(analysis, str) or not analysis.strip():
+            return None
+        weak_points = item.get('weak_points') or []
+        if not isinstance(weak_points, list):
             return None
+        return {
+            "score": score,
+            "analysis": analysis,
+            "weak_points": [str(point) for point in weak_points],
+            "suggestions": item.get('suggestions') or "",
+            "correct_answer": item.get('correct_answer') or standard_answer,
+            "confidence": item.get('confidence')
+        }
     
-    def grade_answer(self, question: str, standard_answer: str, student_answer: str, 
-                    knowledge_points: List[str]) -> Dict:
-        """LLM阅卷评分"""
+    def _pre_grade(self, question: str, standard_answer: str, student_answer: str,
+                   knowledge_points: List[str]) -> Tuple[Optional[Dict], Optional[Dict[str, str]]]:
+        """调用LLM之前的快速路径，返回 (评分结果或None, 缓存键)
+        
+        缓存键按给出结果的模型区分：{'base': 基础模型的键, 'escalation': 升级模型的键}
+        """
+        # 能明确判断对错的客观题答案直接在本地判分
+        if self.fast_grader:
+            fast_result = self.fast_grader.grade(standard_answer, student_answer, knowledge_points)
+            if fast_result is not None:
+                return fast_result, None
+        
+        if not (self.grading_cache or self.semantic_cache):
+            return None, None
+        model_name = LLMConfig.MODELS[LLMProvider(self.llm_provider)]['model_name']
+        cache_keys = {'base': GradingCache.make_key(question, standard_answer, student_answer,
+                                                    self.llm_provider, model_name,
+                                                    GRADER_PROMPT_VERSION)}
+        if self.cascade:
+            cache_keys['escalation'] = GradingCache.make_key(
+                question, standard_answer, student_answer, self.llm_provider,
+                self.escalation_model, GRADER_PROMPT_VERSION)
+        
+        # 相同题目的相同答案直接复用历史评分：优先使用升级模型的结果，
+        # 开放性问答只由升级模型评分，不复用基础模型的结果
+        if self.grading_cache:
+            lookup_keys = [cache_keys['escalation']] if self.cascade else []
+            if not (self.cascade and self.cascade.skip_base(question, standard_answer)):
+                lookup_keys.append(cache_keys['base'])
+            cached_result = self.grading_cache.get_first(lookup_keys)
+            if cached_result is not None:
+                return cached_result, cache_keys
+        
+        # 同一道题只差标点、语序的相似答案复用历史评分
+        if self.semantic_cache:
+            scope = SemanticGradingCache.make_scope(question, standard_answer, self.llm_provider,
+                                                    model_name, GRADER_PROMPT_VERSION)
+            similar_result = self.semantic_cache.lookup(scope, cache_keys['base'], student_answer)
+            if similar_result is not None:
+                return similar_result, None
+        
+        return None, cache_keys
+    
+    def _grading_messages(self, question: str, standard_answer: str, student_answer: str,
+                          knowledge_points: List[str]) -> List:
+        """构造阅卷请求的消息"""
         prompt = f"""
 题目：{question}
 标准答案：{standard_answer}
@@ -154,38 +623,85 @@ class IntelligentTutoringSystem:
 请对学生答案进行评分和分析。
 """
         
-        messages = [
+        return [
             SystemMessage(content=self.system_prompts['grader']),
             HumanMessage(content=prompt)
         ]
+    
+    @staticmethod
+    def _grading_error(standard_answer: str, analysis: str) -> Dict:
+        """阅卷失败时的默认结果"""
+        return {
+            "score": 0,
+            "analysis": analysis,
+            "weak_points": [],
+            "suggestions": "请重新提交答案",
+            "correct_answer": standard_answer
+        }
+    
+    def get_grading_stats(self) -> Dict:
+        """阅卷统计：本地快速阅卷处理的比例、缓存命中率、批量阅卷、多模型路由、分级阅卷升级情况，
+        以及阅卷和出题请求在各模型上的解析失败和重新请求次数"""
+        return {
+            'fast_path': self.fast_grader.stats() if self.fast_grader else None,
+            'cache': self.grading_cache.stats() if self.grading_cache else None,
+            'semantic_cache': self.semantic_cache.stats() if self.semantic_cache else None,
+            'batch': dict(self.batch_stats),
+            'routing': self.llm.stats() if isinstance(self.llm, RoutingLLM) else None,
+            'cascade': self.cascade.stats() if self.cascade else None,
+            'structured_output': self.structured_stats.snapshot()
+        }
+    
+    def generate_tutoring_report(self, student_name: str, exam_results: Dict) -> str:
+        """生成个性化辅导报告"""
+        messages = self._tutoring_messages(student_name, exam_results)
         
         try:
-            response = self.llm.invoke(messages)
-            grading_result = self.parse_llm_json_response(response.content)
-            
-            # 检查是否成功解析为JSON
-            if grading_result is None:
-                print(f"阅卷返回的内容不是有效的JSON格式")
-                return {
-                    "score": 0,
-                    "analysis": "评分系统出错：返回内容格式不正确",
-                    "weak_points": [],
-                    "suggestions": "请重新提交答案",
-                    "correct_answer": standard_answer
-                }
-            return grading_result
+            response = self._llm_for('tutor').invoke(messages)
+            return response.content
         except Exception as e:
-            print(f"阅卷时出错: {e}")
-            return {
-                "score": 0,
-                "analysis": "评分系统出错",
-                "weak_points": [],
-                "suggestions": "请重新提交答案",
-                "correct_answer": standard_answer
-            }
+            print(f"生成辅导报告时出错: {e}")
+            return f"为{student_name}生成辅导报告时出现错误，请稍后重试。"
     
-    def generate_tutoring_report(self, student_name: str, exam_results: Dict) -> str:
-        """生成个性化辅导报告"""
+    def stream_tutoring_report(self, student_name: str, exam_results: Dict) -> Iterator[str]:
+        """流式生成个性化辅导报告，模型每返回一段文本就立即产出，无需等待整篇报告完成"""
+        messages = self._tutoring_messages(student_name, exam_results)
+        
+        started = False
+        try:
+            for chunk in self._llm_for('tutor').stream(messages):
+                text = chunk.content if isinstance(chunk.content, str) else ''
+                if text:
+                    started = True
+                    yield text
+        except Exception as e:
+            print(f"\n生成辅导报告时出错: {e}")
+            if started:
+                yield "\n\n（报告生成中断，以上内容可能不完整）"
+            else:
+                yield f"为{student_name}生成辅导报告时出现错误，请稍后重试。"
+    
+    async def astream_tutoring_report(self, student_name: str,
+                                      exam_results: Dict) -> AsyncIterator[str]:
+        """流式生成个性化辅导报告（异步版本）"""
+        messages = self._tutoring_messages(student_name, exam_results)
+        
+        started = False
+        try:
+            async for chunk in self._llm_for('tutor').astream(messages):
+                text = chunk.content if isinstance(chunk.content, str) else ''
+                if text:
+                    started = True
+                    yield text
+        except Exception as e:
+            print(f"\n生成辅导报告时出错: {e}")
+            if started:
+                yield "\n\n（报告生成中断，以上内容可能不完整）"
+            else:
+                yield f"为{student_name}生成辅导报告时出现错误，请稍后重试。"
+    
+    def _tutoring_messages(self, student_name: str, exam_results: Dict) -> List:
+        """构造辅导报告请求的消息"""
         # 整理学生答题数据
         total_score = exam_results['total_score']
         answers = exam_results['answers']
@@ -221,20 +737,19 @@ class IntelligentTutoringSystem:
 请为该学生生成详细的个性化辅导报告。
 """
         
-        messages = [
+        return [
             SystemMessage(content=self.system_prompts['tutor']),
             HumanMessage(content=prompt)
         ]
-        
-        try:
-            response = self.llm.invoke(messages)
-            return response.content
-        except Exception as e:
-            print(f"生成辅导报告时出错: {e}")
-            return f"为{student_name}生成辅导报告时出现错误，请稍后重试。"
     
-    def conduct_exam(self, student_name: str, subject: str, grade: str = None) -> int:
-        """进行考试流程"""
+    def conduct_exam(self, student_name: str, subject: str, grade: str = None,
+                     buffered: bool = False, submit_all: bool = False) -> int:
+        """进行考试流程
+        
+        Args:
+            buffered: 为True时答案先缓存在内存和本地日志中，交卷时与总分一起在一个事务中写入数据库
+            submit_all: 为True时学生先作答全部题目再统一交卷，所有题目并发批改
+        """
         print(f"\n=== 欢迎 {student_name} 参加 {subject} 测试 ===")
         
         # 创建学生记录
@@ -254,74 +769,110 @@ class IntelligentTutoringSystem:
         
         total_score = 0
         
-        # 逐题答题
-        for i, question_data in enumerate(questions, 1):
-            print(f"\n--- 第 {i} 题 ---")
-            print(f"题目：{question_data['question']}")
-            
-            # 学生答题
-            student_answer = input("请输入你的答案：").strip()
-            
-            if not student_answer:
-                student_answer = "未作答"
+        # 缓冲模式下答案先写入本地日志，交卷时一次性提交
+        session = BufferedExamSession(self.db, exam_id) if buffered else None
+        save_answer = session.add_answer if session else partial(self.db.save_answer, exam_id)
+        
+        if submit_all:
+            # 先作答全部题目，交卷后并发批改
+            student_answers = []
+            for i, question_data in enumerate(questions, 1):
+                print(f"\n--- 第 {i} 题 ---")
+                print(f"题目：{question_data['question']}")
+                student_answers.append(input("请输入你的答案：").strip() or "未作答")
             
-            # LLM阅卷
-            print("正在评分中...")
-            grading_result = self.grade_answer(
-                question_data['question'],
-                question_data['standard_answer'],
-                student_answer,
-                question_data['knowledge_points']
-            )
+            print("\n已交卷，正在批改全部题目...")
+            grading_results = self.grade_exam(questions, student_answers)
             
-            # 确保grading_result包含所有必要的键
-            if grading_result and isinstance(grading_result, dict):
-                score = grading_result.get('score', 0)
-                analysis = grading_result.get('analysis', '无分析')
-                weak_points = grading_result.get('weak_points', [])
-                
-                total_score += score
+            for i, (question_data, student_answer, grading_result) in enumerate(
+                    zip(questions, student_answers, grading_results), 1):
+                print(f"\n--- 第 {i} 题 ---")
+                print(f"题目：{question_data['question']}")
+                print(f"你的答案：{student_answer}")
+                total_score += self._record_grading(save_answer, question_data,
+                                                    student_answer, grading_result)
+                print("-" * 50)
+        else:
+            # 逐题答题
+            for i, question_data in enumerate(questions, 1):
+                print(f"\n--- 第 {i} 题 ---")
+                print(f"题目：{question_data['question']}")
                 
-                # 保存答案记录
-                self.db.save_answer(
-                    exam_id,
-                    question_data['id'],
-                    student_answer,
-                    score,
-                    analysis,
-                    weak_points
-                )
+                # 学生答题
+                student_answer = input("请输入你的答案：").strip()
                 
-                # 显示即时反馈
-                print(f"得分：{score}/10")
-                print(f"分析：{analysis}")
+                if not student_answer:
+                    student_answer = "未作答"
                 
-                if weak_points:
-                    print(f"薄弱点：{', '.join(weak_points)}")
-            else:
-                print("评分系统返回了无效的结果")
-                # 使用默认值
-                self.db.save_answer(
-                    exam_id,
-                    question_data['id'],
+                # LLM阅卷，得分一生成就先显示，分析随后给出
+                print("正在评分中...")
+                grading_result = self.grade_answer(
+                    question_data['question'],
+                    question_data['standard_answer'],
                     student_answer,
-                    0,
-                    "评分系统出错",
-                    []
+                    question_data['knowledge_points'],
+                    on_field=self._show_preliminary_score
                 )
-                print("得分：0/10")
-                print("分析：评分系统出错")
-            
-            print("-" * 50)
+                
+                total_score += self._record_grading(save_answer, question_data,
+                                                    student_answer, grading_result)
+                print("-" * 50)
         
         # 完成考试
-        self.db.complete_exam(exam_id, total_score)
+        if session:
+            session.commit(total_score)
+        else:
+            self.db.complete_exam(exam_id, total_score)
         
         print(f"\n=== 考试完成 ===")
         print(f"总分：{total_score}/50")
         
         return exam_id
     
+    @staticmethod
+    def _show_preliminary_score(key: str, value: Any):
+        if key == 'score':
+            print(f"初步得分：{value}/10，正在生成分析...")
+    
+    def _record_grading(self, save_answer, question_data: Dict, student_answer: str,
+                        grading_result: Dict) -> float:
+        """保存一道题的评分结果并显示反馈，返回该题得分"""
+        # 确保grading_result包含所有必要的键
+        if grading_result and isinstance(grading_result, dict):
+            score = grading_result.get('score', 0)
+            analysis = grading_result.get('analysis', '无分析')
+            weak_points = grading_result.get('weak_points', [])
+            
+            # 保存答案记录
+            save_answer(
+                question_data['id'],
+                student_answer,
+                score,
+                analysis,
+                weak_points
+            )
+            
+            # 显示即时反馈
+            print(f"得分：{score}/10")
+            print(f"分析：{analysis}")
+            
+            if weak_points:
+                print(f"薄弱点：{', '.join(weak_points)}")
+            return score
+        
+        print("评分系统返回了无效的结果")
+        # 使用默认值
+        save_answer(
+            question_data['id'],
+            student_answer,
+            0,
+            "评分系统出错",
+            []
+        )
+        print("得分：0/10")
+        print("分析：评分系统出错")
+        return 0
+    
     def generate_final_report(self, exam_id: int) -> str:
         """生成最终的学习报告"""
         exam_results = self.db.get_exam_results(exam_id)
@@ -335,6 +886,16 @@ class IntelligentTutoringSystem:
         )
         
         return tutoring_report
+    
+    def stream_final_report(self, exam_id: int) -> Iterator[str]:
+        """流式生成最终的学习报告"""
+        exam_results = self.db.get_exam_results(exam_id)
+        if not exam_results:
+            yield "未找到考试记录"
+            return
+        
+        print("\n=== 正在生成个性化辅导报告 ===")
+        yield from self.stream_tutoring_report(exam_results['student_name'], exam_results)
 
 # 管理员工具类
 class AdminTools:
@@ -357,47 +918,116 @@ class AdminTools:
         created_by = input("出题人：").strip()
         
         if all([subject, difficulty, question, standard_answer, created_by]):
-            question_id = self.db.add_question(
-                subject, difficulty, question, standard_answer, 
-                knowledge_points, created_by
-            )
+            try:
+                question_id = self.db.add_question(
+                    subject, difficulty, question, standard_answer, 
+                    knowledge_points, created_by
+                )
+            except DuplicateQuestionError as e:
+                # 完全重复的题目不能添加；近似重复的题目由管理员确认后仍可添加
+                if e.similarity >= 1.0:
+                    print(f"题目{e}，未添加")
+                    return
+                choice = input(f"题目{e}，确认是不同的题目并仍要添加吗? (y/n): ").strip().lower()
+                if choice != 'y':
+                    print("未添加")
+                    return
+                question_id = self.db.add_question(
+                    subject, difficulty, question, standard_answer,
+                    knowledge_points, created_by, check_near_duplicates=False
+                )
             print(f"题目添加成功！ID: {question_id}")
         else:
             print("信息不完整，添加失败")
     
-    def batch_add_questions(self, questions_data: List[Dict]):
+    def batch_add_questions(self, questions_data: List[Dict]) -> Dict:
         """批量添加题目"""
-        for q_data in questions_data:
-            try:
-                self.db.add_question(
-                    q_data['subject'],
-                    q_data['difficulty'],
-                    q_data['question'],
-                    q_data['standard_answer'],
-                    q_data.get('knowledge_points', []),
-                    q_data.get('created_by', 'System')
-                )
+        result = self.db.add_questions_bulk(questions_data)
+        failed = {error['index']: error['error'] for error in result['errors']}
+        
+        for index, q_data in enumerate(questions_data):
+            if index in failed:
+                print(f"添加题目失败: {failed[index]}")
+            else:
                 print(f"已添加题目: {q_data['question'][:30]}...")
-            except Exception as e:
-                print(f"添加题目失败: {e}")
+        return result
     
-    def view_questions(self, subject: str = None):
-        """查看题库"""
-        if subject:
-            questions = self.db.get_questions_by_subject(subject, limit=100)
-        else:
-            # 获取所有题目的简化版本
-            import sqlite3
-            conn = sqlite3.connect(self.db.db_path)
-            cursor = conn.cursor()
-            cursor.execute('SELECT id, subject, difficulty, question FROM questions')
-            rows = cursor.fetchall()
-            questions = [{'id': r[0], 'subject': r[1], 'difficulty': r[2], 'question': r[3]} for r in rows]
-            conn.close()
-        
-        if questions:
-            print(f"\n=== 题库内容 ({'所有科目' if not subject else subject}) ===")
-            for q in questions:
+    def search_questions_interactive(self):
+        """交互式全文检索题库"""
+        query = input("搜索关键词 (多个关键词用空格分隔)：").strip()
+        if not query:
+            print("关键词不能为空")
+            return
+        subject = input("限定科目 (留空搜索全部)：").strip()
+        
+        results = self.db.search_questions(query, subject or None)
+        if results:
+            print(f"\n=== 搜索结果：{query} (共 {len(results)} 条) ===")
+            for q in results:
                 print(f"ID: {q['id']} | {q['subject']} | {q['difficulty']} | {q['question'][:50]}...")
         else:
+            print("没有找到匹配的题目")
+    
+    def rebuild_weak_point_stats(self):
+        """重建学生薄弱点统计"""
+        print("正在根据答题记录重建薄弱点统计...")
+        rows = self.db.rebuild_weak_point_stats()
+        print(f"重建完成，共 {rows} 条统计记录")
+    
+    def generate_questions_interactive(self):
+        """交互式AI批量出题"""
+        print("\n=== AI批量出题 ===")
+        
+        subject = input("科目：").strip()
+        knowledge_points_str = input("知识点 (用逗号分隔)：").strip()
+        knowledge_points = [kp.strip() for kp in knowledge_points_str.split(',') if kp.strip()]
+        count_str = input("题目数量：").strip()
+        job_name = input("任务名 (留空为科目名，同名任务中断后可继续)：").strip()
+        
+        if not subject or not count_str.isdigit() or int(count_str) <= 0:
+            print("信息不完整，出题取消")
+            return None
+        
+        spec = QuestionSpec(subject, int(count_str), knowledge_points, job_name=job_name or None)
+        report = QuestionFactory(self.system).run(spec)
+        print(f"出题完成：新增 {report['inserted']} 道（此前已完成 {report['existing']} 道），"
+              f"无效 {report['invalid']}，重复 {report['duplicates']}，"
+              f"速度 {report['questions_per_minute']:.1f} 题/分钟")
+        return report
+    
+    def show_routing_stats(self):
+        """显示多模型路由的实时统计，说明各类任务的请求为什么发给某个模型"""
+        routing = self.system.get_grading_stats()['routing']
+        if routing is None:
+            print("当前只配置了一个模型，未启用多模型路由")
+            return
+        
+        print("\n=== 模型路由统计 ===")
+        print(f"请求: {routing['requests']} | 对冲: {routing['hedges']} "
+              f"(胜出 {routing['hedge_wins']}) | 故障转移: {routing['failovers']} "
+              f"| 探索: {routing['explorations']}")
+        for task, providers in routing['tasks'].items():
+            print(f"\n[{task}]")
+            for name, stats in providers.items():
+                latency = f"{stats['latency_ewma']:.2f}s" if stats['latency_ewma'] is not None else "-"
+                score = f"{stats['score']:.2f}" if stats['score'] is not None else "-"
+                state = " (熔断中)" if routing['circuit_open'].get(name) else ""
+                print(f"  {name}: 平均延迟 {latency} | 错误率 {stats['error_rate']*100:.1f}% "
+                      f"| 得分 {score} | 样本 {stats['samples']} | 主模型 {stats['routed']} 次{state}")
+    
+    def view_questions(self, subject: str = None, page_size: int = 50):
+        """查看题库（分页显示）"""
+        shown = 0
+        for q in self.db.iter_questions(subject, page_size=page_size):
+            if shown == 0:
+                print(f"\n=== 题库内容 ({'所有科目' if not subject else subject}) ===")
+            print(f"ID: {q['id']} | {q['subject']} | {q['difficulty']} | {q['question'][:50]}...")
+            shown += 1
+            
+            if shown % page_size == 0:
+                choice = input(f"已显示 {shown} 道题，按回车查看更多，输入 q 返回：").strip().lower()
+                if choice == 'q':
+                    return
+        
+        if shown == 0:
             print("题库为空")
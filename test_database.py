@@ -0,0 +1,396 @@
+"""
+测试数据库模块
+验证结构迁移与高频查询的索引使用情况，防止查询退化为全表扫描
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from database import DatabaseManager
+from migrations import MIGRATIONS, get_schema_version, _recompute_question_fingerprints
+from exam_session import BufferedExamSession, recover_exam_sessions
+from grading_cache import GradingCache
+from semantic_grading_cache import SemanticGradingCache
+from question_dedup import DuplicateQuestionError, question_fingerprint
+
+def _new_db(tmp_dir: str) -> DatabaseManager:
+    return DatabaseManager(os.path.join(tmp_dir, 'test.db'))
+
+def _assert_no_full_scan(db: DatabaseManager, sql: str, params: tuple, table: str):
+    plan = db.explain_query_plan(sql, params)
+    full_scans = [step for step in plan
+                  if step.startswith(f'SCAN {table}') and 'USING' not in step]
+    assert not full_scans, f"查询对 {table} 做了全表扫描: {plan}"
+
+def test_migrations_applied():
+    """新建的数据库应处于最新版本"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            assert get_schema_version(db.get_connection()) == MIGRATIONS[-1][0]
+
+def test_upgrade_legacy_database():
+    """没有 schema_version 表的旧数据库文件应被就地升级，数据保持不变"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'legacy.db')
+        shipped_db = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'teaching_system.db')
+        shutil.copy(shipped_db, db_path)
+
+        conn = sqlite3.connect(db_path)
+        question_count = conn.execute('SELECT COUNT(*) FROM questions').fetchone()[0]
+        conn.close()
+
+        with DatabaseManager(db_path) as db:
+            conn = db.get_connection()
+            assert get_schema_version(conn) == MIGRATIONS[-1][0]
+            assert conn.execute('SELECT COUNT(*) FROM questions').fetchone()[0] == question_count
+            # JSON 列中的知识点应回填到关联表
+            linked = conn.execute('''
+                SELECT COUNT(DISTINCT question_id) FROM question_knowledge_points
+            ''').fetchone()[0]
+            assert linked == question_count
+
+        # 再次打开时不应重复执行迁移
+        with DatabaseManager(db_path) as db:
+            rows = db.get_connection().execute('SELECT COUNT(*) FROM schema_version').fetchone()
+            assert rows[0] == len(MIGRATIONS)
+
+def test_exam_results_query_uses_index():
+    """get_exam_results 按 exam_id 查询答题记录应命中索引"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            _assert_no_full_scan(db, '''
+                SELECT a.question_id, q.question, q.standard_answer, a.student_answer,
+                       a.score, a.analysis, a.weak_points
+                FROM answers a
+                JOIN questions q ON a.question_id = q.id
+                WHERE a.exam_id = ?
+                ORDER BY a.id
+            ''', (1,), 'a')
+
+def test_weak_points_query_uses_index():
+    """薄弱点查询应直接读取统计表的索引"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            plan = db.explain_query_plan('''
+                SELECT point
+                FROM student_weak_point_stats
+                WHERE student_id = ? AND subject = ?
+                ORDER BY count DESC, last_seen DESC
+                LIMIT ?
+            ''', (1, '数学', 5))
+            assert not any(step.startswith('SCAN') for step in plan), plan
+
+def test_student_weak_points_ranking():
+    """薄弱点按出现次数排序，并且只统计指定学生和科目"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            question_id = db.add_question('数学', '简单', '3 + 5 = ?', '8', ['20以内加法'], '测试')
+            student_id = db.create_student('小明')
+            exam_id = db.create_exam(student_id, '数学')
+            db.save_answer(exam_id, question_id, '7', 0, '计算错误', ['20以内加法', '进位'])
+            db.save_answer(exam_id, question_id, '9', 0, '计算错误', ['进位'])
+            other_exam = db.create_exam(student_id, '语文')
+            db.save_answer(other_exam, question_id, '不知道', 0, '未作答', ['古诗词'])
+
+            assert db.get_student_weak_points(student_id, '数学') == ['进位', '20以内加法']
+            assert set(db.get_student_weak_points(student_id)) == {'进位', '20以内加法', '古诗词'}
+            assert db.get_student_weak_points(student_id + 1) == []
+            assert db.get_student_weak_points(student_id, '数学', limit=1) == ['进位']
+
+def test_rebuild_weak_point_stats():
+    """统计表出现偏差时，重建后应与答题记录一致"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            question_id = db.add_question('数学', '简单', '3 + 5 = ?', '8', ['20以内加法'], '测试')
+            student_id = db.create_student('小红')
+            exam_id = db.create_exam(student_id, '数学')
+            db.save_answer(exam_id, question_id, '7', 0, '计算错误', ['20以内加法'])
+            db.save_answer(exam_id, question_id, '6', 0, '计算错误', ['20以内加法'])
+
+            with db.connection() as conn:
+                conn.execute('UPDATE student_weak_point_stats SET count = 99')
+                conn.execute("INSERT INTO student_weak_point_stats VALUES (?, '数学', '多余', 1, NULL)",
+                             (student_id,))
+
+            assert db.rebuild_weak_point_stats() == 1
+            rows = db.get_connection().execute(
+                'SELECT point, count FROM student_weak_point_stats').fetchall()
+            assert rows == [('20以内加法', 2)]
+
+def test_buffered_exam_session_recovery():
+    """缓冲考试中途崩溃后，应能根据日志补写答案和总分"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            question_id = db.add_question('数学', '简单', '3 + 5 = ?', '8', ['20以内加法'], '测试')
+            exam_id = db.create_exam(db.create_student('小明'), '数学')
+
+            session = BufferedExamSession(db, exam_id)
+            session.add_answer(question_id, '8', 10, '回答正确', [])
+            session.add_answer(question_id, '7', 0, '计算错误', ['20以内加法'])
+            assert db.get_exam_results(exam_id)['answers'] == []
+
+            # 模拟进程在写最后一行日志时崩溃（进程退出后日志文件的锁随之释放）
+            with open(session.journal_path, 'a', encoding='utf-8') as f:
+                f.write('{"question_id": ')
+            session._journal.close()
+
+        with _new_db(tmp_dir) as db:
+            assert recover_exam_sessions(db) == [exam_id]
+            results = db.get_exam_results(exam_id)
+            assert results['total_score'] == 10
+            assert [a['student_answer'] for a in results['answers']] == ['8', '7']
+            # 日志已清理，再次恢复不会重复写入
+            assert recover_exam_sessions(db) == []
+
+def test_recovery_skips_live_session():
+    """仍在进行的考试会话持有日志锁，恢复时应跳过，不能提前交卷"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            question_id = db.add_question('数学', '简单', '3 + 5 = ?', '8', ['20以内加法'], '测试')
+            exam_id = db.create_exam(db.create_student('小明'), '数学')
+
+            with BufferedExamSession(db, exam_id) as session:
+                session.add_answer(question_id, '8', 10, '回答正确', [])
+                assert recover_exam_sessions(db) == []
+                assert os.path.exists(session.journal_path)
+                try:
+                    BufferedExamSession(db, exam_id)
+                except RuntimeError:
+                    pass
+                else:
+                    raise AssertionError("同一场考试打开了两个会话")
+                session.add_answer(question_id, '7', 0, '计算错误', ['20以内加法'])
+
+            results = db.get_exam_results(exam_id)
+            assert results['total_score'] == 10 and len(results['answers']) == 2
+            assert recover_exam_sessions(db) == []
+
+def test_search_questions():
+    """全文检索支持中文片段和科目过滤，并与批量导入保持同步"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            poem_id = db.add_question('语文', '中等', '请解释"春风得意马蹄疾"这句诗的含义',
+                                      '出自孟郊的《登科后》', ['古诗词理解'], '测试')
+            result = db.add_questions_bulk([
+                {'subject': '数学', 'difficulty': '简单', 'question': '小明有5个苹果，又买了3个',
+                 'standard_answer': '8个', 'knowledge_points': ['应用题']}
+            ])
+
+            assert [q['id'] for q in db.search_questions('马蹄疾')] == [poem_id]
+            assert [q['id'] for q in db.search_questions('孟郊')] == [poem_id]
+            assert [q['id'] for q in db.search_questions('苹果 应用题')] == result['ids']
+            assert db.search_questions('苹果', subject='语文') == []
+
+def test_iter_questions_keyset_pagination():
+    """分页遍历应按ID顺序返回全部题目，并支持科目过滤和断点续读"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            ids = db.add_questions_bulk([
+                {'subject': '数学' if i % 2 else '语文', 'difficulty': '简单',
+                 'question': f'题目{i}', 'standard_answer': str(i)}
+                for i in range(25)
+            ])['ids']
+
+            assert [q['id'] for q in db.iter_questions(page_size=10)] == ids
+            math_ids = [q['id'] for q in db.iter_questions('数学', page_size=4)]
+            assert math_ids == ids[1::2]
+            assert [q['id'] for q in db.iter_questions('数学', after_id=math_ids[5])] == math_ids[6:]
+            _assert_no_full_scan(db, '''
+                SELECT id FROM questions WHERE id > ? AND subject = ? ORDER BY id LIMIT ?
+            ''', (0, '数学', 10), 'questions')
+
+def test_question_cache():
+    """重复抽题应命中缓存，新增题目后能被抽到，超出容量时按LRU淘汰"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with DatabaseManager(os.path.join(tmp_dir, 'test.db'), question_cache_size=3) as db:
+            ids = db.add_questions_bulk([
+                {'subject': '数学', 'difficulty': '简单', 'question': f'{i} + 1 = ?',
+                 'standard_answer': str(i + 1), 'knowledge_points': ['20以内加法']}
+                for i in range(3)
+            ])['ids']
+
+            assert len(db.get_questions_by_subject('数学', limit=3)) == 3
+            assert len(db.get_questions_by_subject('数学', limit=3)) == 3
+            stats = db.get_cache_stats()
+            assert (stats['hits'], stats['misses']) == (3, 3)
+
+            new_id = db.add_question('数学', '简单', '9 + 1 = ?', '10', ['20以内加法'], '测试')
+            sampled = {q['id'] for q in db.get_questions_by_subject('数学', limit=10)}
+            assert sampled == set(ids) | {new_id}
+            assert db.get_cache_stats()['size'] == 3
+            assert db.get_cache_stats()['evictions'] == 1
+
+def test_grading_cache():
+    """规范化后相同的答案命中缓存，过期条目失效，超出容量时淘汰最久未使用的条目"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            cache = GradingCache(db, max_entries=2)
+            key = GradingCache.make_key('3 + 5 = ?', '8', ' ８ ', 'qwen3', 'qwen-turbo', '1')
+            assert key == GradingCache.make_key('3 + 5 = ?', '8', '8', 'qwen3', 'qwen-turbo', '1')
+            assert key != GradingCache.make_key('3 + 5 = ?', '8', '8', 'qwen3', 'qwen-plus', '1')
+
+            assert cache.get(key) is None
+            cache.put(key, {'score': 10, 'analysis': '回答正确', 'weak_points': []})
+            assert cache.get(key)['score'] == 10
+
+            cache.ttl_seconds = -1
+            assert cache.get(key) is None
+            cache.ttl_seconds = 3600
+
+            cache.EVICT_CHECK_INTERVAL = 1
+            for i in range(3):
+                cache.put(f'key-{i}', {'score': i})
+            assert cache.get('key-0') is None
+            assert cache.get('key-2') == {'score': 2}
+
+def test_semantic_grading_cache():
+    """只差标点、语序的答案复用评分，否定或数字不同的答案不复用，抽查时记录分数偏差"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            cache = SemanticGradingCache(db, threshold=0.8, audit_rate=0)
+            scope = SemanticGradingCache.make_scope('解释诗句', '喜悦', 'qwen3', 'qwen-turbo', '2')
+            answer = '表达了诗人考中进士后喜悦得意的心情'
+            assert cache.lookup(scope, 'k1', answer) is None
+            cache.put('k1', {'score': 9, 'analysis': '理解正确'})
+
+            assert cache.lookup(scope, 'k2', '诗人考中进士后，表达了喜悦、得意的心情。')['score'] == 9
+            assert cache.lookup(scope, 'k3', '表达了诗人没有考中进士后喜悦得意的心情') is None
+            assert cache.lookup(scope, 'k4', '李白') is None
+            other_scope = SemanticGradingCache.make_scope('解释诗句', '喜悦', 'qwen3', 'qwen-plus', '2')
+            assert cache.lookup(other_scope, 'k5', answer) is None
+
+            # 重新加载后仍能命中，抽查的答案重新评分并统计偏差
+            cache = SemanticGradingCache(db, threshold=0.8, audit_rate=1)
+            assert cache.lookup(scope, 'k6', answer + '。') is None
+            cache.put('k6', {'score': 7, 'analysis': '基本正确'})
+            stats = cache.stats()
+            assert stats['audits'] == 1 and stats['max_abs_drift'] == 2
+
+def test_subject_filter_uses_index():
+    """按科目、难度筛选题目应命中索引"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            _assert_no_full_scan(db, 'SELECT id FROM questions WHERE subject = ?',
+                                 ('数学',), 'questions')
+            _assert_no_full_scan(db, 'SELECT id FROM questions WHERE subject = ? AND difficulty = ?',
+                                 ('数学', '简单'), 'questions')
+
+def test_question_deduplication():
+    """完全重复和近似重复的题目不能写入，只改了数字的题目不算重复"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            first_id = db.add_question('数学', '简单', '小明有5个苹果，又买了3个，一共有几个？', '8个',
+                                       ['加法'], 'test')
+            for duplicate in ('小明有5个苹果,又买了3个,一共有几个?',
+                              '小明有5个苹果，又买了3个，一共有多少个？'):
+                try:
+                    db.add_question('数学', '简单', duplicate, '8个', ['加法'], 'test')
+                except DuplicateQuestionError as e:
+                    assert e.existing_id == first_id
+                else:
+                    raise AssertionError(f"重复题目被写入: {duplicate}")
+            assert db.add_question('数学', '简单', '小明有6个苹果，又买了3个，一共有几个？', '9个',
+                                   ['加法'], 'test')
+
+            result = db.add_questions_bulk([
+                {'subject': '数学', 'difficulty': '简单', 'question': '3 + 5 = ?', 'standard_answer': '8'},
+                {'subject': '数学', 'difficulty': '简单', 'question': '3+5=?', 'standard_answer': '8'},
+                {'subject': '数学', 'difficulty': '简单', 'question': '小明有5个苹果又买了3个一共有几个',
+                 'standard_answer': '8个'},
+                {'subject': '数学', 'difficulty': '简单', 'question': '3 + 6 = ?', 'standard_answer': '9'},
+            ])
+            assert result['ids'][0] and result['ids'][3]
+            assert [error['index'] for error in result['errors']] == [1, 2]
+            assert result['errors'][0]['duplicate_of'] == result['ids'][0]
+            assert result['errors'][1]['duplicate_of'] == first_id
+
+            # 括号、小数点、分数线改变了题意，不是重复题
+            for first, second in (('(3+5)×2=?', '3+5×2=?'), ('1.5 + 2 = ?', '15 + 2 = ?'),
+                                  ('6/3=?', '63=?'), ('50%的100是多少？', '50的100是多少？')):
+                assert db.add_question('数学', '简单', first, '甲', ['运算'], 'test')
+                assert db.add_question('数学', '简单', second, '乙', ['运算'], 'test')
+            try:
+                db.add_question('数学', '简单', '（3 + 5）× 2 = ？', '甲', ['运算'], 'test')
+            except DuplicateQuestionError:
+                pass
+            else:
+                raise AssertionError("只差全角括号和空白的题目被写入")
+
+            # 选择题只改了一个词，文本相似度很高，但标准答案不同，不是重复题
+            stem = ('阅读下面的句子，选出使用了{}修辞手法的一项：A. 春风轻轻地抚摸着大地 '
+                    'B. 月亮像一个大玉盘挂在天上 C. 小鸟在枝头唱歌 D. 花儿笑弯了腰')
+            metaphor_id = db.add_question('语文', '中等', stem.format('比喻'), 'B', ['修辞'], 'test')
+            assert db.add_question('语文', '中等', stem.format('拟人'), 'A', ['修辞'], 'test')
+            try:
+                db.add_question('语文', '中等', stem.format('夸张'), 'B', ['修辞'], 'test')
+            except DuplicateQuestionError as e:
+                assert e.existing_id == metaphor_id and e.similarity < 1.0
+            else:
+                raise AssertionError("标准答案相同的近似重复题被写入")
+            # 管理员确认后可以跳过近似重复检查，完全重复仍然不能写入
+            assert db.add_question('语文', '中等', stem.format('夸张'), 'B', ['修辞'], 'test',
+                                   check_near_duplicates=False)
+            try:
+                db.add_question('语文', '中等', stem.format('比喻'), 'B', ['修辞'], 'test',
+                                check_near_duplicates=False)
+            except DuplicateQuestionError as e:
+                assert e.existing_id == metaphor_id and e.similarity == 1.0
+            else:
+                raise AssertionError("完全重复的题目被写入")
+
+def test_bulk_insert_with_concurrent_writer():
+    """批量写入在查重和写入之间有其他连接提交时，不会因无法升级为写锁而失败"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db, _new_db(tmp_dir) as other:
+            filter_duplicates = db._filter_duplicates
+            writers = []
+
+            def filter_with_concurrent_writer(*args):
+                result = filter_duplicates(*args)
+                writer = threading.Thread(target=other.create_student, args=('学生', '一年级'))
+                writer.start()
+                writers.append(writer)
+                time.sleep(0.2)
+                return result
+
+            db._filter_duplicates = filter_with_concurrent_writer
+            result = db.add_questions_bulk([
+                {'subject': '数学', 'difficulty': '简单', 'question': f'{i} + 1 = ?',
+                 'standard_answer': str(i + 1)} for i in range(3)])
+            for writer in writers:
+                writer.join()
+            assert result['errors'] == [] and all(result['ids'])
+            with other.connection() as conn:
+                assert conn.execute('SELECT COUNT(*) FROM students').fetchone()[0] == 1
+
+def test_recompute_question_fingerprints():
+    """按旧规则写入的指纹（括号被去掉时两道题指纹相同）在迁移后按新规则重新计算"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            first_id = db.add_question('数学', '简单', '3+5×2=?', '13', ['运算'], 'test')
+            with db.connection() as conn:
+                # 模拟旧规则：带括号的题目与已有题目指纹相同，只能以 NULL 写入
+                conn.execute('INSERT INTO questions (subject, difficulty, question, standard_answer, '
+                             'knowledge_points, created_by) VALUES (?, ?, ?, ?, ?, ?)',
+                             ('数学', '简单', '(3+5)×2=?', '16', '["运算"]', 'test'))
+                _recompute_question_fingerprints(conn)
+                rows = conn.execute('SELECT subject, question, fingerprint FROM questions').fetchall()
+            assert all(fingerprint == question_fingerprint(subject, question)
+                       for subject, question, fingerprint in rows)
+            try:
+                db.add_question('数学', '简单', '(3+5)×2=?', '16', ['运算'], 'test')
+            except DuplicateQuestionError as e:
+                assert e.existing_id != first_id
+            else:
+                raise AssertionError("重新计算指纹后完全重复的题目被写入")
+
+if __name__ == "__main__":
+    print("🧪 测试数据库模块")
+    print("="*50)
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"   ✅ {name}")
+    print("\n🎉 数据库测试全部通过！")
@@ -0,0 +1,54 @@
+"""
+测试客观题本地快速阅卷模块
+验证带单位的数字、选择题、符号答案和空标准答案的判定
+"""
+from fast_grader import fast_grade
+
+def _score(standard_answer: str, student_answer: str):
+    result = fast_grade(standard_answer, student_answer, ['20以内加法'])
+    return None if result is None else result['score']
+
+def test_numeric_answers_with_units():
+    """数值相同、单位一致或省略时判满分，单位不同时交给LLM"""
+    assert _score('8个', '8') == 10
+    assert _score('8个苹果', '8个') == 10
+    assert _score('8个', '答：8个。') == 10
+    assert _score('x = 4', 'x=4') == 10
+    assert _score('8个', '9个') == 0
+    assert _score('8米', '8厘米') is None
+    assert _score('8', '八') is None
+
+def test_omitted_unit_of_measure():
+    """标准答案带百分号或计量单位时，学生省略单位的答案交给LLM，不能判零分"""
+    assert _score('50%', '0.5') is None
+    assert _score('50%', '50') is None
+    assert _score('25平方厘米', '25') is None
+    assert _score('8米', '8') is None
+    assert _score('50%', '50%') == 10
+    assert _score('50%', '40%') == 0
+
+def test_choice_letters():
+    """选择题按选项字母比对，无法识别的作答交给LLM"""
+    assert _score('B', 'b') == 10
+    assert _score('B', '选B') == 10
+    assert _score('B', '答案：B') == 10
+    assert _score('B', 'C') == 0
+    assert _score('B', 'B和C') is None
+
+def test_symbol_answers():
+    """比较符号、运算符和对错符号按原样比对，不能被当作标点去掉"""
+    assert _score('<', '<') == 10
+    assert _score('<', '＜') == 10
+    assert _score('√', '√。') == 10
+    for standard, student in [('<', '>'), ('=', '<'), ('√', '×'), ('3+5', '3-5'),
+                              ('3-5', '35'), ('1/2', '12')]:
+        assert _score(standard, student) != 10, (standard, student)
+    assert _score('春天', '“春天”') == 10
+
+def test_empty_answers():
+    """学生未作答判零分；标准答案为空或只有标点时无法判断，交给LLM"""
+    assert _score('8', '') == 0
+    assert _score('8', '不知道') == 0
+    assert _score('', '8') is None
+    assert _score('', '') is None
+    assert _score('……', '！') is None
@@ -0,0 +1,134 @@
+"""
+测试整份试卷的并发阅卷
+使用模拟LLM验证结果按题目顺序返回、并发请求数受限，以及同一进程内多次调用
+grade_exam（每次都是新的事件循环）时共享的异步HTTP连接池仍然可用
+"""
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+import teaching_system
+from database import DatabaseManager
+from llm_config import LLMClientRegistry
+from teaching_system import IntelligentTutoringSystem
+
+class FakeResponse:
+    def __init__(self, content: str):
+        self.content = content
+        self.usage_metadata = None
+
+class HttpLLM:
+    """通过共享的异步HTTP连接池请求本地服务，返回服务端给出的评分"""
+
+    def __init__(self, client, url: str):
+        self.client = client
+        self.url = url
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        response = await self.client.post(self.url, content=messages[-1].content.encode('utf-8'))
+        return FakeResponse(response.text)
+
+class FakeLLM:
+    """按题目中苹果的个数给分，后面的题目返回得更快，记录同时进行的请求数
+
+    批量请求按题号倒序返回，并省略 skip 中的题号，模拟缺失的题目。
+    """
+
+    def __init__(self, skip=()):
+        self.skip = set(skip)
+        self.calls = 0
+        self.batch_calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        prompt = messages[-1].content
+        counts = [int(count) for count in re.findall(r'小明有(\d+)个苹果', prompt)]
+        if '【第' in prompt:
+            self.batch_calls += 1
+            items = [{'id': number, 'score': count, 'analysis': f'得分{count}'}
+                     for number, count in enumerate(counts, 1) if count not in self.skip]
+            return FakeResponse(json.dumps(items[::-1], ensure_ascii=False))
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.01 * (10 - counts[0]))
+        finally:
+            self.active -= 1
+        return FakeResponse(json.dumps({'score': counts[0], 'analysis': f'得分{counts[0]}'},
+                                       ensure_ascii=False))
+
+class GradingHandler(BaseHTTPRequestHandler):
+    """本地评分服务：保持长连接，每个请求都返回 8 分"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = json.dumps({'score': 8, 'analysis': '基本正确', 'weak_points': []},
+                          ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def _new_system(tmp_dir: str, llm) -> IntelligentTutoringSystem:
+    with patch.object(teaching_system, 'get_llm_by_name', lambda *args, **kwargs: llm), \
+            patch.object(teaching_system, 'DatabaseManager',
+                         lambda: DatabaseManager(os.path.join(tmp_dir, 'test.db'))):
+        return IntelligentTutoringSystem('qwen3', use_fast_grader=False, use_cascade=False,
+                                         use_structured_output=False)
+
+def _questions(count: int):
+    return [{'question': f'小明有{i}个苹果，又买了3个，一共有几个？', 'standard_answer': f'{i + 3}个',
+             'knowledge_points': ['20以内加法']} for i in range(count)]
+
+def test_results_in_question_order_with_bounded_concurrency():
+    """逐题评分时同时进行的请求不超过 max_concurrency，先返回的题目不影响结果顺序"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        llm = FakeLLM()
+        system = _new_system(tmp_dir, llm)
+        results = system.grade_exam(_questions(8), ['略'] * 8, max_concurrency=3, batch=False)
+        assert [result['score'] for result in results] == list(range(8))
+        assert llm.calls == 8 and llm.max_active == 3
+        system.db.close()
+
+def test_batch_results_in_question_order():
+    """批量结果乱序时按题号对应，缺失的题目单独重试，结果仍按题目顺序返回"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        llm = FakeLLM(skip={2, 4})
+        system = _new_system(tmp_dir, llm)
+        results = system.grade_exam(_questions(6), ['略'] * 6, max_concurrency=1)
+        assert [result['score'] for result in results] == list(range(6))
+        assert (llm.batch_calls, llm.calls, llm.max_active) == (1, 2, 1)
+        assert system.batch_stats == {'batches': 1, 'items': 6, 'retried': 2}
+        system.db.close()
+
+def test_grade_exam_twice_with_shared_http_pool():
+    """两次 grade_exam 使用不同的事件循环，第二次仍能通过共享的连接池正常评分"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GradingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    registry = LLMClientRegistry()
+    try:
+        _, http_async_client = registry._get_http_clients(base_url)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            system = _new_system(tmp_dir, HttpLLM(http_async_client, base_url + '/grade'))
+            questions = _questions(3)
+            for answers in (['3个', '4个', '5个'], ['6个', '7个', '8个']):
+                results = system.grade_exam(questions, answers, batch=False)
+                assert [result['score'] for result in results] == [8, 8, 8]
+            system.db.close()
+    finally:
+        registry.close()
+        server.shutdown()
+        server.server_close()
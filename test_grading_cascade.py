@@ -0,0 +1,219 @@
+"""
+测试分级阅卷与阅卷缓存
+使用模拟LLM验证置信度阈值、升级到更强的模型、升级失败时的备用结果，
+缓存只保存有把握的结果、并按给出结果的模型区分缓存键，以及批量阅卷结果的校验和重试
+"""
+import json
+import os
+import tempfile
+from unittest.mock import patch
+import teaching_system
+from database import DatabaseManager
+from llm_router import RoutingLLM
+from teaching_system import IntelligentTutoringSystem
+
+QUESTION = '小明有5个苹果，又买了3个，一共有几个？'
+STANDARD_ANSWER = '5 + 3 = 8，一共有8个'
+OPEN_QUESTION = '请解释为什么5 + 3 = 8'
+
+class FakeResponse:
+    def __init__(self, content: str):
+        self.content = content
+        self.usage_metadata = None
+        self.response_metadata = {}
+
+class FakeLLM:
+    """按顺序返回预设的回复，回复为异常时抛出"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    def invoke(self, messages, *args, **kwargs):
+        self.calls += 1
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return FakeResponse(reply)
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        return self.invoke(messages)
+
+    def stream(self, messages, *args, **kwargs):
+        yield self.invoke(messages)
+
+    def with_structured_output(self, schema, method=None, include_raw=False):
+        # 模拟不支持原生结构化输出的模型，改用文本解析
+        raise NotImplementedError(method)
+
+def _grading(score: int, confidence: float) -> str:
+    return json.dumps({'score': score, 'analysis': f'得分{score}', 'weak_points': [],
+                       'suggestions': '', 'correct_answer': '8个', 'confidence': confidence},
+                      ensure_ascii=False)
+
+def _new_system(tmp_dir: str, base_replies=(), escalation_replies=(),
+                use_structured_output: bool = False):
+    """创建使用模拟LLM的教学系统，返回 (系统, 基础模型, 升级模型)"""
+    base, escalation = FakeLLM(base_replies), FakeLLM(escalation_replies)
+
+    def get_llm_by_name(provider_name: str, model_name: str = None, **kwargs):
+        return escalation if model_name else base
+
+    with patch.object(teaching_system, 'get_llm_by_name', get_llm_by_name), \
+            patch.object(teaching_system, 'DatabaseManager',
+                         lambda: DatabaseManager(os.path.join(tmp_dir, 'test.db'))):
+        system = IntelligentTutoringSystem('qwen3', use_fast_grader=False,
+                                           use_structured_output=use_structured_output,
+                                           confidence_threshold=0.8)
+    return system, base, escalation
+
+def _item(number, score, confidence: float = 0.95) -> dict:
+    return {'id': number, 'score': score, 'analysis': f'得分{score}', 'confidence': confidence}
+
+def _exam(count: int):
+    return [{'question': f'小明有{i}个苹果，又买了3个，一共有几个？', 'standard_answer': f'{i + 3}个',
+             'knowledge_points': ['20以内加法']} for i in range(count)]
+
+def _grade(system: IntelligentTutoringSystem, answer: str = '8个', question: str = QUESTION):
+    return system.grade_answer(question, STANDARD_ANSWER, answer, ['20以内加法'])
+
+def test_confident_base_result_is_cached():
+    """基础模型有把握时不升级，结果按基础模型写入缓存"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        system, base, escalation = _new_system(tmp_dir, [_grading(10, 0.95)])
+        assert _grade(system)['score'] == 10
+        assert (base.calls, escalation.calls) == (1, 0)
+        assert _grade(system)['score'] == 10
+        assert (base.calls, escalation.calls) == (1, 0)
+        assert system.get_grading_stats()['cascade']['escalated'] == 0
+        system.db.close()
+
+def test_low_confidence_escalates():
+    """置信度低于阈值时升级，采用升级模型的结果，并按升级模型的缓存键保存"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        system, base, escalation = _new_system(tmp_dir, [_grading(6, 0.5)], [_grading(8, 0.9)])
+        assert _grade(system)['score'] == 8
+        assert (base.calls, escalation.calls) == (1, 1)
+        stats = system.get_grading_stats()['cascade']
+        assert stats['reasons']['low_confidence'] == 1
+
+        # 升级模型的结果保存在自己的缓存键下，再次评分直接命中
+        assert _grade(system)['score'] == 8
+        assert (base.calls, escalation.calls) == (1, 1)
+        _, cache_keys = system._pre_grade(QUESTION, STANDARD_ANSWER, '8个', ['20以内加法'])
+        assert system.grading_cache.get(cache_keys['escalation'])['score'] == 8
+        assert system.grading_cache.get(cache_keys['base']) is None
+        system.db.close()
+
+def test_escalation_failure_uses_uncached_fallback():
+    """升级模型出错时使用置信度不足的基础模型结果，但不写入缓存"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        system, base, escalation = _new_system(
+            tmp_dir, [_grading(6, 0.5), _grading(7, 0.9)],
+            [ConnectionError('连接失败'), 'not json'])
+        assert _grade(system)['score'] == 6
+        assert (base.calls, escalation.calls) == (1, 1)
+
+        # 备用结果没有缓存，再次评分仍请求LLM；升级模型返回无法解析的内容时同样使用备用结果
+        assert _grade(system)['score'] == 7
+        assert (base.calls, escalation.calls) == (2, 1)
+        assert _grade(system)['score'] == 7
+        assert base.calls == 2
+        system.db.close()
+
+def test_all_tiers_failing_returns_default():
+    """所有模型都失败时返回默认结果，不写入缓存"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        system, base, escalation = _new_system(
+            tmp_dir, ['无法评分', _grading(9, 0.9)], [TimeoutError('超时')])
+        result = _grade(system)
+        assert result['score'] == 0 and result['analysis'] == '评分系统出错'
+        assert (base.calls, escalation.calls) == (1, 1)
+        assert _grade(system)['score'] == 9
+        system.db.close()
+
+def test_open_ended_question_skips_base():
+    """开放性问答直接交给升级模型；升级模型置信度低的结果不写入缓存"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        system, base, escalation = _new_system(
+            tmp_dir, [], [_grading(7, 0.6), _grading(8, 0.9)])
+        assert _grade(system, '因为5加3等于8', OPEN_QUESTION)['score'] == 7
+        assert (base.calls, escalation.calls) == (0, 1)
+        assert _grade(system, '因为5加3等于8', OPEN_QUESTION)['score'] == 8
+        assert _grade(system, '因为5加3等于8', OPEN_QUESTION)['score'] == 8
+        assert (base.calls, escalation.calls) == (0, 2)
+        assert system.get_grading_stats()['cascade']['reasons']['open_ended'] == 2
+        system.db.close()
+
+def test_batch_retries_missing_and_invalid_items():
+    """批量结果包在对象里、题号为字符串时正常对应；缺失或分数越界的题目单独重试"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        batch_reply = json.dumps({'results': [_item('1', 8), _item(2, 15), _item(9, 7)]})
+        system, base, escalation = _new_system(
+            tmp_dir, [batch_reply, _grading(6, 0.95), _grading(6, 0.95)])
+        results = system.grade_exam(_exam(3), ['略'] * 3)
+        assert [result['score'] for result in results] == [8, 6, 6]
+        assert (base.calls, escalation.calls) == (3, 0)
+        assert system.batch_stats == {'batches': 1, 'items': 3, 'retried': 2}
+        system.db.close()
+
+def test_batch_low_confidence_items_escalate():
+    """批量结果中置信度不足的题目直接升级，不计为重试；升级失败时使用批量结果"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        batch_reply = json.dumps([_item(1, 8), _item(2, 5, 0.4), _item(3, 4, 0.3)])
+        system, base, escalation = _new_system(
+            tmp_dir, [batch_reply], [_grading(7, 0.9), ConnectionError('连接失败')])
+        results = system.grade_exam(_exam(3), ['略'] * 3, max_concurrency=1)
+        assert [result['score'] for result in results] == [8, 7, 4]
+        assert (base.calls, escalation.calls) == (1, 2)
+        assert system.batch_stats['retried'] == 0
+        assert system.get_grading_stats()['cascade']['reasons']['low_confidence'] == 2
+        system.db.close()
+
+def test_validate_grading_result():
+    """批量结果中单道题的校验：分数可以是数字字符串，缺少分析、分数越界或为布尔值时无效"""
+    validate = IntelligentTutoringSystem._validate_grading_result
+    result = validate({'score': '8.0', 'analysis': '正确', 'weak_points': ['进位']}, '8个')
+    assert result['score'] == 8 and result['correct_answer'] == '8个'
+    assert result['weak_points'] == ['进位'] and result['suggestions'] == ''
+    for item in ({'score': 11, 'analysis': '正确'}, {'score': -1, 'analysis': '正确'},
+                 {'score': True, 'analysis': '正确'}, {'score': '八', 'analysis': '正确'},
+                 {'score': 8, 'analysis': ' '}, {'score': 8, 'analysis': '正确', 'weak_points': '进位'}):
+        assert validate(item, '8个') is None, item
+
+def test_out_of_range_score_is_rejected():
+    """分数越界的回复视为评分失败并升级，不论是否使用结构化输出、是否流式显示"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        system, base, escalation = _new_system(tmp_dir, [_grading(15, 0.95)], [_grading(8, 0.9)])
+        assert _grade(system)['score'] == 8
+        assert system.get_grading_stats()['cascade']['reasons']['base_failed'] == 1
+        system.db.close()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 结构化输出校验失败后重新请求一次，仍然失败时不从原始回复中取分数
+        system, base, escalation = _new_system(
+            tmp_dir, [_grading(15, 0.95)] * 4, [_grading(8, 0.9)] * 2, use_structured_output=True)
+        assert _grade(system)['score'] == 8
+        fields = []
+        result = system.grade_answer(QUESTION, STANDARD_ANSWER, '9个', ['20以内加法'],
+                                     on_field=lambda key, value: fields.append((key, value)))
+        assert result['score'] == 8 and ('score', 15) in fields
+        assert (base.calls, escalation.calls) == (4, 2)
+        stats = system.get_grading_stats()
+        assert stats['cascade']['reasons']['base_failed'] == 2
+        assert stats['structured_output']['qwen3']['parse_failures'] == 4
+        system.db.close()
+
+def test_fallback_provider_result_is_not_cached():
+    """多模型路由时备用模型给出的结果不按主模型的缓存键保存，主模型的结果正常缓存"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        system, base, escalation = _new_system(
+            tmp_dir, [ConnectionError('连接失败'), _grading(9, 0.95)])
+        backup = FakeLLM([_grading(7, 0.95)])
+        system.llm = RoutingLLM([('qwen3', base), ('gemini', backup)], adaptive=False,
+                                default_hedge_delay=10.0)
+        assert _grade(system)['score'] == 7
+        assert _grade(system)['score'] == 9
+        assert _grade(system)['score'] == 9
+        assert (base.calls, backup.calls, escalation.calls) == (2, 1, 0)
+        system.db.close()
@@ -0,0 +1,66 @@
+"""
+测试JSON提取模块
+验证带说明文字、代码块和常见格式问题的LLM回复都能解析，以及流式输出的增量解析
+"""
+from json_extractor import extract_json, repair_json, JsonStreamExtractor
+
+GRADING_JSON = '{"score": 8, "analysis": "思路正确，{计算}有误", "weak_points": ["进位"]}'
+
+def test_extract_plain_and_fenced():
+    """纯JSON、代码块、前后带说明文字的回复都能解析"""
+    expected = {"score": 8, "analysis": "思路正确，{计算}有误", "weak_points": ["进位"]}
+    assert extract_json(GRADING_JSON) == expected
+    assert extract_json(f"```json\n{GRADING_JSON}\n```") == expected
+    assert extract_json(f"好的，评分结果如下：\n```\n{GRADING_JSON}\n```\n希望对你有帮助！") == expected
+    assert extract_json("无法评分") is None
+    assert extract_json('{"score": 8, "analysis": "未完') is None
+
+def test_extract_expected_type():
+    """按期望类型提取，跳过说明文字中无法解析的括号"""
+    text = '说明{不是JSON}，结果：[{"id": 1, "score": 10}, {"id": 2, "score": 6}]'
+    assert extract_json(text, list) == [{"id": 1, "score": 10}, {"id": 2, "score": 6}]
+    assert extract_json(text, dict) == {"id": 1, "score": 10}
+    assert extract_json(text) == [{"id": 1, "score": 10}, {"id": 2, "score": 6}]
+
+def test_repair_common_defects():
+    """尾随逗号、中文引号和冒号、带单位的分数都能修复，字符串内的内容保持不变"""
+    assert extract_json('{"score": 8, "weak_points": ["进位",],}') == {"score": 8, "weak_points": ["进位"]}
+    assert extract_json('{“score”：7，“analysis”：“答案“基本”正确”}') == {"score": 7, "analysis": "答案“基本”正确"}
+    assert extract_json('{"score": 8分, "confidence": 90%, "analysis": "得分8分/10"}') == \
+        {"score": 8, "confidence": 90, "analysis": "得分8分/10"}
+    assert extract_json('{"score": 6/10}') == {"score": 6}
+    assert repair_json('{"analysis": "a, }"}') == '{"analysis": "a, }"}'
+
+def test_repair_keeps_chinese_quotes_in_strings():
+    """字符串中的中文引号、冒号和逗号不是定界符，修复其他问题时保持不变"""
+    assert extract_json('{"score": 8分, "analysis": "学生认为：“春风得意”是指……"}') == \
+        {"score": 8, "analysis": "学生认为：“春风得意”是指……"}
+    assert extract_json('{"score": 6, "analysis": "比喻句，“春风”用得好", "weak_points": ["修辞",],}') == \
+        {"score": 6, "analysis": "比喻句，“春风”用得好", "weak_points": ["修辞"]}
+    # 中文引号定界的字符串中出现英文双引号时转义
+    assert extract_json('{“analysis”：“他说"对"，”, “score”：5分}') == \
+        {"analysis": '他说"对"，', "score": 5}
+
+def test_stream_extractor_fields():
+    """流式输出中每个顶层字段一完成就能取得"""
+    extractor = JsonStreamExtractor(dict)
+    text = "评分如下：\n```json\n" + GRADING_JSON + "\n```"
+    seen = []
+    for i in range(0, len(text), 3):
+        for key, value in extractor.feed(text[i:i + 3]):
+            seen.append((key, value, extractor.result is None))
+    assert seen[0] == ("score", 8, True)
+    assert [key for key, _, _ in seen] == ["score", "analysis", "weak_points"]
+    assert extractor.finish() == extract_json(GRADING_JSON)
+
+def test_stream_extractor_array_and_fallback():
+    """数组按元素增量解析；流式解析失败时 finish() 对全文做容错解析"""
+    extractor = JsonStreamExtractor(list)
+    completed = []
+    for chunk in ['[{"id": 1, "sco', 're": 9}, {"id": 2', ', "score": 3}]']:
+        completed.extend(extractor.feed(chunk))
+    assert completed == [(0, {"id": 1, "score": 9}), (1, {"id": 2, "score": 3})]
+
+    extractor = JsonStreamExtractor(dict)
+    extractor.feed('{“score”：5，“analysis”：“一般”}')
+    assert extractor.finish() == {"score": 5, "analysis": "一般"}
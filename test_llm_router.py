@@ -0,0 +1,237 @@
+"""
+测试多模型路由模块
+使用模拟LLM和可控时钟验证对冲等待时间、对冲请求、出错时的故障转移、包装模型后共享的状态，
+以及熔断器的状态转换和按加权平均延迟、错误率对模型排序
+"""
+import asyncio
+import time
+from llm_router import RoutingLLM, CircuitBreaker
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class FakeLLM:
+    """按指定延迟返回固定内容，error 不为None时抛出该异常"""
+
+    def __init__(self, content: str, delay: float = 0.0, error: Exception = None):
+        self.content = content
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def invoke(self, messages, *args, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.content
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.content
+
+    def stream(self, messages, *args, **kwargs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        yield self.content
+
+    def stream_fields(self, messages, on_field, *args, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        on_field('score', self.content)
+        return self.content
+
+class TimedLLM:
+    """每次调用让可控时钟前进 seconds 秒，模拟请求耗时"""
+
+    def __init__(self, clock: FakeClock, content: str, seconds: float):
+        self.clock = clock
+        self.content = content
+        self.seconds = seconds
+        self.error = None
+
+    def invoke(self, messages, *args, **kwargs):
+        self.clock.now += self.seconds
+        if self.error:
+            raise self.error
+        return self.content
+
+def _router(*providers, **kwargs) -> RoutingLLM:
+    kwargs.setdefault('adaptive', False)
+    return RoutingLLM(list(providers), **kwargs)
+
+def test_hedge_delay_from_latency_percentile():
+    """样本不足时使用默认等待时间，之后按历史耗时的高分位计算，且不低于下限"""
+    router = _router(('a', FakeLLM('A')), min_samples=5, default_hedge_delay=2.0,
+                     min_hedge_delay=0.5, hedge_percentile=95)
+    assert router.hedge_delay('a') == 2.0
+    for seconds in [0.6, 0.7, 0.8, 0.9, 3.0]:
+        router._tracker('default', 'a').record(seconds)
+    assert router.hedge_delay('a') == 3.0
+    assert router.hedge_delay('a', task='grader') == 2.0
+
+    router = _router(('a', FakeLLM('A')), min_samples=1, min_hedge_delay=0.5)
+    router._tracker('default', 'a').record(0.1)
+    assert router.hedge_delay('a') == 0.5
+
+def test_slow_primary_is_hedged():
+    """主模型超过对冲等待时间未返回时，采用备用模型先返回的结果"""
+    slow, fast = FakeLLM('A', delay=0.5), FakeLLM('B')
+    router = _router(('a', slow), ('b', fast), default_hedge_delay=0.05)
+    assert router.invoke('3 + 5 = ?') == 'B'
+    assert asyncio.run(router.ainvoke('3 + 5 = ?')) == 'B'
+    stats = router.stats()
+    assert stats['hedges'] == 2 and stats['hedge_wins'] == 2 and stats['failovers'] == 0
+
+    # 主模型在等待时间内返回时不发出对冲请求
+    router = _router(('a', FakeLLM('A')), ('b', fast), default_hedge_delay=1.0)
+    assert router.invoke('3 + 5 = ?') == 'A'
+    assert router.stats()['hedges'] == 0
+
+def test_failover_on_error():
+    """主模型出错时立即转移到下一个模型，全部出错时抛出最后一个错误"""
+    broken = FakeLLM('A', error=ConnectionError('连接失败'))
+    router = _router(('a', broken), ('b', FakeLLM('B')), default_hedge_delay=10.0)
+    assert router.invoke('3 + 5 = ?') == 'B'
+    assert asyncio.run(router.ainvoke('3 + 5 = ?')) == 'B'
+    assert list(router.stream('3 + 5 = ?')) == ['B']
+    stats = router.stats()
+    assert stats['failovers'] == 3 and stats['hedges'] == 0
+    assert stats['tasks']['default']['a']['error_rate'] > 0
+
+    router = _router(('a', broken), ('b', FakeLLM('B', error=TimeoutError('超时'))))
+    try:
+        router.invoke('3 + 5 = ?')
+    except TimeoutError:
+        pass
+    else:
+        raise AssertionError("全部模型出错时应抛出异常")
+
+def test_stream_fields_is_not_hedged():
+    """带回调的流式请求不发出对冲请求，只在出错时转移，回调不会被两个模型同时触发"""
+    slow, fast = FakeLLM('A', delay=0.2), FakeLLM('B')
+    router = _router(('a', slow), ('b', fast), default_hedge_delay=0.01)
+    fields = []
+    assert router.for_task('grader').stream_fields('3 + 5 = ?', lambda *field: fields.append(field)) == 'A'
+    assert fields == [('score', 'A')] and fast.calls == 0
+    assert router.stats()['hedges'] == 0
+
+    router = _router(('a', FakeLLM('A', error=ConnectionError('连接失败'))), ('b', fast))
+    assert router.stream_fields('3 + 5 = ?', lambda *field: None) == 'B'
+    assert router.stats()['failovers'] == 1
+
+def test_map_providers_shares_state():
+    """包装后的路由器共享统计、熔断状态和线程池"""
+    router = _router(('a', FakeLLM('A')), ('b', FakeLLM('B')))
+    wrapped = router.map_providers(lambda name, llm: FakeLLM(f'{name}!'))
+    assert wrapped.invoke('3 + 5 = ?') == 'a!'
+    assert router.invoke('3 + 5 = ?') == 'A'
+    assert wrapped._executor is router._executor
+    assert wrapped.breakers is router.breakers
+    assert router.stats()['requests'] == 2
+
+def test_circuit_breaker_transitions():
+    """连续失败后熔断；冷却结束进入半开状态只放行一次试探，试探成功后恢复，失败则重新熔断"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=10.0, clock=clock)
+    breaker.record_failure()
+    assert breaker.allow() and not breaker.is_open
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+
+    clock.now = 9.9
+    assert not breaker.allow()
+    clock.now = 10.0
+    assert breaker.allow()
+    assert not breaker.allow()
+    # 试探失败，重新计时
+    breaker.record_failure()
+    clock.now = 19.9
+    assert not breaker.allow()
+    clock.now = 20.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open and breaker.allow() and breaker.allow()
+
+    # 成功会清零失败次数，断续的失败不会触发熔断
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert not breaker.is_open
+
+def test_open_breaker_removes_provider_from_routing():
+    """熔断期间请求不再发给该模型，冷却结束后重新试探"""
+    clock = FakeClock()
+    a, b = TimedLLM(clock, 'A', 1.0), TimedLLM(clock, 'B', 1.0)
+    a.error = ConnectionError('连接失败')
+    router = _router(('a', a), ('b', b), failure_threshold=2, cooldown=30.0, clock=clock)
+    assert router.invoke('3 + 5 = ?') == 'B'
+    assert router.invoke('3 + 5 = ?') == 'B'
+    assert router.stats()['circuit_open'] == {'a': True, 'b': False}
+    assert [name for name, _ in router._candidates('default')] == ['b']
+
+    a.error = None
+    clock.now += 30.0
+    assert router.invoke('3 + 5 = ?') == 'A'
+    assert router.stats()['circuit_open'] == {'a': False, 'b': False}
+
+def test_ewma_provider_ordering():
+    """各任务按加权平均延迟和错误率分别排序，模型变慢或出错后让出主模型"""
+    clock = FakeClock()
+    router = RoutingLLM([('a', None), ('b', None)], exploration_rate=0.0, ewma_alpha=0.2,
+                        clock=clock)
+
+    def record(name: str, seconds: float, error: Exception = None):
+        started = clock()
+        clock.now += seconds
+        router._record('grader', name, started, error)
+
+    def order(task: str = 'grader'):
+        return [name for name, _ in router._candidates(task)]
+
+    # 没有样本时保持配置顺序
+    assert order() == ['a', 'b']
+    record('a', 2.0)
+    assert order() == ['a', 'b']
+    record('b', 1.0)
+    assert order() == ['b', 'a']
+    assert order('question_generator') == ['a', 'b']
+
+    # b 变慢：1.0 -> 1.6 -> 2.08，超过 a 的 2.0
+    record('b', 4.0)
+    assert order() == ['b', 'a']
+    record('b', 4.0)
+    assert order() == ['a', 'b']
+    snapshot = router.stats()['tasks']['grader']
+    assert abs(snapshot['b']['latency_ewma'] - 2.08) < 1e-9
+
+    # a 出错：错误率 0.2，得分 2.0 / 0.8 = 2.5，排到 b 之后
+    record('a', 0.0, ConnectionError('连接失败'))
+    assert order() == ['b', 'a']
+    assert abs(router.stats()['tasks']['grader']['a']['score'] - 2.5) < 1e-9
+
+def test_ewma_ordering_through_routing():
+    """通过实际路由的请求同样更新统计，更快的模型成为主模型"""
+    clock = FakeClock()
+    slow, fast = TimedLLM(clock, 'A', 3.0), TimedLLM(clock, 'B', 1.0)
+    slow.error = TimeoutError('超时')
+    router = RoutingLLM([('a', slow), ('b', fast)], exploration_rate=0.0,
+                        default_hedge_delay=10.0, clock=clock)
+    grader = router.for_task('grader')
+    assert grader.invoke('3 + 5 = ?') == 'B'
+    slow.error = None
+    # a 没有成功样本，b 成为主模型
+    assert grader.invoke('3 + 5 = ?') == 'B'
+    stats = router.stats()['tasks']['grader']
+    assert stats['b']['latency_ewma'] == 1.0 and stats['b']['routed'] == 1
+    assert stats['a']['routed'] == 1
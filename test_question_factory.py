@@ -0,0 +1,118 @@
+"""
+测试AI批量出题模块
+使用模拟的出题接口，验证生成题目的去重、部分失败时的重新生成、并发数限制以及中断后继续
+"""
+import asyncio
+import os
+import tempfile
+from database import DatabaseManager
+from question_factory import QuestionFactory, QuestionSpec, allocate_counts
+
+class FakeSystem:
+    """模拟 IntelligentTutoringSystem 的出题接口
+
+    replies 中的元素依次作为生成结果：字符串为题目内容，None 表示生成失败，
+    其他值原样返回（用于模拟格式不正确的结果）；用完后按序号生成互不重复的题目。
+    """
+
+    def __init__(self, db: DatabaseManager, replies=(), delay: float = 0.0):
+        self.db = db
+        self.replies = list(replies)
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def agenerate_question(self, subject, difficulty, knowledge_points):
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            reply = self.replies.pop(0) if self.replies else \
+                f'小明有{self.calls}个苹果，又买了{self.calls + 100}个，一共有几个？'
+            if not isinstance(reply, str):
+                return reply
+            return {'question': reply, 'standard_answer': '略', 'knowledge_points': knowledge_points}
+        finally:
+            self.active -= 1
+
+def _new_db(tmp_dir: str) -> DatabaseManager:
+    return DatabaseManager(os.path.join(tmp_dir, 'test.db'))
+
+def _factory(system: FakeSystem, **kwargs) -> QuestionFactory:
+    kwargs.setdefault('on_progress', lambda report: None)
+    return QuestionFactory(system, **kwargs)
+
+def _count(db: DatabaseManager, spec: QuestionSpec) -> int:
+    with db.connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM questions WHERE created_by = ?',
+                            (spec.created_by,)).fetchone()[0]
+
+def test_allocate_counts():
+    """按比例分配题目数，总和等于目标数量"""
+    assert allocate_counts(10, {'简单': 0.3, '中等': 0.5, '困难': 0.2}) == \
+        {'简单': 3, '中等': 5, '困难': 2}
+    assert sum(allocate_counts(7, {'简单': 1, '中等': 1, '困难': 1}).values()) == 7
+    assert allocate_counts(0, {'简单': 1}) == {'简单': 0}
+
+def test_generated_duplicates_are_regenerated():
+    """与本批或题库中已有题目重复的生成结果不写入，重新生成直到达到目标数量"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            db.add_question('数学', '简单', '3 + 5 = ?', '8', ['加法'], 'test')
+            db.add_question('数学', '简单', '小红有5支铅笔，又买了3支，一共有几支？', '略',
+                            ['加法'], 'test')
+            system = FakeSystem(db, replies=[
+                '3 + 5 = ?',                        # 与题库完全重复
+                '小红有5支铅笔，又买了3支，一共有多少支？',  # 与题库近似重复，写入时发现
+                '一道新的题目：9 - 4 = ?',
+                '一道新的题目：9 - 4 = ?',          # 与本批完全重复
+                '一道新的题目： 9-4=?',             # 只差空白和标点
+            ])
+            spec = QuestionSpec('数学', 4, ['加法'], {'简单': 1})
+            report = _factory(system, max_concurrency=1).run(spec)
+            assert report['inserted'] == 4 and report['duplicates'] == 4
+            assert report['failed'] == 0 and system.calls == 8
+            assert _count(db, spec) == 4
+
+def test_partial_failure_is_retried_within_budget():
+    """生成失败或格式不正确的题目计为无效并重新生成；超过尝试次数上限后停止"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            system = FakeSystem(db, replies=[None, {'question': '缺少标准答案的题目'}, '太短', 42])
+            spec = QuestionSpec('数学', 3, ['加法'], {'简单': 1})
+            report = _factory(system, max_concurrency=2).run(spec)
+            assert report['invalid'] == 4 and report['inserted'] == 3
+            assert _count(db, spec) == 3
+
+            system = FakeSystem(db, replies=[None] * 100)
+            spec = QuestionSpec('数学', 2, ['加法'], {'简单': 1}, job_name='全部失败')
+            report = _factory(system, max_attempts_factor=3).run(spec)
+            assert report['inserted'] == 0 and report['invalid'] == system.calls == 6
+
+def test_concurrency_limit():
+    """同时进行的出题请求不超过 max_concurrency"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            system = FakeSystem(db, delay=0.01)
+            spec = QuestionSpec('数学', 20, ['加法', '减法'])
+            report = _factory(system, max_concurrency=3, flush_size=5).run(spec)
+            assert report['inserted'] == 20
+            assert system.max_active == 3
+
+def test_resume_generates_only_missing():
+    """同名任务再次运行时只补齐尚未生成的题目"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with _new_db(tmp_dir) as db:
+            # 模拟中断：第一次只完成了其中 6 道
+            first = _factory(FakeSystem(db)).run(QuestionSpec('数学', 6, ['加法']))
+            assert first['inserted'] == 6
+
+            spec = QuestionSpec('数学', 10, ['加法'])
+            system = FakeSystem(db)
+            # 从新的序号开始生成，避免与第一次的题目重复
+            system.calls = 1000
+            report = _factory(system).run(spec)
+            assert report['existing'] == 6 and report['inserted'] == 4
+            assert _count(db, spec) == 10
@@ -0,0 +1,109 @@
+"""
+测试LLM调用限流与重试模块
+使用可控时钟和模拟LLM，验证令牌桶的等待时间、临时错误的重试以及失败请求的Token归还
+"""
+import asyncio
+from rate_limiter import TokenBucket, ProviderRateLimiter, RateLimitedLLM, estimate_tokens
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class FakeResponse:
+    def __init__(self, content: str, total_tokens: int = None):
+        self.content = content
+        self.usage_metadata = {'total_tokens': total_tokens} if total_tokens else None
+
+class RateLimitError(Exception):
+    """按类名识别为临时错误"""
+
+class FakeLLM:
+    """前 failures 次调用抛出指定异常，之后正常返回"""
+
+    def __init__(self, failures: int = 0, error: type = RateLimitError, total_tokens: int = None):
+        self.failures = failures
+        self.error = error
+        self.total_tokens = total_tokens
+        self.calls = 0
+
+    def _call(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error(f"第{self.calls}次调用失败")
+        return FakeResponse("8", self.total_tokens)
+
+    def invoke(self, messages, *args, **kwargs):
+        return self._call()
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        return self._call()
+
+    def stream(self, messages, *args, **kwargs):
+        yield self._call()
+
+def _limited(llm: FakeLLM, rpm: float = 60, tpm: float = 10000):
+    limiter = ProviderRateLimiter(rpm, tpm, clock=FakeClock())
+    return RateLimitedLLM(llm, limiter, max_retries=3, base_delay=0), limiter
+
+def test_token_bucket_reservation():
+    """令牌不足时按补充速度计算等待时间，等待期间到达的请求依次排队"""
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock=clock)
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) == 1.0
+    assert bucket.reserve(1) == 2.0
+    clock.now = 2.0
+    assert bucket.reserve(1) == 1.0
+    # 单次请求超过容量时按容量计算
+    clock.now = 1000.0
+    assert bucket.reserve(1000) == 0.0
+    bucket.refund(30)
+    assert bucket.reserve(30) == 0.0
+
+def test_retry_reserves_once_per_success():
+    """临时错误重试后成功，Token桶只按实际用量扣除一次"""
+    llm = FakeLLM(failures=2, total_tokens=100)
+    limited, limiter = _limited(llm)
+    assert limited.invoke("3 + 5 = ?").content == "8"
+    assert llm.calls == 3
+    assert limiter.stats()['retries'] == 2
+    assert limiter.tokens._tokens == 10000 - 100
+    # 请求数配额按实际发出的请求计算
+    assert limiter.requests._tokens == 60 - 3
+
+    llm = FakeLLM(failures=1, total_tokens=100)
+    limited, limiter = _limited(llm)
+    assert asyncio.run(limited.ainvoke("3 + 5 = ?")).content == "8"
+    assert limiter.tokens._tokens == 10000 - 100
+
+def test_failed_request_refunds_tokens():
+    """不可重试的错误和重试耗尽时归还预约的Token"""
+    llm = FakeLLM(failures=1, error=ValueError)
+    limited, limiter = _limited(llm)
+    try:
+        limited.invoke("3 + 5 = ?")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("参数错误不应重试")
+    assert llm.calls == 1 and limiter.stats()['retries'] == 0
+    assert limiter.tokens._tokens == 10000
+
+    llm = FakeLLM(failures=10)
+    limited, limiter = _limited(llm)
+    try:
+        list(limited.stream("3 + 5 = ?"))
+    except RateLimitError:
+        pass
+    else:
+        raise AssertionError("重试耗尽后应抛出异常")
+    assert llm.calls == 4 and limiter.stats()['retries'] == 3
+    assert limiter.tokens._tokens == 10000
+
+def test_estimate_tokens():
+    """中文按字计算，其他字符约4个字符1个Token"""
+    assert estimate_tokens("小明有5个苹果", expected_output_tokens=0) == 6
+    assert estimate_tokens(["abcdefgh"], expected_output_tokens=10) == 12
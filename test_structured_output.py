@@ -0,0 +1,87 @@
+"""
+测试结构化输出模块
+使用模拟LLM验证流式评分结果的 schema 校验、校验失败时的重新请求以及统计计数
+"""
+import json
+from structured_output import GradingResult, StructuredOutputLLM, StructuredOutputStats
+
+class FakeResponse:
+    def __init__(self, content: str):
+        self.content = content
+        self.usage_metadata = None
+
+class FakeLLM:
+    """stream 按若干片段返回预设的流式回复，invoke 按顺序返回预设的回复"""
+
+    def __init__(self, stream_reply: str = '', replies=()):
+        self.stream_reply = stream_reply
+        self.replies = list(replies)
+        self.stream_calls = 0
+        self.invoke_calls = 0
+
+    def stream(self, messages, *args, **kwargs):
+        self.stream_calls += 1
+        for start in range(0, len(self.stream_reply), 7):
+            yield FakeResponse(self.stream_reply[start:start + 7])
+
+    def invoke(self, messages, *args, **kwargs):
+        self.invoke_calls += 1
+        return FakeResponse(self.replies.pop(0))
+
+class FakeJsonModeLLM(FakeLLM):
+    """支持 with_structured_output 的模拟LLM，结构化请求返回 include_raw 格式的结果"""
+
+    def with_structured_output(self, schema, method=None, include_raw=False):
+        llm = self
+
+        class Structured:
+            def invoke(self, messages, *args, **kwargs):
+                llm.invoke_calls += 1
+                return {'raw': FakeResponse(''), 'parsed': schema(**llm.replies.pop(0)),
+                        'parsing_error': None}
+        return Structured()
+
+def _grading(score) -> str:
+    return json.dumps({'score': score, 'analysis': f'得分{score}', 'weak_points': [],
+                       'suggestions': '', 'correct_answer': '8个'}, ensure_ascii=False)
+
+def _stream_fields(llm, **kwargs):
+    stats = StructuredOutputStats()
+    wrapped = StructuredOutputLLM(llm, 'fake', GradingResult, kwargs.pop('method', None),
+                                  stats, **kwargs)
+    fields = []
+    response = wrapped.stream_fields([], lambda key, value: fields.append((key, value)))
+    return response, fields, stats.snapshot()['fake']
+
+def test_valid_stream_fires_fields():
+    """有效的流式结果逐个回调字段，校验通过后直接返回，不重新请求"""
+    llm = FakeLLM(_grading(8))
+    response, fields, stats = _stream_fields(llm)
+    assert response.parsed['score'] == 8 and json.loads(response.content)['score'] == 8
+    assert fields[0] == ('score', 8)
+    assert (llm.stream_calls, llm.invoke_calls) == (1, 0)
+    assert stats['requests'] == 1 and stats['re_requests'] == 0 and stats['parse_failures'] == 0
+
+def test_invalid_stream_is_re_requested():
+    """流式结果不符合 schema（分数越界）时计为解析失败，并重新请求一次"""
+    llm = FakeLLM(_grading(15), [_grading(9)])
+    response, fields, stats = _stream_fields(llm)
+    assert response.parsed['score'] == 9
+    assert ('score', 15) in fields
+    assert (llm.stream_calls, llm.invoke_calls) == (1, 1)
+    assert stats['requests'] == 2 and stats['parse_failures'] == 1 and stats['re_requests'] == 1
+
+    # 不允许重新请求时返回原始文本，parsed 为None
+    llm = FakeLLM('无法评分')
+    response, fields, stats = _stream_fields(llm, max_re_requests=0)
+    assert response.parsed is None and response.content == '无法评分'
+    assert fields == [] and llm.invoke_calls == 0
+    assert stats['parse_failures'] == 1 and stats['re_requests'] == 0
+
+def test_re_request_uses_structured_output():
+    """支持结构化输出的模型流式结果无法解析时，重新请求使用结构化输出"""
+    llm = FakeJsonModeLLM('{"score": 8, "analysis": ', [json.loads(_grading(7))])
+    response, fields, stats = _stream_fields(llm, method='json_mode')
+    assert response.parsed['score'] == 7
+    assert fields == [('score', 8)]
+    assert stats['structured'] == 1 and stats['re_requests'] == 1